@@ -0,0 +1,135 @@
+"""WAV decoding/encoding helpers shared by the audio processing code."""
+import struct
+from typing import NamedTuple, Optional, Tuple
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+class WavInfo(NamedTuple):
+    channels: int
+    sample_rate: int
+    bits: int
+    is_float: bool
+    data_offset: int
+    data_size: int
+
+    @property
+    def frame_size(self) -> int:
+        return self.channels * self.bits // 8
+
+    @property
+    def frames(self) -> int:
+        return self.data_size // self.frame_size
+
+
+def is_wav(data: bytes) -> bool:
+    return data[:4] == b"RIFF" and data[8:12] == b"WAVE"
+
+
+def parse_wav_header(data: bytes, total_size: Optional[int] = None) -> WavInfo:
+    """Locate the fmt and data chunks of a RIFF/WAVE file.
+
+    ``data`` may be just a prefix of the file as long as it covers the data
+    chunk header; ``total_size`` is then the size of the whole file.
+    """
+    if total_size is None:
+        total_size = len(data)
+    if not is_wav(data):
+        raise ValueError("Not a RIFF/WAVE file")
+    fmt = None
+    offset = 12
+    while offset + 8 <= len(data):
+        chunk_id = data[offset:offset + 4]
+        chunk_size = struct.unpack_from("<I", data, offset + 4)[0]
+        body = offset + 8
+        if chunk_id == b"fmt ":
+            format_tag, channels, sample_rate = struct.unpack_from("<HHI", data, body)
+            bits = struct.unpack_from("<H", data, body + 14)[0]
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and chunk_size >= 26:
+                format_tag = struct.unpack_from("<H", data, body + 24)[0]
+            fmt = (format_tag, channels, sample_rate, bits)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk precedes fmt chunk")
+            format_tag, channels, sample_rate, bits = fmt
+            if format_tag == WAVE_FORMAT_PCM and bits in (8, 16, 24, 32):
+                is_float = False
+            elif format_tag == WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+                is_float = True
+            else:
+                raise ValueError(f"Unsupported WAV encoding (format {format_tag}, {bits} bit)")
+            # Streamed recorders often leave the size at 0 or 0xFFFFFFFF
+            available = total_size - body
+            if chunk_size == 0 or chunk_size > available:
+                chunk_size = available
+            frame_size = channels * bits // 8
+            chunk_size -= chunk_size % frame_size
+            return WavInfo(channels, sample_rate, bits, is_float, body, chunk_size)
+        offset = body + chunk_size + (chunk_size & 1)
+    raise ValueError("WAV file has no data chunk")
+
+
+def pcm_to_float(raw: bytes, info: WavInfo) -> np.ndarray:
+    """Convert interleaved PCM bytes to a float32 (frames, channels) array"""
+    usable = len(raw) - len(raw) % info.frame_size
+    raw = raw[:usable]
+    if info.is_float:
+        dtype = "<f4" if info.bits == 32 else "<f8"
+        samples = np.frombuffer(raw, dtype=dtype).astype(np.float32)
+    elif info.bits == 8:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif info.bits == 16:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768.0
+    elif info.bits == 24:
+        bytes3 = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        ints = bytes3[:, 0] | (bytes3[:, 1] << 8) | (bytes3[:, 2] << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+        samples = ints.astype(np.float32) / float(1 << 23)
+    else:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / float(1 << 31)
+    return samples.reshape(-1, info.channels)
+
+
+def float_to_pcm(samples: np.ndarray, bits: int = 16) -> bytes:
+    """Convert a float (frames, channels) array to interleaved PCM bytes"""
+    clipped = np.clip(samples, -1.0, 1.0)
+    if bits == 16:
+        return (clipped * 32767.0).round().astype("<i2").tobytes()
+    if bits == 24:
+        ints = (clipped * 8388607.0).round().astype("<i4")
+        return ints.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+    if bits == 32:
+        return (clipped * 2147483647.0).round().astype("<i4").tobytes()
+    raise ValueError(f"Unsupported PCM bit depth: {bits}")
+
+
+def wav_header(frames: int, channels: int, sample_rate: int, bits: int = 16, is_float: bool = False) -> bytes:
+    """Build a canonical 44-byte PCM (or IEEE float) WAV header"""
+    block_align = channels * bits // 8
+    data_size = frames * block_align
+    format_tag = WAVE_FORMAT_IEEE_FLOAT if is_float else WAVE_FORMAT_PCM
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, format_tag, channels, sample_rate,
+        sample_rate * block_align, block_align, bits,
+        b"data", data_size,
+    )
+
+
+def decode_wav(data: bytes) -> Tuple[np.ndarray, int]:
+    """Decode a WAV file into float32 samples and its sample rate"""
+    info = parse_wav_header(data)
+    raw = data[info.data_offset:info.data_offset + info.data_size]
+    return pcm_to_float(raw, info), info.sample_rate
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int, bits: int = 16) -> bytes:
+    """Encode float samples as a PCM WAV file"""
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    return wav_header(len(samples), samples.shape[1], sample_rate, bits) + float_to_pcm(samples, bits)
@@ -0,0 +1,147 @@
+"""Content-addressed chunk store for track audio.
+
+Audio bytes are split into fixed-size chunks keyed by their SHA-256 and kept
+in the ``audio_chunks`` collection. Each stored blob gets a manifest in
+``audio_blobs`` listing its chunk hashes, so identical audio (or identical
+chunks) is only stored once and any byte range can be read by fetching just
+the chunks that overlap it.
+"""
+import hashlib
+from typing import AsyncIterator, List, Optional
+
+from pymongo import UpdateOne
+
+CHUNK_SIZE = 256 * 1024
+# Number of chunks fetched per query when streaming a range
+FETCH_BATCH = 8
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class AudioStore:
+    def __init__(self, db, chunk_size: int = CHUNK_SIZE):
+        self.blobs = db.audio_blobs
+        self.chunks = db.audio_chunks
+        self.chunk_size = chunk_size
+
+    async def put(self, data: bytes) -> str:
+        """Store raw bytes and return their content reference"""
+        ref = content_hash(data)
+        if await self.blobs.find_one({"_id": ref}, {"_id": 1}):
+            return ref
+
+        chunk_ids: List[str] = []
+        ops = []
+        for offset in range(0, len(data), self.chunk_size):
+            chunk = data[offset:offset + self.chunk_size]
+            chunk_id = content_hash(chunk)
+            chunk_ids.append(chunk_id)
+            ops.append(UpdateOne(
+                {"_id": chunk_id},
+                {"$setOnInsert": {"data": chunk, "size": len(chunk)}},
+                upsert=True,
+            ))
+        if ops:
+            await self.chunks.bulk_write(ops, ordered=False)
+
+        # The manifest is written last so a visible blob always has its chunks
+        await self.blobs.update_one(
+            {"_id": ref},
+            {"$setOnInsert": {
+                "size": len(data),
+                "chunk_size": self.chunk_size,
+                "chunks": chunk_ids,
+            }},
+            upsert=True,
+        )
+        return ref
+
+    async def put_stream(self, parts: AsyncIterator[bytes]) -> str:
+        """Store bytes arriving in pieces without holding them all in memory; returns their reference"""
+        digest = hashlib.sha256()
+        chunk_ids: List[str] = []
+        ops = []
+        pending = b""
+        size = 0
+
+        async def flush(final: bool):
+            nonlocal ops
+            if ops and (final or len(ops) >= FETCH_BATCH):
+                await self.chunks.bulk_write(ops, ordered=False)
+                ops = []
+
+        async for part in parts:
+            digest.update(part)
+            size += len(part)
+            pending += part
+            while len(pending) >= self.chunk_size:
+                chunk, pending = pending[:self.chunk_size], pending[self.chunk_size:]
+                chunk_ids.append(content_hash(chunk))
+                ops.append(UpdateOne(
+                    {"_id": chunk_ids[-1]},
+                    {"$setOnInsert": {"data": chunk, "size": len(chunk)}},
+                    upsert=True,
+                ))
+                await flush(False)
+        if pending:
+            chunk_ids.append(content_hash(pending))
+            ops.append(UpdateOne(
+                {"_id": chunk_ids[-1]},
+                {"$setOnInsert": {"data": pending, "size": len(pending)}},
+                upsert=True,
+            ))
+        await flush(True)
+
+        ref = digest.hexdigest()
+        await self.blobs.update_one(
+            {"_id": ref},
+            {"$setOnInsert": {
+                "size": size,
+                "chunk_size": self.chunk_size,
+                "chunks": chunk_ids,
+            }},
+            upsert=True,
+        )
+        return ref
+
+    async def exists(self, ref: str) -> bool:
+        return await self.blobs.find_one({"_id": ref}, {"_id": 1}) is not None
+
+    async def size(self, ref: str) -> Optional[int]:
+        """Return the blob size in bytes, or None if it is not stored"""
+        blob = await self.blobs.find_one({"_id": ref}, {"size": 1})
+        return blob["size"] if blob else None
+
+    async def iter_range(self, ref: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Yield the bytes of ``ref`` in ``[start, end)`` chunk by chunk"""
+        blob = await self.blobs.find_one({"_id": ref})
+        if not blob:
+            raise KeyError(ref)
+        size = blob["size"]
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return
+
+        chunk_size = blob["chunk_size"]
+        first = start // chunk_size
+        last = (end - 1) // chunk_size
+        chunk_ids = blob["chunks"][first:last + 1]
+
+        for batch_start in range(0, len(chunk_ids), FETCH_BATCH):
+            batch = chunk_ids[batch_start:batch_start + FETCH_BATCH]
+            docs = await self.chunks.find({"_id": {"$in": list(set(batch))}}).to_list(len(batch))
+            by_id = {doc["_id"]: bytes(doc["data"]) for doc in docs}
+            for i, chunk_id in enumerate(batch):
+                index = first + batch_start + i
+                chunk = by_id[chunk_id]
+                chunk_start = index * chunk_size
+                lo = max(start - chunk_start, 0)
+                hi = min(end - chunk_start, len(chunk))
+                yield chunk[lo:hi]
+
+    async def read(self, ref: str, start: int = 0, end: Optional[int] = None) -> bytes:
+        """Read ``[start, end)`` of a blob into memory"""
+        parts = [part async for part in self.iter_range(ref, start, end)]
+        return b"".join(parts)
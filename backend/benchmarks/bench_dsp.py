@@ -0,0 +1,59 @@
+"""Throughput benchmark for the effects engine.
+
+Run from the backend directory:
+
+    python -m benchmarks.bench_dsp --seconds 60
+
+Reports frames/sec and the real-time factor for every effect type using the
+frontend's default parameter values, plus the full chain.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from dsp import DEFAULT_BLOCK_SIZE, EFFECTS, process_signal
+
+
+def default_effect(effect_type: str) -> dict:
+    return {"type": effect_type, "enabled": True, "parameters": dict(EFFECTS[effect_type].PARAMETERS)}
+
+
+def bench(samples, sample_rate, effects, block_size, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        process_signal(samples, sample_rate, effects, block_size)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=30.0, help="length of the test signal")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--channels", type=int, default=2)
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument("--repeat", type=int, default=3, help="runs per effect, best is reported")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = int(args.seconds * args.sample_rate)
+    samples = (rng.standard_normal((frames, args.channels)) * 0.1).astype(np.float32)
+
+    cases = [(name, [default_effect(name)]) for name in EFFECTS]
+    cases.append(("chain", [default_effect(name) for name in EFFECTS]))
+    # EQ defaults are flat (a no-op), so benchmark it with every band active
+    cases[0][1][0]["parameters"] = {"Low": 3.0, "Mid": -2.0, "High": 4.0}
+    cases[-1][1][0]["parameters"] = {"Low": 3.0, "Mid": -2.0, "High": 4.0}
+
+    print(f"{frames} frames x {args.channels} ch @ {args.sample_rate} Hz, block {args.block_size}")
+    print(f"{'effect':<12} {'seconds':>9} {'samples/s':>14} {'x realtime':>11}")
+    for name, effects in cases:
+        elapsed = bench(samples, args.sample_rate, effects, args.block_size, args.repeat)
+        rate = frames * args.channels / elapsed
+        print(f"{name:<12} {elapsed:>9.3f} {rate:>14,.0f} {args.seconds / elapsed:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""Offline load test for the project API.
+
+Run from the backend directory:
+
+    python -m benchmarks.load_test --projects 50 --tracks 4 --requests 2000
+
+Drives the FastAPI app in-process over httpx's ASGI transport with an
+in-memory MongoDB (mongomock-motor), so no server or database is needed.
+Synthetic projects are seeded first, then a weighted mix of create, list,
+get, update-track and delete requests runs with the requested concurrency.
+Latency percentiles, throughput and response sizes are reported per
+endpoint. ``--save-baseline`` records the results; later runs compare
+against the baseline and exit non-zero when an endpoint regresses.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "daw_load_test")
+os.environ.setdefault("RENDER_CACHE_DIR", tempfile.mkdtemp(prefix="daw-load-test-"))
+
+import server  # noqa: E402
+from audio_io import encode_wav  # noqa: E402
+from audio_store import AudioStore  # noqa: E402
+from history import ProjectHistory  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+from storage import ProjectStore  # noqa: E402
+
+DEFAULT_BASELINE = Path(__file__).parent / "load_baseline.json"
+
+# Relative share of each operation in the measured workload
+WORKLOAD = {
+    "list_projects": 20,
+    "get_project": 40,
+    "update_track": 30,
+    "create_project": 5,
+    "delete_project": 5,
+}
+
+
+def use_memory_database():
+    """Point the app's storage at a fresh in-memory MongoDB"""
+    mock = AsyncMongoMockClient()
+    server.client = mock
+    server.db = mock[os.environ["DB_NAME"]]
+    server.audio_store = AudioStore(server.db)
+    server.project_store = ProjectStore(server.db)
+    server.project_history = ProjectHistory(server.db, server.audio_store)
+    server.live_sessions.projects = server.project_store
+
+
+def synthetic_wav(seconds: float, sample_rate: int, seed: int) -> str:
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tone = 0.3 * np.sin(2 * np.pi * rng.uniform(80, 1000) * t) + 0.05 * rng.standard_normal(len(t))
+    wav = encode_wav(np.repeat(tone[:, None], 2, axis=1).astype(np.float32), sample_rate)
+    return "data:audio/wav;base64," + base64.b64encode(wav).decode("ascii")
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = {}
+        self.sizes = {}
+        self.errors = {}
+        self.spans = {}
+
+    async def call(self, client: httpx.AsyncClient, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        end = time.perf_counter()
+        self.latencies.setdefault(name, []).append(end - start)
+        self.sizes.setdefault(name, []).append(len(response.content))
+        first, _ = self.spans.get(name, (start, end))
+        self.spans[name] = (first, end)
+        # 4xx can happen legitimately when a request races a delete
+        if response.status_code >= 500:
+            self.errors[name] = self.errors.get(name, 0) + 1
+        return response
+
+    def summary(self) -> dict:
+        results = {}
+        for name, latencies in sorted(self.latencies.items()):
+            ms = np.asarray(latencies) * 1000
+            first, last = self.spans[name]
+            results[name] = {
+                "count": len(ms),
+                "errors": self.errors.get(name, 0),
+                "p50_ms": round(float(np.percentile(ms, 50)), 3),
+                "p95_ms": round(float(np.percentile(ms, 95)), 3),
+                "p99_ms": round(float(np.percentile(ms, 99)), 3),
+                "throughput_rps": round(len(ms) / max(last - first, 1e-9), 1),
+                "mean_response_bytes": round(float(np.mean(self.sizes[name])), 1),
+            }
+        return results
+
+
+async def seed(client, recorder, args, wavs):
+    projects = {}
+    for i in range(args.projects):
+        response = await recorder.call(client, "create_project", "POST", "/api/projects", json={"name": f"Load {i}"})
+        project_id = response.json()["id"]
+        projects[project_id] = []
+        for j in range(args.tracks):
+            track = await recorder.call(
+                client, "add_track", "POST", f"/api/projects/{project_id}/tracks",
+                json={"name": f"Track {j}", "audio_data": wavs[j % len(wavs)], "duration": args.audio_seconds},
+            )
+            projects[project_id].append(track.json()["id"])
+    return projects
+
+
+async def run_workload(client, recorder, args, projects):
+    rng = random.Random(args.seed)
+    names = list(WORKLOAD)
+    operations = rng.choices(names, weights=[WORKLOAD[n] for n in names], k=args.requests)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run(operation):
+        async with semaphore:
+            project_id = rng.choice(list(projects)) if projects else None
+            if operation == "create_project" or project_id is None:
+                response = await recorder.call(client, "create_project", "POST", "/api/projects",
+                                               json={"name": "Load extra"})
+                projects[response.json()["id"]] = []
+            elif operation == "list_projects":
+                await recorder.call(client, operation, "GET", "/api/projects", params={"limit": 50})
+            elif operation == "get_project":
+                await recorder.call(client, operation, "GET", f"/api/projects/{project_id}")
+            elif operation == "update_track":
+                if projects[project_id]:
+                    track_id = rng.choice(projects[project_id])
+                    await recorder.call(client, operation, "PUT", f"/api/projects/{project_id}/tracks/{track_id}",
+                                        json={"volume": round(rng.random(), 3), "pan": round(rng.uniform(-1, 1), 3)})
+            elif operation == "delete_project":
+                projects.pop(project_id, None)
+                await recorder.call(client, operation, "DELETE", f"/api/projects/{project_id}")
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(op) for op in operations))
+    return time.perf_counter() - start
+
+
+def compare(results: dict, baseline: dict, tolerance: float, slack_ms: float) -> list:
+    """Endpoints whose p95 latency or response size grew beyond the tolerance"""
+    failures = []
+    for name, base in baseline.items():
+        current = results.get(name)
+        if current is None:
+            continue
+        limit = base["p95_ms"] * (1 + tolerance) + slack_ms
+        if current["p95_ms"] > limit:
+            failures.append(f"{name}: p95 {current['p95_ms']:.2f} ms > {limit:.2f} ms")
+        size_limit = base["mean_response_bytes"] * (1 + tolerance)
+        if current["mean_response_bytes"] > size_limit:
+            failures.append(f"{name}: mean response {current['mean_response_bytes']:.0f} B > {size_limit:.0f} B")
+        if current["errors"] > base["errors"]:
+            failures.append(f"{name}: {current['errors']} errors, baseline had {base['errors']}")
+    return failures
+
+
+async def main_async(args):
+    use_memory_database()
+    await server.project_store.ensure_indexes()
+    wavs = [synthetic_wav(args.audio_seconds, args.sample_rate, seed) for seed in range(min(args.tracks, 8) or 1)]
+    recorder = Recorder()
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://load-test") as client:
+        projects = await seed(client, recorder, args, wavs)
+        wall = await run_workload(client, recorder, args, projects)
+    return recorder.summary(), wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", type=int, default=50, help="projects seeded before the run")
+    parser.add_argument("--tracks", type=int, default=4, help="tracks per seeded project")
+    parser.add_argument("--audio-seconds", type=float, default=2.0, help="length of each synthetic track")
+    parser.add_argument("--sample-rate", type=int, default=44100)
+    parser.add_argument("--requests", type=int, default=2000, help="requests in the measured workload")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="allowed relative regression")
+    parser.add_argument("--slack-ms", type=float, default=1.0, help="absolute latency slack for fast endpoints")
+    parser.add_argument("--json", type=Path, help="also write the results to this file")
+    args = parser.parse_args()
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    results, wall = asyncio.run(main_async(args))
+    total = sum(r["count"] for r in results.values())
+    print(f"{args.projects} projects x {args.tracks} tracks of {args.audio_seconds:g}s, "
+          f"{args.requests} requests at concurrency {args.concurrency}: {wall:.2f}s")
+    print(f"{'endpoint':<16} {'count':>6} {'err':>4} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'bytes':>10}")
+    for name, r in results.items():
+        print(f"{name:<16} {r['count']:>6} {r['errors']:>4} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['p99_ms']:>8.2f} {r['throughput_rps']:>8.1f} {r['mean_response_bytes']:>10.0f}")
+    print(f"{'total':<16} {total:>6}")
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Baseline written to {args.baseline}")
+        return
+    if args.baseline.exists():
+        failures = compare(results, json.loads(args.baseline.read_text()), args.tolerance, args.slack_ms)
+        if failures:
+            print("Regressions against baseline:")
+            for failure in failures:
+                print(f"  {failure}")
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
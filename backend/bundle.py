@@ -0,0 +1,189 @@
+"""Project bundles: a project and its audio as one streamable tar archive.
+
+A bundle starts with ``project.json``, a manifest holding the project
+document and the size of every blob it references, followed by one
+``audio/<ref>`` entry per blob with its bytes exactly as the chunk store
+keeps them (track audio, lossless-codec audio, peaks and pitch tracks). The
+archive is uncompressed, since stored audio already is, so its size is known
+up front and it is written and read strictly front to back: neither side
+ever holds more than one entry's chunk in memory, and on import a blob whose
+reference is already stored is skipped rather than read.
+"""
+import json
+import tarfile
+import time
+from datetime import datetime
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, Tuple
+
+from audio_store import AudioStore
+
+FORMAT = "daw-project-bundle"
+VERSION = 1
+MANIFEST = "project.json"
+BLOB_PREFIX = "audio/"
+BLOCK = tarfile.BLOCKSIZE
+END = b"\0" * (2 * BLOCK)
+READ_SIZE = 64 * 1024
+MAX_MANIFEST_BYTES = 16 * 1024 * 1024
+
+# Track fields that reference blobs in the chunk store
+BLOB_FIELDS = ("audio_ref", "peaks_ref", "pitch_ref", "source_ref")
+
+
+class BundleError(ValueError):
+    pass
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def _header(name: str, size: int) -> bytes:
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    return info.tobuf(format=tarfile.USTAR_FORMAT)
+
+
+def _padding(size: int) -> bytes:
+    return b"\0" * (-size % BLOCK)
+
+
+def _entry_length(size: int) -> int:
+    return BLOCK + size + (-size % BLOCK)
+
+
+class BundleWriter:
+    """Streams a project's bundle from the chunk store"""
+
+    def __init__(self, project: dict, blobs: Dict[str, int], audio_store: AudioStore):
+        self.blobs = blobs
+        self.audio_store = audio_store
+        self.manifest = json.dumps(
+            {"format": FORMAT, "version": VERSION, "project": project, "blobs": blobs},
+            default=_json_default, separators=(",", ":"),
+        ).encode()
+
+    @classmethod
+    async def open(cls, project: dict, audio_store: AudioStore) -> "BundleWriter":
+        """Collect the project's blobs and their sizes, dropping references to missing ones"""
+        blobs: Dict[str, int] = {}
+        tracks = []
+        for track in project.get("tracks", []):
+            track = dict(track)
+            for field in BLOB_FIELDS:
+                ref = track.get(field)
+                if not ref or ref in blobs:
+                    continue
+                size = await audio_store.size(ref)
+                if size is None:
+                    track[field] = None
+                else:
+                    blobs[ref] = size
+            tracks.append(track)
+        return cls({**project, "tracks": tracks}, blobs, audio_store)
+
+    @property
+    def content_length(self) -> int:
+        return (_entry_length(len(self.manifest))
+                + sum(_entry_length(size) for size in self.blobs.values()) + len(END))
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        yield _header(MANIFEST, len(self.manifest)) + self.manifest + _padding(len(self.manifest))
+        for ref, size in self.blobs.items():
+            yield _header(BLOB_PREFIX + ref, size)
+            async for chunk in self.audio_store.iter_range(ref):
+                yield chunk
+            yield _padding(size)
+        yield END
+
+
+class BundleReader:
+    """Reads a bundle front to back from an async ``read(n)`` callable"""
+
+    def __init__(self, read: Callable[[int], Awaitable[bytes]]):
+        self._read = read
+
+    async def read_exactly(self, size: int) -> bytes:
+        data = b""
+        while len(data) < size:
+            part = await self._read(min(size - len(data), READ_SIZE))
+            if not part:
+                raise BundleError("Bundle is truncated")
+            data += part
+        return data
+
+    async def next_entry(self) -> Optional[Tuple[str, int]]:
+        """Name and size of the next file entry, or None at the end of the archive"""
+        while True:
+            block = await self._read(BLOCK)
+            if len(block) < BLOCK:
+                # Archives end with zero blocks, so running out of data first means a cut-off bundle
+                block += await self.read_exactly(BLOCK - len(block))
+            if not block.strip(b"\0"):
+                return None
+            try:
+                info = tarfile.TarInfo.frombuf(block, "utf-8", "strict")
+            except tarfile.TarError as e:
+                raise BundleError(f"Invalid bundle entry: {e}")
+            if info.isfile():
+                return info.name, info.size
+            await self.skip(info.size)
+
+    async def iter_body(self, size: int) -> AsyncIterator[bytes]:
+        """The current entry's bytes, consumed as they are yielded"""
+        remaining = size
+        while remaining:
+            part = await self._read(min(remaining, READ_SIZE))
+            if not part:
+                raise BundleError("Bundle is truncated")
+            remaining -= len(part)
+            yield part
+        await self.read_exactly(-size % BLOCK)
+
+    async def skip(self, size: int):
+        async for _ in self.iter_body(size):
+            pass
+
+    async def read_manifest(self) -> dict:
+        entry = await self.next_entry()
+        if entry is None or entry[0] != MANIFEST:
+            raise BundleError(f"Bundle must start with {MANIFEST}")
+        if entry[1] > MAX_MANIFEST_BYTES:
+            raise BundleError("Bundle manifest is too large")
+        data = await self.read_exactly(entry[1])
+        await self.read_exactly(-entry[1] % BLOCK)
+        try:
+            manifest = json.loads(data)
+        except ValueError:
+            raise BundleError("Bundle manifest is not valid JSON")
+        if (not isinstance(manifest, dict) or manifest.get("format") != FORMAT
+                or not isinstance(manifest.get("project"), dict)):
+            raise BundleError("Not a project bundle")
+        version = manifest.get("version", 0)
+        if not isinstance(version, int) or isinstance(version, bool) or version > VERSION:
+            raise BundleError(f"Unsupported bundle version {version!r}")
+        return manifest
+
+
+async def import_blobs(reader: BundleReader, audio_store: AudioStore) -> Dict[str, bool]:
+    """Store every blob entry after the manifest; maps each reference to whether it was new"""
+    stored: Dict[str, bool] = {}
+    while True:
+        entry = await reader.next_entry()
+        if entry is None:
+            return stored
+        name, size = entry
+        ref = name[len(BLOB_PREFIX):] if name.startswith(BLOB_PREFIX) else None
+        if not ref or ref in stored or await audio_store.exists(ref):
+            await reader.skip(size)
+            if ref:
+                stored.setdefault(ref, False)
+            continue
+        actual = await audio_store.put_stream(reader.iter_body(size))
+        if actual != ref:
+            raise BundleError(f"Blob {ref} does not match its content")
+        stored[ref] = True
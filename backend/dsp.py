@@ -0,0 +1,343 @@
+"""Block-based audio effects engine.
+
+Every effect is a stateful processor that takes float32 blocks shaped
+``(frames, channels)`` and returns a block of the same shape, so a signal can
+be processed in fixed-size blocks (or streamed) with identical results to
+processing it in one go. Recursive filters are evaluated with
+``one_pole`` which turns the per-sample recursion into small matrix
+products, keeping all work inside NumPy.
+
+Effect types and parameter names mirror ``frontend/app/effects.tsx``.
+"""
+import math
+from typing import Dict, List, Type
+
+import numpy as np
+
+from metrics import timed
+
+DEFAULT_BLOCK_SIZE = 4096
+
+# Chunk length used to evaluate first-order recursions as matrix products
+_CHUNK = 64
+# Longest span handled by a single two-level solve in one_pole
+_MAX_SPAN = _CHUNK * 256
+
+
+def one_pole(x: np.ndarray, a, state: np.ndarray):
+    """Evaluate ``y[n] = a * y[n - 1] + x[n]`` along axis 0.
+
+    ``x`` is ``(frames, channels)``, ``a`` a real or complex scalar with
+    ``|a| <= 1`` and ``state`` the previous output per channel. Returns the
+    output and the new state.
+    """
+    frames, channels = x.shape
+    dtype = np.result_type(x.dtype, np.asarray(a).dtype, state.dtype, np.float64)
+    if frames == 0:
+        return np.zeros((0, channels), dtype), state.astype(dtype)
+    if frames > _MAX_SPAN:
+        parts = []
+        for start in range(0, frames, _MAX_SPAN):
+            part, state = one_pole(x[start:start + _MAX_SPAN], a, state)
+            parts.append(part)
+        return np.concatenate(parts), state
+
+    chunks = -(-frames // _CHUNK)
+    padded = np.zeros((chunks * _CHUNK, channels), dtype)
+    padded[:frames] = x
+    padded = padded.reshape(chunks, _CHUNK, channels)
+
+    # Zero-state response of every chunk: lower-triangular Toeplitz of a^k
+    powers = np.asarray(a, dtype) ** np.arange(_CHUNK + 1)
+    lag = np.subtract.outer(np.arange(_CHUNK), np.arange(_CHUNK))
+    toeplitz = np.where(lag >= 0, powers[np.maximum(lag, 0)], 0)
+    local = np.matmul(toeplitz, padded)
+
+    # State entering chunk m obeys the same recursion with coefficient a^L
+    big_powers = powers[_CHUNK] ** np.arange(chunks + 1)
+    chunk_lag = np.subtract.outer(np.arange(chunks), np.arange(chunks)) - 1
+    carry = np.where(chunk_lag >= 0, big_powers[np.maximum(chunk_lag, 0)], 0)
+    starts = big_powers[:chunks, None] * state[None, :] + carry @ local[:, -1, :]
+
+    y = local + powers[1:, None][None] * starts[:, None, :]
+    y = y.reshape(-1, channels)[:frames]
+    return y, y[-1].copy()
+
+
+def db_to_gain(db):
+    return 10.0 ** (np.asarray(db) / 20.0)
+
+
+class Biquad:
+    """Stateful second-order IIR filter (RBJ cookbook designs)"""
+
+    def __init__(self, b, a, channels: int):
+        a0 = a[0]
+        self.b = np.array(b, dtype=np.float64) / a0
+        a1, a2 = a[1] / a0, a[2] / a0
+        # 1 / A(z) factors into two complex one-pole sections
+        disc = np.sqrt(complex(a1 * a1 - 4 * a2))
+        self.poles = ((-a1 + disc) / 2, (-a1 - disc) / 2)
+        self.states = [np.zeros(channels, complex), np.zeros(channels, complex)]
+        self.history = np.zeros((2, channels), complex)
+
+    @classmethod
+    def low_shelf(cls, freq, gain_db, sample_rate, channels, slope=1.0):
+        return cls(*_shelf(freq, gain_db, sample_rate, slope, low=True), channels)
+
+    @classmethod
+    def high_shelf(cls, freq, gain_db, sample_rate, channels, slope=1.0):
+        return cls(*_shelf(freq, gain_db, sample_rate, slope, low=False), channels)
+
+    @classmethod
+    def peaking(cls, freq, gain_db, q, sample_rate, channels):
+        amp = 10 ** (gain_db / 40)
+        w0 = 2 * np.pi * freq / sample_rate
+        alpha = np.sin(w0) / (2 * q)
+        cos_w0 = np.cos(w0)
+        b = (1 + alpha * amp, -2 * cos_w0, 1 - alpha * amp)
+        a = (1 + alpha / amp, -2 * cos_w0, 1 - alpha / amp)
+        return cls(b, a, channels)
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        w, self.states[0] = one_pole(x, self.poles[0], self.states[0])
+        w, self.states[1] = one_pole(w, self.poles[1], self.states[1])
+        padded = np.concatenate([self.history, w])
+        self.history = padded[-2:]
+        b0, b1, b2 = self.b
+        y = b0 * padded[2:] + b1 * padded[1:-1] + b2 * padded[:-2]
+        return y.real
+
+
+def _shelf(freq, gain_db, sample_rate, slope, low):
+    amp = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * freq / sample_rate
+    cos_w0 = np.cos(w0)
+    alpha = np.sin(w0) / 2 * np.sqrt((amp + 1 / amp) * (1 / slope - 1) + 2)
+    sqrt_term = 2 * np.sqrt(amp) * alpha
+    sign = 1 if low else -1
+    b = (
+        amp * ((amp + 1) - sign * (amp - 1) * cos_w0 + sqrt_term),
+        sign * 2 * amp * ((amp - 1) - sign * (amp + 1) * cos_w0),
+        amp * ((amp + 1) - sign * (amp - 1) * cos_w0 - sqrt_term),
+    )
+    a = (
+        (amp + 1) + sign * (amp - 1) * cos_w0 + sqrt_term,
+        -sign * 2 * ((amp - 1) + sign * (amp + 1) * cos_w0),
+        (amp + 1) + sign * (amp - 1) * cos_w0 - sqrt_term,
+    )
+    return b, a
+
+
+class DelayLine:
+    """Feedback delay ``d[n] = x[n] + feedback * lowpass(d[n - delay])``.
+
+    ``process`` returns the delayed signal ``d[n - delay]``. Blocks are split
+    into sub-blocks no longer than the delay so each one is fully vectorized.
+    """
+
+    def __init__(self, delay: int, feedback: float, channels: int, damping: float = 0.0):
+        self.delay = max(int(delay), 1)
+        self.feedback = feedback
+        self.damping = damping
+        self.buffer = np.zeros((self.delay, channels))
+        self.filter_state = np.zeros(channels)
+
+    def process(self, x: np.ndarray) -> np.ndarray:
+        out = np.empty_like(x, dtype=np.float64)
+        for start in range(0, len(x), self.delay):
+            part = x[start:start + self.delay]
+            n = len(part)
+            delayed = self.buffer[:n]
+            fed_back = delayed
+            if self.damping:
+                fed_back, self.filter_state = one_pole(delayed * (1 - self.damping), self.damping, self.filter_state)
+            written = part + self.feedback * fed_back
+            out[start:start + n] = delayed
+            self.buffer = np.concatenate([self.buffer[n:], written])
+        return out
+
+
+class Effect:
+    """Base class for block processors built from a frontend effect dict"""
+
+    PARAMETERS: Dict[str, float] = {}
+
+    def __init__(self, params: Dict[str, float], sample_rate: int, channels: int):
+        self.params = {**self.PARAMETERS, **{k: float(v) for k, v in params.items() if k in self.PARAMETERS}}
+        self.sample_rate = sample_rate
+        self.channels = channels
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class EQ(Effect):
+    PARAMETERS = {"Low": 0.0, "Mid": 0.0, "High": 0.0}
+
+    def __init__(self, params, sample_rate, channels):
+        super().__init__(params, sample_rate, channels)
+        self.bands = []
+        if self.params["Low"]:
+            self.bands.append(Biquad.low_shelf(200.0, self.params["Low"], sample_rate, channels))
+        if self.params["Mid"]:
+            self.bands.append(Biquad.peaking(1000.0, self.params["Mid"], 0.7, sample_rate, channels))
+        if self.params["High"]:
+            self.bands.append(Biquad.high_shelf(min(5000.0, sample_rate * 0.45), self.params["High"], sample_rate, channels))
+
+    def process(self, block):
+        for band in self.bands:
+            block = band.process(block)
+        return block
+
+
+class Compressor(Effect):
+    PARAMETERS = {"Threshold": -10.0, "Ratio": 4.0, "Attack": 10.0}
+
+    def __init__(self, params, sample_rate, channels):
+        super().__init__(params, sample_rate, channels)
+        attack_s = max(self.params["Attack"], 0.01) / 1000.0
+        self.coeff = float(np.exp(-1.0 / (attack_s * sample_rate)))
+        self.slope = 1.0 - 1.0 / max(self.params["Ratio"], 1.0)
+        self.envelope = np.zeros(1)
+
+    def process(self, block):
+        # Stereo-linked peak detector smoothed with the attack time constant
+        level = np.abs(block).max(axis=1, keepdims=True)
+        envelope, self.envelope = one_pole((1 - self.coeff) * level, self.coeff, self.envelope)
+        level_db = 20 * np.log10(np.maximum(envelope, 1e-9))
+        reduction_db = np.minimum(0.0, (self.params["Threshold"] - level_db) * self.slope)
+        return block * db_to_gain(reduction_db)
+
+
+class Reverb(Effect):
+    """Freeverb-style reverb: parallel damped combs into series allpasses"""
+
+    PARAMETERS = {"Room Size": 0.5, "Damping": 0.3, "Mix": 0.25}
+    COMB_TUNING = (1116, 1188, 1277, 1356, 1422, 1491, 1557, 1617)
+    ALLPASS_TUNING = (556, 441, 341, 225)
+    STEREO_SPREAD = 23
+
+    def __init__(self, params, sample_rate, channels):
+        super().__init__(params, sample_rate, channels)
+        scale = sample_rate / 44100.0
+        feedback = 0.7 + 0.28 * self.params["Room Size"]
+        damping = 0.4 * self.params["Damping"]
+        self.lines = []
+        for channel in range(channels):
+            spread = self.STEREO_SPREAD * channel
+            combs = [DelayLine(round((d + spread) * scale), feedback, 1, damping) for d in self.COMB_TUNING]
+            allpasses = [DelayLine(round((d + spread) * scale), 0.5, 1) for d in self.ALLPASS_TUNING]
+            self.lines.append((combs, allpasses))
+
+    def process(self, block):
+        mix = self.params["Mix"]
+        # Freeverb's fixed input gain keeps the comb bank from clipping
+        mono = block.mean(axis=1, keepdims=True) * 0.015
+        wet = np.empty_like(block, dtype=np.float64)
+        for channel, (combs, allpasses) in enumerate(self.lines):
+            signal = sum(comb.process(mono) for comb in combs)
+            for allpass in allpasses:
+                signal = allpass.process(signal) - signal
+            wet[:, channel] = signal[:, 0]
+        return block * (1 - mix) + wet * mix * 3.0
+
+
+class Delay(Effect):
+    PARAMETERS = {"Time": 250.0, "Feedback": 35.0, "Mix": 20.0}
+
+    def __init__(self, params, sample_rate, channels):
+        super().__init__(params, sample_rate, channels)
+        samples = round(self.params["Time"] / 1000.0 * sample_rate)
+        feedback = min(max(self.params["Feedback"], 0.0), 95.0) / 100.0
+        self.line = DelayLine(samples, feedback, channels)
+
+    def process(self, block):
+        mix = self.params["Mix"] / 100.0
+        return block * (1 - mix) + self.line.process(block) * mix
+
+
+class Distortion(Effect):
+    PARAMETERS = {"Drive": 30.0, "Tone": 50.0}
+
+    def __init__(self, params, sample_rate, channels):
+        super().__init__(params, sample_rate, channels)
+        self.gain = 1.0 + self.params["Drive"] / 100.0 * 30.0
+        cutoff = min(1000.0 * 20.0 ** (self.params["Tone"] / 100.0), sample_rate * 0.45)
+        self.coeff = float(np.exp(-2 * np.pi * cutoff / sample_rate))
+        self.state = np.zeros(channels)
+
+    def process(self, block):
+        shaped = np.tanh(self.gain * block) / np.tanh(self.gain)
+        toned, self.state = one_pole((1 - self.coeff) * shaped, self.coeff, self.state)
+        return toned
+
+
+EFFECTS: Dict[str, Type[Effect]] = {
+    "EQ": EQ,
+    "Compressor": Compressor,
+    "Reverb": Reverb,
+    "Delay": Delay,
+    "Distortion": Distortion,
+}
+
+# Effects that need the whole signal, applied ahead of the block chain (see pitch.py)
+SIGNAL_EFFECTS = ("Auto-Tune",)
+
+
+def effect_params(effect: dict) -> Dict[str, float]:
+    """Normalize an effect's parameters to a ``{name: value}`` dict.
+
+    Accepts both the frontend's ``[{"name": ..., "value": ...}]`` list and a
+    plain mapping.
+    """
+    params = effect.get("parameters") or {}
+    if isinstance(params, dict):
+        return {name: float(value) for name, value in params.items()}
+    return {p["name"]: float(p["value"]) for p in params if "name" in p and "value" in p}
+
+
+def check_effects(effects: List[dict]) -> List[dict]:
+    """Raise ValueError unless every active effect's parameters are finite numbers"""
+    for effect in active_effects(effects):
+        try:
+            params = effect_params(effect)
+        except (TypeError, ValueError, KeyError):
+            raise ValueError(f"{effect['type']} parameters must be numbers")
+        if not all(math.isfinite(value) for value in params.values()):
+            raise ValueError(f"{effect['type']} parameters must be finite")
+    return effects
+
+
+def active_effects(effects: List[dict]) -> List[dict]:
+    """Effects that are enabled and have a backend implementation, in order"""
+    return [e for e in effects if e.get("enabled", True) and (e.get("type") in EFFECTS or e.get("type") in SIGNAL_EFFECTS)]
+
+
+class EffectChain:
+    """Ordered chain of effects applied block by block"""
+
+    def __init__(self, effects: List[dict], sample_rate: int, channels: int):
+        self.effects = [e for e in active_effects(effects) if e["type"] in EFFECTS]
+        self.processors = [
+            EFFECTS[e["type"]](effect_params(e), sample_rate, channels) for e in self.effects
+        ]
+        self.stages = [f"effect:{e['type']}" for e in self.effects]
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        for stage, processor in zip(self.stages, self.processors):
+            with timed(stage):
+                block = processor.process(block)
+        return block.astype(np.float32, copy=False)
+
+
+def process_signal(samples: np.ndarray, sample_rate: int, effects: List[dict],
+                   block_size: int = DEFAULT_BLOCK_SIZE) -> np.ndarray:
+    """Run a whole signal through an effect chain in fixed-size blocks"""
+    chain = EffectChain(effects, sample_rate, samples.shape[1])
+    if not chain.processors:
+        return samples
+    out = np.empty(samples.shape, dtype=np.float32)
+    for start in range(0, len(samples), block_size):
+        out[start:start + block_size] = chain.process(samples[start:start + block_size])
+    return out
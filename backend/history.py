@@ -0,0 +1,359 @@
+"""Delta-encoded project history.
+
+Every recorded change appends a version to the ``project_history``
+collection. Most versions hold only a JSON-Patch-style list of operations
+(``add``/``remove``/``replace`` with JSON Pointer paths) against the version
+before; every ``checkpoint_interval``-th version holds the full state
+instead, so rebuilding any version applies at most that many deltas. Track
+audio lives in the chunk store and is referenced by content hash, so
+versions never copy it; legacy inline audio is moved to the chunk store the
+first time a version captures it, and versions refer to it like any other
+track's audio. Fields derived from a track's audio, which read paths fill
+in lazily, are left out of versions and carried over on restore.
+
+The latest state of recently edited projects is kept in memory, so an edit
+that reports the fields it wrote is recorded by patching that state alone:
+no project read and no whole-project diff. Writers hold the project's
+``lock`` from their write until it is recorded, so versions follow the
+order writes were stored in; different projects never wait on each other.
+"""
+import asyncio
+import base64
+import binascii
+import copy
+import logging
+import weakref
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from audio_io import is_wav
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_INTERVAL = 20
+CHECKPOINT = "checkpoint"
+DELTA = "delta"
+
+# Track fields computed from the track's audio, possibly long after the edit that set the audio
+DERIVED_FIELDS = ("peaks_ref", "loudness", "pitch_ref")
+
+
+def _escape(key) -> str:
+    return str(key).replace("~", "~0").replace("/", "~1")
+
+
+def _unescape(part: str) -> str:
+    return part.replace("~1", "/").replace("~0", "~")
+
+
+def diff(old: Any, new: Any, path: str = "") -> List[dict]:
+    """Operations that turn ``old`` into ``new``"""
+    if isinstance(old, dict) and isinstance(new, dict):
+        ops = [{"op": "remove", "path": f"{path}/{_escape(key)}"} for key in old if key not in new]
+        for key, value in new.items():
+            if key in old:
+                ops += diff(old[key], value, f"{path}/{_escape(key)}")
+            else:
+                ops.append({"op": "add", "path": f"{path}/{_escape(key)}", "value": copy.deepcopy(value)})
+        return ops
+    if isinstance(old, list) and isinstance(new, list):
+        return _diff_list(old, new, path)
+    if type(old) is type(new) and old == new:
+        return []
+    return [{"op": "replace", "path": path, "value": copy.deepcopy(new)}]
+
+
+def _ids(items: list) -> Optional[List[str]]:
+    ids = [item.get("id") if isinstance(item, dict) else None for item in items]
+    if None in ids or len(set(ids)) != len(ids):
+        return None
+    return ids
+
+
+def _diff_list(old: list, new: list, path: str) -> List[dict]:
+    old_ids, new_ids = _ids(old), _ids(new)
+    if old_ids is not None and new_ids is not None:
+        kept = set(old_ids) & set(new_ids)
+        if [i for i in old_ids if i in kept] == [i for i in new_ids if i in kept]:
+            # Items keyed by id keep their order: remove, insert and patch in place
+            ops = [{"op": "remove", "path": f"{path}/{index}"}
+                   for index in reversed(range(len(old))) if old_ids[index] not in kept]
+            by_id = dict(zip(old_ids, old))
+            for index, item in enumerate(new):
+                if item["id"] in kept:
+                    ops += diff(by_id[item["id"]], item, f"{path}/{index}")
+                else:
+                    ops.append({"op": "add", "path": f"{path}/{index}", "value": copy.deepcopy(item)})
+            return ops
+    if len(old) == len(new):
+        return [op for index, (a, b) in enumerate(zip(old, new)) for op in diff(a, b, f"{path}/{index}")]
+    return [{"op": "replace", "path": path, "value": copy.deepcopy(new)}]
+
+
+def apply_patch(document: Any, ops: List[dict]) -> Any:
+    """A copy of ``document`` with ``ops`` applied in order"""
+    document = copy.deepcopy(document)
+    for op in ops:
+        parts = [_unescape(part) for part in op["path"].split("/")[1:]]
+        if not parts:
+            document = copy.deepcopy(op["value"])
+            continue
+        parent = document
+        for part in parts[:-1]:
+            parent = parent[int(part)] if isinstance(parent, list) else parent[part]
+        last = parts[-1]
+        if isinstance(parent, list):
+            index = int(last)
+            if op["op"] == "add":
+                parent.insert(index, copy.deepcopy(op["value"]))
+            elif op["op"] == "remove":
+                del parent[index]
+            else:
+                parent[index] = copy.deepcopy(op["value"])
+        elif op["op"] == "remove":
+            del parent[last]
+        else:
+            parent[last] = copy.deepcopy(op["value"])
+    return document
+
+
+def _versioned(track: dict) -> dict:
+    return {k: v for k, v in track.items() if k not in DERIVED_FIELDS}
+
+
+def _inline_audio(audio_data: str) -> Optional[Tuple[bytes, str]]:
+    """Bytes and content type of legacy inline audio, a base64 string or data: URL"""
+    content_type = "application/octet-stream"
+    if audio_data.startswith("data:"):
+        header, _, audio_data = audio_data.partition(",")
+        content_type = header[len("data:"):].split(";")[0] or content_type
+    try:
+        audio_bytes = base64.b64decode(audio_data, validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if content_type == "application/octet-stream" and is_wav(audio_bytes):
+        content_type = "audio/wav"
+    return audio_bytes, content_type
+
+
+def _set(old: dict, key: str, value: Any, path: str) -> List[dict]:
+    if key in old:
+        return diff(old[key], value, path)
+    return [{"op": "add", "path": path, "value": copy.deepcopy(value)}]
+
+
+def _patched(head: dict, fields: dict, tracks: Dict[str, dict], added: List[dict],
+             removed: set) -> Tuple[dict, List[dict]]:
+    """``head`` with an edit applied, and the operations that apply it.
+
+    Only the touched values are copied or diffed; untouched tracks are
+    shared with ``head``, which is never modified.
+    """
+    state = dict(head)
+    ops: List[dict] = []
+    for key, value in fields.items():
+        ops += _set(head, key, value, f"/{_escape(key)}")
+        state[key] = copy.deepcopy(value)
+    if not (tracks or added or removed):
+        return state, ops
+
+    track_list = list(head.get("tracks", []))
+    positions = {track["id"]: index for index, track in enumerate(track_list)}
+    for track_id, changes in tracks.items():
+        index = positions.get(track_id)
+        if index is None:
+            continue
+        track = dict(track_list[index])
+        for key, value in changes.items():
+            ops += _set(track, key, value, f"/tracks/{index}/{_escape(key)}")
+            track[key] = copy.deepcopy(value)
+        track_list[index] = track
+    for index in sorted((positions[i] for i in removed if i in positions), reverse=True):
+        ops.append({"op": "remove", "path": f"/tracks/{index}"})
+        del track_list[index]
+    for track in added:
+        ops.append({"op": "add", "path": f"/tracks/{len(track_list)}", "value": copy.deepcopy(track)})
+        track_list.append(copy.deepcopy(track))
+    state["tracks"] = track_list
+    return state, ops
+
+
+class ProjectHistory:
+    def __init__(self, db, audio_store, checkpoint_interval: int = CHECKPOINT_INTERVAL, cache_size: int = 256):
+        self.collection = db.project_history
+        self.audio_store = audio_store
+        self.checkpoint_interval = checkpoint_interval
+        self.cache_size = cache_size
+        # project id -> (head version, head state), so recording skips a rebuild
+        self.heads: "OrderedDict[str, Tuple[int, dict]]" = OrderedDict()
+        self.locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+    def lock(self, project_id: str) -> asyncio.Lock:
+        """Lock a writer holds across a project write and recording it"""
+        lock = self.locks.get(project_id)
+        if lock is None:
+            lock = self.locks[project_id] = asyncio.Lock()
+        return lock
+
+    async def ensure_indexes(self):
+        try:
+            await self.collection.create_index([("project_id", ASCENDING), ("version", ASCENDING)], unique=True)
+        except OperationFailure:
+            logger.exception("Could not create index on project_history")
+
+    async def snapshot(self, project: dict) -> dict:
+        """Project state as versions store it: no Mongo id, derived fields or inline audio"""
+        state = {k: v for k, v in project.items() if k != "_id"}
+        tracks = []
+        for track in state.get("tracks", []):
+            track = _versioned(track)
+            inline = None
+            if track.get("audio_data") and not track.get("audio_ref"):
+                inline = _inline_audio(track["audio_data"])
+            if inline:
+                audio_bytes, content_type = inline
+                track = {k: v for k, v in track.items() if k != "audio_data"}
+                track.update(audio_ref=await self.audio_store.put(audio_bytes), audio_size=len(audio_bytes),
+                             content_type=content_type, encoding=None)
+            tracks.append(track)
+        state["tracks"] = tracks
+        return state
+
+    @staticmethod
+    def restore(state: dict, current: Optional[dict] = None) -> dict:
+        """A stored state as a project document.
+
+        Tracks that still have the audio they have in ``current`` keep its
+        derived fields; the others get theirs computed again when next read.
+        """
+        project = copy.deepcopy(state)
+        derived = {
+            (track.get("id"), track.get("audio_ref")): {k: track[k] for k in DERIVED_FIELDS if k in track}
+            for track in (current or {}).get("tracks", [])
+        }
+        for track in project.get("tracks", []):
+            track.update(derived.get((track.get("id"), track.get("audio_ref")), {}))
+        return project
+
+    async def record(self, project: dict, summary: str) -> Optional[int]:
+        """Append a version if ``project`` differs from the latest one; returns its number"""
+        return await self._record_state(project["id"], await self.snapshot(project), summary)
+
+    async def _record_state(self, project_id: str, state: dict, summary: str) -> Optional[int]:
+        try:
+            return await self._append(project_id, state, summary, await self._head(project_id))
+        except DuplicateKeyError:
+            # Another server process appended first; rebuild its head and retry
+            self.heads.pop(project_id, None)
+            return await self._append(project_id, state, summary, await self._head(project_id))
+
+    async def record_changes(self, project_id: str, summary: str, load: Callable[[], Awaitable[Optional[dict]]],
+                             fields: Optional[dict] = None, tracks: Optional[Dict[str, dict]] = None,
+                             added: Iterable[dict] = (), removed: Iterable[str] = ()) -> Optional[int]:
+        """Append a version from what an edit wrote rather than from the whole project.
+
+        ``fields`` are top-level values that were set, ``tracks`` maps track
+        ids to the fields set on them, ``added`` are appended tracks and
+        ``removed`` the ids of deleted ones. Only when the project's latest
+        state is not in memory is the project read, through ``load``.
+        """
+        head = self.heads.get(project_id)
+        if head is None:
+            project = await load()
+            if project is None:
+                return None
+            return await self._record_state(project_id, await self.snapshot(project), summary)
+        self.heads.move_to_end(project_id)
+        tracks = {track_id: _versioned(changes) for track_id, changes in (tracks or {}).items()}
+        added = (await self.snapshot({"tracks": list(added)}))["tracks"]
+        state, ops = _patched(head[1], fields or {}, tracks, added, set(removed))
+        if not ops:
+            return None
+        try:
+            return await self._append(project_id, state, summary, head, ops)
+        except DuplicateKeyError:
+            self.heads.pop(project_id, None)
+            project = await load()
+            if project is None:
+                return None
+            return await self._record_state(project_id, await self.snapshot(project), summary)
+
+    async def _append(self, project_id: str, state: dict, summary: str,
+                      head: Optional[Tuple[int, dict]], ops: Optional[List[dict]] = None) -> Optional[int]:
+        if head is None:
+            version, ops = 1, None
+        else:
+            ops = diff(head[1], state) if ops is None else ops
+            if not ops:
+                return None
+            version = head[0] + 1
+        entry = {
+            "project_id": project_id,
+            "version": version,
+            "summary": summary,
+            "created_at": datetime.utcnow(),
+        }
+        if ops is None or version % self.checkpoint_interval == 0:
+            entry.update(kind=CHECKPOINT, state=state)
+        else:
+            entry.update(kind=DELTA, ops=ops)
+        await self.collection.insert_one(entry)
+        self._remember(project_id, version, state)
+        return version
+
+    async def versions(self, project_id: str, limit: int = 50, before: Optional[int] = None) -> List[dict]:
+        """Version summaries, newest first"""
+        query = {"project_id": project_id}
+        if before is not None:
+            query["version"] = {"$lt": before}
+        entries = await self.collection.find(
+            query, {"_id": 0, "version": 1, "kind": 1, "summary": 1, "created_at": 1, "ops": 1},
+        ).sort("version", -1).limit(limit).to_list(limit)
+        for entry in entries:
+            entry["changes"] = len(entry.pop("ops", None) or [])
+        return entries
+
+    async def state(self, project_id: str, version: int) -> Optional[dict]:
+        """Rebuild a version from its nearest checkpoint"""
+        checkpoint = await self.collection.find_one(
+            {"project_id": project_id, "version": {"$lte": version}, "kind": CHECKPOINT},
+            sort=[("version", -1)],
+        )
+        if checkpoint is None:
+            return None
+        deltas = await self.collection.find(
+            {"project_id": project_id, "version": {"$gt": checkpoint["version"], "$lte": version}},
+        ).sort("version", 1).to_list(None)
+        if checkpoint["version"] + len(deltas) != version:
+            return None
+        state = checkpoint["state"]
+        for delta in deltas:
+            state = apply_patch(state, delta["ops"])
+        return state
+
+    async def delete(self, project_id: str):
+        self.heads.pop(project_id, None)
+        await self.collection.delete_many({"project_id": project_id})
+
+    async def _head(self, project_id: str) -> Optional[Tuple[int, dict]]:
+        head = self.heads.get(project_id)
+        if head is not None:
+            self.heads.move_to_end(project_id)
+            return head
+        latest = await self.collection.find_one({"project_id": project_id}, {"version": 1}, sort=[("version", -1)])
+        if latest is None:
+            return None
+        state = await self.state(project_id, latest["version"])
+        self._remember(project_id, latest["version"], state)
+        return latest["version"], state
+
+    def _remember(self, project_id: str, version: int, state: dict):
+        self.heads[project_id] = (version, state)
+        self.heads.move_to_end(project_id)
+        while len(self.heads) > self.cache_size:
+            self.heads.popitem(last=False)
+
@@ -0,0 +1,272 @@
+"""Off-event-loop execution of CPU-heavy audio jobs.
+
+Jobs run in a ``ProcessPoolExecutor`` sized to the machine. Input audio is
+handed to workers through ``multiprocessing.shared_memory`` and results come
+back the same way, so only small descriptors are pickled. Workers report
+progress through a shared array with one slot per in-flight job, and the
+number of in-flight jobs is capped so callers get backpressure instead of an
+unbounded queue. Renders mix through the same segment caches as a
+synchronous render, via a shared view of the render cache whose new entries
+the server's cache adopts when the job finishes.
+"""
+import asyncio
+import multiprocessing
+import os
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from render_cache import RenderCache
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Finished jobs kept around for status queries
+MAX_FINISHED_JOBS = 1000
+# Memory tier of a render worker's view of the render cache
+WORKER_CACHE_MEMORY = 32 * 1024 * 1024
+
+_progress = None
+
+
+def _init_worker(progress):
+    global _progress
+    _progress = progress
+
+
+def _report(slot: int, fraction: float):
+    # Slots start at -1 while the job waits for a worker
+    _progress[slot] = fraction
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    return shared_memory.SharedMemory(name=name)
+
+
+def _process_worker(slot: int, in_name: str, in_size: int, out_name: str, effects: List[dict],
+                    key: Optional[str] = None, pitch_track: Optional[bytes] = None) -> Tuple[int, Optional[bytes]]:
+    """Apply an effect chain to a WAV held in shared memory.
+
+    Auto-Tune uses the serialized ``pitch_track`` when given. Returns the
+    output size and the pitch track the worker had to detect, if any.
+    """
+    from audio_io import decode_wav, encode_wav, parse_wav_header
+    from dsp import DEFAULT_BLOCK_SIZE, EffectChain
+    import pitch
+
+    _report(slot, 0.0)
+    source, target = _attach(in_name), _attach(out_name)
+    try:
+        data = bytes(source.buf[:in_size])
+        info = parse_wav_header(data)
+        samples, sample_rate = decode_wav(data)
+        autotune = pitch.autotune_params(effects)
+        detected = None
+        if autotune:
+            if pitch_track is None:
+                detected = pitch.detect_pitch(samples, sample_rate)
+            track = detected if detected is not None else pitch.deserialize(pitch_track)
+            samples = pitch.autotune(samples, track, autotune, key)
+        chain = EffectChain(effects, sample_rate, samples.shape[1])
+        for start in range(0, len(samples), DEFAULT_BLOCK_SIZE):
+            end = start + DEFAULT_BLOCK_SIZE
+            samples[start:end] = chain.process(samples[start:end])
+            _report(slot, min(end / max(len(samples), 1), 1.0))
+        bits = info.bits if info.bits in (16, 24) and not info.is_float else 16
+        output = encode_wav(samples, sample_rate, bits)
+        target.buf[:len(output)] = output
+        return len(output), pitch.serialize(detected) if detected is not None else None
+    finally:
+        source.close()
+        target.close()
+
+
+def _render_worker(slot: int, in_name: str, tracks: List[dict], out_name: str, sample_rate: int,
+                   project_id: str, cache_directory: str) -> Tuple[int, list]:
+    """Mix project tracks whose WAV bytes sit back to back in shared memory.
+
+    Returns the output size and the render cache entries the mix wrote.
+    """
+    from stems import SegmentedMixdown
+
+    _report(slot, 0.0)
+    source, target = _attach(in_name), _attach(out_name)
+    cache = RenderCache(cache_directory, WORKER_CACHE_MEMORY, 0, shared=True)
+
+    async def reader_for(track):
+        offset, size = track["_offset"], track["_size"]
+
+        async def read(start, end):
+            return bytes(source.buf[offset + start:offset + min(end, size)])
+        return read, size
+
+    async def render():
+        mixdown = await SegmentedMixdown.open(project_id, tracks, reader_for, cache, sample_rate=sample_rate)
+        position = 0
+        async for chunk in mixdown.stream():
+            target.buf[position:position + len(chunk)] = chunk
+            position += len(chunk)
+            _report(slot, position / mixdown.content_length)
+        return position, cache.written
+
+    try:
+        return asyncio.run(render())
+    finally:
+        source.close()
+        target.close()
+
+
+def _release(blocks: List[shared_memory.SharedMemory]):
+    for block in blocks:
+        block.close()
+        block.unlink()
+
+
+class QueueFull(Exception):
+    """Raised when the number of in-flight jobs is at its limit"""
+
+
+class Job:
+    def __init__(self, kind: str, slot: int):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.slot = slot
+        self.status = QUEUED  # becomes DONE or FAILED; RUNNING is derived from progress
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+
+class JobManager:
+    def __init__(self, max_workers: Optional[int] = None, max_queue: Optional[int] = None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.max_queue = max_queue or self.max_workers * 4
+        self.context = multiprocessing.get_context("spawn")
+        self.progress = self.context.RawArray("d", self.max_queue)
+        self.free_slots = list(range(self.max_queue))
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def _executor(self) -> ProcessPoolExecutor:
+        # Workers are spawned on first use so importing the app stays cheap
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=self.context,
+                initializer=_init_worker,
+                initargs=(self.progress,),
+            )
+        return self.executor
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    def describe(self, job: Job) -> dict:
+        status = job.status
+        progress = 1.0 if status == DONE else 0.0
+        if status == QUEUED and self.progress[job.slot] >= 0:
+            status = RUNNING
+            progress = self.progress[job.slot]
+        return {
+            "id": job.id,
+            "kind": job.kind,
+            "status": status,
+            "progress": round(progress, 4),
+            "result": job.result,
+            "error": job.error,
+            "created_at": job.created_at,
+            "finished_at": job.finished_at,
+        }
+
+    def submit_process(self, wav: bytes, effects: List[dict], output_size: int,
+                       on_done: Callable[[bytes], Awaitable[dict]], key: Optional[str] = None,
+                       pitch_track: Optional[bytes] = None,
+                       on_pitch: Optional[Callable[[bytes], Awaitable[None]]] = None) -> Job:
+        """Queue an effect-chain job; ``on_done`` stores the output WAV.
+
+        Auto-Tune reuses the serialized ``pitch_track``; without one the
+        worker detects it and ``on_pitch`` gets it to keep.
+        """
+        async def after(detected: Optional[bytes]):
+            if detected is not None and on_pitch is not None:
+                await on_pitch(detected)
+        return self._submit("process", [wav], output_size, on_done,
+                            lambda slot, i, o: (_process_worker, slot, i, len(wav), o, effects, key, pitch_track),
+                            after)
+
+    def submit_render(self, project_id: str, tracks: List[dict], sources: List[bytes], output_size: int,
+                      sample_rate: int, cache: RenderCache, on_done: Callable[[bytes], Awaitable[dict]]) -> Job:
+        """Queue a project mixdown of ``tracks`` whose WAV bytes are ``sources``, reusing ``cache``"""
+        offset = 0
+        specs = []
+        for track, data in zip(tracks, sources):
+            specs.append({**track, "_offset": offset, "_size": len(data)})
+            offset += len(data)
+        directory = str(cache.directory)
+
+        async def after(written: list):
+            cache.adopt(written)
+        return self._submit("render", sources, output_size, on_done,
+                            lambda slot, i, o: (_render_worker, slot, i, specs, o, sample_rate, project_id, directory),
+                            after)
+
+    def _submit(self, kind, inputs: List[bytes], output_size: int, on_done, make_call,
+                after: Callable[[object], Awaitable[None]]) -> Job:
+        """Start a worker call; ``after`` gets what the worker returned besides the output size"""
+        if not self.free_slots:
+            raise QueueFull()
+        slot = self.free_slots.pop()
+        self.progress[slot] = -1.0
+        job = Job(kind, slot)
+        blocks = []
+        try:
+            total = sum(len(data) for data in inputs)
+            source = shared_memory.SharedMemory(create=True, size=max(total, 1))
+            blocks.append(source)
+            target = shared_memory.SharedMemory(create=True, size=max(output_size, 1))
+            blocks.append(target)
+            offset = 0
+            for data in inputs:
+                source.buf[offset:offset + len(data)] = data
+                offset += len(data)
+
+            func, *args = make_call(slot, source.name, target.name)
+            future = asyncio.get_running_loop().run_in_executor(self._executor(), func, *args)
+        except BaseException:
+            # Nothing will finish this job, so give back what it took
+            _release(blocks)
+            self.free_slots.append(slot)
+            raise
+        self.jobs[job.id] = job
+        asyncio.ensure_future(self._finish(job, future, blocks, on_done, after))
+        return job
+
+    async def _finish(self, job: Job, future, blocks, on_done, after):
+        try:
+            size, extra = await future
+            await after(extra)
+            job.result = await on_done(bytes(blocks[1].buf[:size]))
+            job.status = DONE
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e) or e.__class__.__name__
+        finally:
+            _release(blocks)
+            job.finished_at = datetime.utcnow()
+            self.free_slots.append(job.slot)
+            self._trim()
+
+    def _trim(self):
+        finished = [j for j in self.jobs.values() if j.finished_at is not None]
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job.id]
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
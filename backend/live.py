@@ -0,0 +1,289 @@
+"""Live editing sessions over WebSocket.
+
+Each open project gets an in-memory session holding its mixer state (no
+audio). Clients send small deltas which are applied to that state, acked,
+and broadcast to the other clients immediately. Writes to MongoDB are
+coalesced: the session remembers which fields changed and flushes only
+their latest values at most once per ``flush_interval`` seconds, and again
+when the last client disconnects. Writes made outside the session (REST
+edits) are merged in with ``refresh``, keeping any live edits not yet
+flushed.
+"""
+import asyncio
+import contextlib
+import logging
+import math
+from datetime import datetime
+from typing import AsyncContextManager, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+import bson
+from bson.errors import InvalidDocument
+from fastapi import WebSocket
+from pydantic import ValidationError
+
+logger = logging.getLogger(__name__)
+
+TRACK_STATE_FIELDS = ("id", "name", "volume", "pan", "muted", "solo", "effects")
+
+
+class DeltaError(Exception):
+    """A client delta that cannot be applied"""
+
+
+def session_state(project: dict) -> dict:
+    return {
+        "name": project["name"],
+        "tempo": project.get("tempo"),
+        "key": project.get("key"),
+        "tracks": [{k: t[k] for k in TRACK_STATE_FIELDS if k in t} for t in project.get("tracks", [])],
+    }
+
+
+class LiveSession:
+    def __init__(self, project_id: str, state: dict):
+        self.project_id = project_id
+        self.state = state
+        self.tracks = {t["id"]: t for t in state["tracks"]}
+        self.clients: Set[WebSocket] = set()
+        self.dirty_project: Set[str] = set()
+        self.dirty_tracks: Dict[str, Set[str]] = {}
+        self.flush_task: Optional[asyncio.Task] = None
+        self.deltas = 0
+        self.writes = 0
+
+    @property
+    def dirty(self) -> bool:
+        return bool(self.dirty_project or self.dirty_tracks)
+
+
+class LiveSessions:
+    def __init__(self, projects, track_model: type, project_model: type, flush_interval: float = 1.0,
+                 on_flush: Optional[Callable[[str, dict, Dict[str, dict]], Awaitable[None]]] = None,
+                 effect_parameters: Optional[Dict[str, Iterable[str]]] = None,
+                 write_lock: Optional[Callable[[str], AsyncContextManager]] = None):
+        self.projects = projects
+        self.track_model = track_model
+        self.project_model = project_model
+        # Parameter names of every known effect type, used to validate effect_param deltas
+        self.effect_parameters = {name: set(params) for name, params in (effect_parameters or {}).items()}
+        self.flush_interval = flush_interval
+        # Called after every write with the project id, the project fields
+        # written and the fields written per track id
+        self.on_flush = on_flush
+        # Held from each write until on_flush returns, given the project id
+        self.write_lock = write_lock
+        self.sessions: Dict[str, LiveSession] = {}
+        self.lock = asyncio.Lock()
+
+    async def join(self, project_id: str, websocket: WebSocket) -> Optional[LiveSession]:
+        async with self.lock:
+            session = self.sessions.get(project_id)
+            if session is None:
+                project = await self.projects.get(project_id)
+                if not project:
+                    return None
+                session = self.sessions[project_id] = LiveSession(project_id, session_state(project))
+            session.clients.add(websocket)
+            return session
+
+    async def leave(self, session: LiveSession, websocket: WebSocket):
+        async with self.lock:
+            session.clients.discard(websocket)
+            if session.clients:
+                return
+            if session.flush_task:
+                session.flush_task.cancel()
+                session.flush_task = None
+            # Flush before the session is dropped so a new join loads what was written
+            await self.flush(session)
+            self.sessions.pop(session.project_id, None)
+
+    async def refresh(self, project_id: str):
+        """Reload a session after a write made outside it, keeping live edits not yet flushed"""
+        session = self.sessions.get(project_id)
+        if session is None:
+            return
+        project = await self.projects.get(project_id)
+        if project is None:
+            await self.broadcast(session, {"type": "deleted"})
+            self.sessions.pop(project_id, None)
+            return
+        state = session_state(project)
+        for field in session.dirty_project:
+            state[field] = session.state[field]
+        tracks = {t["id"]: t for t in state["tracks"]}
+        for track_id in list(session.dirty_tracks):
+            if track_id not in tracks:
+                del session.dirty_tracks[track_id]
+                continue
+            for field in session.dirty_tracks[track_id]:
+                tracks[track_id][field] = session.tracks[track_id][field]
+        session.state, session.tracks = state, tracks
+        await self.broadcast(session, {"type": "state", "state": state})
+
+    def _validate(self, model: type, field: str, value):
+        if field not in model.model_fields or field == "id":
+            raise DeltaError(f"Unknown field: {field}")
+        try:
+            return getattr(model.model_validate({field: value}), field)
+        except ValidationError as e:
+            raise DeltaError(e.errors()[0]["msg"])
+
+    def apply(self, session: LiveSession, delta: dict) -> dict:
+        """Apply a delta to the session state and return its normalized form"""
+        kind = delta.get("type")
+        if kind == "project":
+            field = delta.get("field")
+            value = self._validate(self.project_model, field, delta.get("value"))
+            session.state[field] = value
+            session.dirty_project.add(field)
+            return {"type": "project", "field": field, "value": value}
+
+        track = session.tracks.get(delta.get("track_id"))
+        if track is None:
+            raise DeltaError("Unknown track")
+        if kind == "track":
+            field = delta.get("field")
+            value = self._validate(self.track_model, field, delta.get("value"))
+            if field == "effects":
+                value = [dict(e) for e in value]
+            track[field] = value
+        elif kind == "effect_param":
+            field = "effects"
+            effect = next((e for e in track.get("effects", []) if e.get("id") == delta.get("effect_id")), None)
+            if effect is None:
+                raise DeltaError("Unknown effect")
+            try:
+                value = float(delta.get("value"))
+            except (TypeError, ValueError):
+                raise DeltaError("Effect parameter value must be a number")
+            if not math.isfinite(value):
+                raise DeltaError("Effect parameter value must be finite")
+            name = delta.get("param")
+            params = effect.setdefault("parameters", [])
+            known = self.effect_parameters.get(effect.get("type"))
+            if isinstance(params, dict):
+                # Unknown effect types may only change the parameters they already have
+                if not isinstance(name, str) or name not in (known if known is not None else params):
+                    raise DeltaError("Unknown effect parameter")
+                params[name] = value
+            else:
+                param = next((p for p in params if p.get("name") == name), None)
+                if param is None or (known is not None and name not in known):
+                    raise DeltaError("Unknown effect parameter")
+                param["value"] = value
+        else:
+            raise DeltaError(f"Unknown delta type: {kind}")
+        session.dirty_tracks.setdefault(track["id"], set()).add(field)
+        return {**{k: delta[k] for k in ("type", "track_id", "field", "effect_id", "param") if k in delta},
+                "value": value}
+
+    async def handle(self, session: LiveSession, websocket: WebSocket, delta: dict):
+        """Apply one client message, ack it and fan it out to the other clients"""
+        try:
+            change = self.apply(session, delta)
+        except DeltaError as e:
+            await websocket.send_json({"type": "error", "seq": delta.get("seq"), "detail": str(e)})
+            return
+        session.deltas += 1
+        await websocket.send_json({"type": "ack", "seq": delta.get("seq")})
+        await self.broadcast(session, change, exclude=websocket)
+        if session.flush_task is None:
+            session.flush_task = asyncio.ensure_future(self._flush_later(session))
+
+    async def broadcast(self, session: LiveSession, message: dict, exclude: Optional[WebSocket] = None):
+        for client in list(session.clients):
+            if client is exclude:
+                continue
+            try:
+                await client.send_json(message)
+            except Exception:
+                session.clients.discard(client)
+
+    async def _flush_later(self, session: LiveSession):
+        try:
+            await asyncio.sleep(self.flush_interval)
+            session.flush_task = None
+            await self.flush(session)
+        except asyncio.CancelledError:
+            pass
+
+    def _update(self, session: LiveSession) -> Tuple[dict, List[dict]]:
+        """Build one $set covering every dirty field, with a filter per track"""
+        fields = {field: session.state[field] for field in session.dirty_project}
+        array_filters = []
+        for index, (track_id, dirty) in enumerate(session.dirty_tracks.items()):
+            array_filters.append({f"t{index}.id": track_id})
+            for field in dirty:
+                fields[f"tracks.$[t{index}].{field}"] = session.tracks[track_id][field]
+        fields["updated_at"] = datetime.utcnow()
+        return fields, array_filters
+
+    async def flush(self, session: LiveSession):
+        if not session.dirty:
+            return
+        async with self.write_lock(session.project_id) if self.write_lock else contextlib.nullcontext():
+            await self._write(session)
+
+    async def _write(self, session: LiveSession):
+        if not session.dirty:
+            return
+        fields, array_filters = self._update(session)
+        dirty_project, dirty_tracks = session.dirty_project, session.dirty_tracks
+        session.dirty_project = set()
+        session.dirty_tracks = {}
+        try:
+            try:
+                await self.projects.update_one(
+                    {"id": session.project_id},
+                    {"$set": fields},
+                    array_filters=array_filters or None,
+                )
+            except InvalidDocument:
+                # Retrying would fail forever and block every later edit, so drop what cannot be stored
+                fields, array_filters = self._encodable(session, fields, array_filters, dirty_project, dirty_tracks)
+                await self.projects.update_one(
+                    {"id": session.project_id},
+                    {"$set": fields},
+                    array_filters=array_filters or None,
+                )
+            session.writes += 1
+        except Exception:
+            logger.exception("Failed to persist live session for project %s", session.project_id)
+            # Keep the fields dirty so the next flush retries them
+            session.dirty_project |= dirty_project
+            for track_id, dirty in dirty_tracks.items():
+                session.dirty_tracks.setdefault(track_id, set()).update(dirty)
+            return
+        if self.on_flush:
+            await self.on_flush(
+                session.project_id,
+                {**{field: session.state[field] for field in dirty_project}, "updated_at": fields["updated_at"]},
+                {track_id: {field: session.tracks[track_id][field] for field in dirty}
+                 for track_id, dirty in dirty_tracks.items()},
+            )
+
+    def _encodable(self, session: LiveSession, fields: dict, array_filters: List[dict],
+                   dirty_project: Set[str], dirty_tracks: Dict[str, Set[str]]) -> Tuple[dict, List[dict]]:
+        """``fields`` without values BSON cannot encode, dropping them from the dirty sets too"""
+        kept = {}
+        for path, value in fields.items():
+            try:
+                bson.encode({"value": value})
+                kept[path] = value
+            except InvalidDocument:
+                logger.error("Dropping unstorable live edit %s of project %s", path, session.project_id)
+        dirty_project.intersection_update(kept)
+        for index, track_id in enumerate(list(dirty_tracks)):
+            dirty_tracks[track_id] = {f for f in dirty_tracks[track_id] if f"tracks.$[t{index}].{f}" in kept}
+            if not dirty_tracks[track_id]:
+                del dirty_tracks[track_id]
+        used = {path.split(".")[1][2:-1] for path in kept if path.startswith("tracks.")}
+        return kept, [f for f in array_filters if next(iter(f)).split(".")[0] in used]
+
+    async def flush_all(self):
+        for session in list(self.sessions.values()):
+            if session.flush_task:
+                session.flush_task.cancel()
+                session.flush_task = None
+            await self.flush(session)
@@ -0,0 +1,154 @@
+"""Track loudness analysis following ITU-R BS.1770.
+
+Audio is K-weighted (a high-shelf pre-filter followed by the RLB high-pass,
+designed for the audio's own sample rate) and its mean square is summed per
+100 ms step in the same pass that measures sample peak and RMS. Both
+filters decay below -180 dB within a quarter second, so the cascade is
+applied as that truncated impulse response by FFT overlap-add, a few large
+FFTs per track instead of a per-sample recursion. Gating
+blocks are then sums of consecutive steps: 400 ms blocks for integrated
+loudness (absolute gate at -70 LUFS, relative gate 10 LU below) and 3 s
+short-term windows for the maximum short-term loudness and the loudness
+range (10th to 95th percentile, relative gate 20 LU below).
+"""
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+
+from dsp import Biquad
+from metrics import timed
+
+STEP_SECONDS = 0.1
+MOMENTARY_STEPS = 4  # 400 ms gating blocks
+SHORT_TERM_STEPS = 30  # 3 s short-term windows
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+RANGE_GATE = -20.0
+# Minimum steps filtered per FFT block, bounding memory for long tracks
+BLOCK_STEPS = 64
+IMPULSE_SECONDS = 0.25
+
+# Channel weights for L, R, C, LFE, Ls, Rs; the LFE channel is not measured
+SURROUND_WEIGHTS = (1.0, 1.0, 1.0, 0.0, 1.41, 1.41)
+
+
+def _k_weighting(sample_rate: int):
+    """Pre-filter and RLB high-pass for ``sample_rate``, matching BS.1770 at 48 kHz"""
+    gain, freq, q = 3.999843853973347, 1681.974450955533, 0.7071752369554196
+    k = np.tan(np.pi * freq / sample_rate)
+    vh = 10 ** (gain / 20)
+    vb = vh ** 0.4996667741545416
+    shelf = Biquad((vh + vb * k / q + k * k, 2 * (k * k - vh), vh - vb * k / q + k * k),
+                   (1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k), 1)
+    freq, q = 38.13547087602444, 0.5003270373238773
+    k = np.tan(np.pi * freq / sample_rate)
+    highpass = Biquad((1.0, -2.0, 1.0), (1 + k / q + k * k, 2 * (k * k - 1), 1 - k / q + k * k), 1)
+    return shelf, highpass
+
+
+@lru_cache(maxsize=16)
+def k_weighting_response(sample_rate: int) -> np.ndarray:
+    """Impulse response of the K-weighting cascade, truncated after ``IMPULSE_SECONDS``"""
+    impulse = np.zeros((int(IMPULSE_SECONDS * sample_rate), 1))
+    impulse[0] = 1.0
+    shelf, highpass = _k_weighting(sample_rate)
+    return highpass.process(shelf.process(impulse))[:, 0]
+
+
+@lru_cache(maxsize=32)
+def _response_spectrum(sample_rate: int, size: int) -> np.ndarray:
+    return np.fft.rfft(k_weighting_response(sample_rate), size)
+
+
+def _weights(channels: int) -> np.ndarray:
+    if channels == len(SURROUND_WEIGHTS):
+        return np.array(SURROUND_WEIGHTS)
+    return np.ones(channels)
+
+
+def _lufs(power):
+    return -0.691 + 10 * np.log10(np.maximum(power, 1e-20))
+
+
+def _db(value: float) -> Optional[float]:
+    return round(float(20 * np.log10(value)), 2) if value > 0 else None
+
+
+def _windows(steps: np.ndarray, length: int) -> np.ndarray:
+    """Channel-weighted mean square of every window of ``length`` consecutive steps"""
+    if len(steps) < length:
+        return np.zeros(0)
+    totals = np.concatenate([[0.0], np.cumsum(steps)])
+    return (totals[length:] - totals[:-length]) / length
+
+
+def integrated(blocks: np.ndarray) -> Optional[float]:
+    """Gated loudness of 400 ms block powers"""
+    blocks = blocks[_lufs(blocks) > ABSOLUTE_GATE]
+    if not len(blocks):
+        return None
+    blocks = blocks[_lufs(blocks) > _lufs(blocks.mean()) + RELATIVE_GATE]
+    return round(float(_lufs(blocks.mean())), 2)
+
+
+def loudness_range(windows: np.ndarray) -> Optional[float]:
+    """Spread between the 10th and 95th percentile of gated short-term loudness, in LU"""
+    windows = windows[_lufs(windows) > ABSOLUTE_GATE]
+    if not len(windows):
+        return None
+    loudness = _lufs(windows[_lufs(windows) > _lufs(windows.mean()) + RANGE_GATE])
+    low, high = np.percentile(loudness, [10, 95])
+    return round(float(high - low), 2)
+
+
+def analyze(samples: np.ndarray, sample_rate: int) -> dict:
+    """Duration, sample peak, RMS and BS.1770 loudness of ``(frames, channels)`` audio"""
+    frames, channels = samples.shape
+    step = int(round(STEP_SECONDS * sample_rate))
+    weights = _weights(channels)
+    response = len(k_weighting_response(sample_rate))
+    # Blocks are whole steps and fill the FFT once the response's tail is added;
+    # short tracks get an FFT just long enough for the whole track
+    span = max(min(step * BLOCK_STEPS, frames), step) + response - 1
+    size = 1 << int(np.ceil(np.log2(span)))
+    block = (size - response + 1) // step * step
+    spectrum = _response_spectrum(sample_rate, size)
+    tail = np.zeros((channels, size - block))
+
+    peak, square_sum = 0.0, 0.0
+    steps = []
+    with timed("loudness"):
+        for start in range(0, frames, block):
+            x = samples[start:start + block].T.astype(np.float64)
+            peak = max(peak, float(np.abs(x).max(initial=0.0)))
+            square_sum += float(np.einsum("ij,ij->", x, x))
+            filtered = np.fft.irfft(np.fft.rfft(x, size) * spectrum, size)
+            filtered[:, :tail.shape[1]] += tail
+            length = x.shape[1]
+            weighted, tail = filtered[:, :length], filtered[:, length:length + tail.shape[1]]
+            # Trailing frames shorter than a step never complete a gating block
+            whole = length // step * step
+            power = (weighted[:, :whole] ** 2).reshape(channels, -1, step).mean(axis=2)
+            steps.append(weights @ power)
+    steps = np.concatenate(steps) if steps else np.zeros(0)
+
+    short_term = _windows(steps, SHORT_TERM_STEPS)
+    return {
+        "duration": frames / sample_rate,
+        "peak_db": _db(peak),
+        "rms_db": _db(np.sqrt(square_sum / max(frames * channels, 1))),
+        "integrated_lufs": integrated(_windows(steps, MOMENTARY_STEPS)),
+        "short_term_max_lufs": round(float(_lufs(short_term.max())), 2) if len(short_term) else None,
+        "loudness_range": loudness_range(short_term),
+    }
+
+
+def normalize_gain(loudness: dict, target_lufs: float) -> float:
+    """Linear gain bringing a track to ``target_lufs`` without pushing its peak past full scale"""
+    if loudness.get("integrated_lufs") is None:
+        return 1.0
+    gain_db = target_lufs - loudness["integrated_lufs"]
+    if loudness.get("peak_db") is not None:
+        gain_db = min(gain_db, -loudness["peak_db"])
+    return float(10 ** (gain_db / 20))
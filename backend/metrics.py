@@ -0,0 +1,213 @@
+"""In-process performance metrics.
+
+Histograms kept here are exposed in the Prometheus text format
+at ``GET /metrics``. Three sources feed them: an ASGI middleware timing every
+request and counting its bytes, a pymongo ``CommandListener`` timing every
+MongoDB command and sizing a sample of them, and ``timed()`` blocks around the audio stages. The same
+middleware can also report a per-request breakdown (db, dsp, total) in a
+``Server-Timing`` header. Work done inside job worker processes is not seen
+by the server's registry.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+import bson
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = tuple(float(4 ** i) for i in range(3, 14))  # 64 B .. 64 MiB
+
+# Seconds spent per category ("db", "dsp") by the request being served
+_request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (non-cumulative, last is +Inf), sum]
+        self.series: Dict[tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for labels, (counts, total) in sorted(self.series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {total:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+http_duration = Histogram(
+    "http_request_duration_seconds", "Time to serve a request, until its last body byte",
+    ("method", "route", "status"),
+)
+http_request_bytes = Histogram(
+    "http_request_size_bytes", "Request body size", ("method", "route"), SIZE_BUCKETS,
+)
+http_response_bytes = Histogram(
+    "http_response_size_bytes", "Response body size", ("method", "route", "status"), SIZE_BUCKETS,
+)
+mongo_duration = Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command round-trip time", ("command", "outcome"),
+)
+mongo_command_bytes = Histogram(
+    "mongodb_command_size_bytes", "BSON size of a sample of MongoDB commands sent", ("command",), SIZE_BUCKETS,
+)
+mongo_reply_bytes = Histogram(
+    "mongodb_reply_size_bytes", "BSON size of a sample of MongoDB replies", ("command",), SIZE_BUCKETS,
+)
+dsp_duration = Histogram(
+    "dsp_stage_duration_seconds", "Time spent in each audio processing stage", ("stage",),
+)
+
+REGISTRY = (
+    http_duration, http_request_bytes, http_response_bytes,
+    mongo_duration, mongo_command_bytes, mongo_reply_bytes,
+    dsp_duration,
+)
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+def _charge(category: str, seconds: float):
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[category] = timings.get(category, 0.0) + seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """Time an audio stage into the DSP histogram and the current request"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        dsp_duration.observe(elapsed, stage)
+        _charge("dsp", elapsed)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Records per-command durations, and BSON sizes of one command in ``size_sample_every``.
+
+    Measuring a size means encoding the command or reply again, which costs
+    about as much as sending it, so only a sample is measured; 0 turns size
+    measurement off. Sampling by request id measures a command and its reply
+    together. Motor runs pymongo on executor threads with the caller's
+    context copied, so command time is also charged to the request that
+    issued it.
+    """
+
+    def __init__(self, size_sample_every: int = 100):
+        self.size_sample_every = size_sample_every
+
+    def _sampled(self, event) -> bool:
+        return self.size_sample_every > 0 and event.request_id % self.size_sample_every == 0
+
+    def started(self, event):
+        if self._sampled(event):
+            mongo_command_bytes.observe(len(bson.encode(event.command)), event.command_name)
+
+    def _finish(self, event, outcome: str):
+        seconds = event.duration_micros / 1e6
+        mongo_duration.observe(seconds, event.command_name, outcome)
+        _charge("db", seconds)
+
+    def succeeded(self, event):
+        self._finish(event, "success")
+        if self._sampled(event):
+            mongo_reply_bytes.observe(len(bson.encode(event.reply)), event.command_name)
+
+    def failed(self, event):
+        self._finish(event, "failure")
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and body sizes per route template"""
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        timings: Dict[str, float] = {}
+        token = _request_timings.set(timings)
+        sizes = {"request": 0, "response": 0}
+        status = [500]
+
+        async def counting_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                sizes["request"] += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if self.server_timing:
+                    message = dict(message)
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", self._server_timing(timings, time.perf_counter() - start))
+                    ]
+            elif message["type"] == "http.response.body":
+                sizes["response"] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            _request_timings.reset(token)
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            # Route templates keep label cardinality bounded; ids never become labels
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            http_duration.observe(elapsed, method, path, str(status[0]))
+            http_request_bytes.observe(sizes["request"], method, path)
+            http_response_bytes.observe(sizes["response"], method, path, str(status[0]))
+
+    @staticmethod
+    def _server_timing(timings: Dict[str, float], total: float) -> bytes:
+        parts = [f"{name};dur={seconds * 1000:.2f}" for name, seconds in sorted(timings.items())]
+        parts.append(f"app;dur={total * 1000:.2f}")
+        return ", ".join(parts).encode("latin-1")
@@ -0,0 +1,130 @@
+"""Track reading for project mixdowns.
+
+Tracks are read from their byte source a window at a time, decoded and
+resampled to the output rate, so memory use depends on the block size and
+track count but never on project length. ``stems`` builds the mixdown on
+these readers.
+"""
+from typing import Awaitable, Callable, List
+
+import numpy as np
+
+from audio_io import WavInfo, is_wav, parse_wav_header, pcm_to_float
+from metrics import timed
+
+OUTPUT_CHANNELS = 2
+# Bytes fetched from the store per track read, independent of block size
+READ_AHEAD = 256 * 1024
+HEADER_PROBE = 4096
+MAX_HEADER_PROBE = 1024 * 1024
+
+ByteReader = Callable[[int, int], Awaitable[bytes]]
+
+
+def pan_gains(pan: float):
+    """Constant-power (sin/cos) pan law, -1 hard left to 1 hard right"""
+    theta = (min(max(pan, -1.0), 1.0) + 1.0) * np.pi / 4
+    return np.cos(theta), np.sin(theta)
+
+
+def audible_tracks(tracks: List[dict]) -> List[dict]:
+    """Apply mute/solo: when any track is soloed only soloed tracks play"""
+    soloed = any(t.get("solo") for t in tracks)
+    return [t for t in tracks if not t.get("muted") and (t.get("solo") or not soloed)]
+
+
+async def read_wav_info(read: ByteReader, size: int) -> WavInfo:
+    """Parse a WAV header, fetching a longer prefix if metadata chunks precede it"""
+    probe = HEADER_PROBE
+    while True:
+        head = await read(0, min(probe, size))
+        if not is_wav(head):
+            raise ValueError("Track audio is not a WAV file")
+        try:
+            return parse_wav_header(head, size)
+        except Exception:
+            if probe >= size or probe >= MAX_HEADER_PROBE:
+                raise ValueError("Track audio is not a readable WAV file")
+            probe *= 4
+
+
+class TrackReader:
+    """Sequential block reader for one track's WAV audio at the output rate"""
+
+    def __init__(self, read: ByteReader, info: WavInfo, sample_rate: int):
+        self.read_bytes = read
+        self.info = info
+        self.ratio = info.sample_rate / sample_rate
+        self.frames = int(info.frames / self.ratio)
+        self.byte_pos = info.data_offset
+        self.data_end = info.data_offset + info.data_size
+        self.pending = b""
+        # Source frames decoded but not yet consumed, for resampling
+        self.source = np.zeros((0, info.channels), np.float32)
+        self.source_start = 0
+        self.position = 0.0
+
+    def seek(self, frame: int):
+        """Continue reading from output ``frame``; resampling restarts there"""
+        self.position = frame * self.ratio
+        self.source_start = int(np.floor(self.position))
+        self.byte_pos = min(self.info.data_offset + self.source_start * self.info.frame_size, self.data_end)
+        self.pending = b""
+        self.source = np.zeros((0, self.info.channels), np.float32)
+
+    async def _read_source(self, frames: int) -> np.ndarray:
+        """Decode up to ``frames`` source frames"""
+        wanted = frames * self.info.frame_size
+        while len(self.pending) < wanted and self.byte_pos < self.data_end:
+            end = min(self.byte_pos + max(READ_AHEAD, wanted), self.data_end)
+            self.pending += await self.read_bytes(self.byte_pos, end)
+            self.byte_pos = end
+        take = min(wanted, len(self.pending))
+        take -= take % self.info.frame_size
+        raw, self.pending = self.pending[:take], self.pending[take:]
+        with timed("decode"):
+            return pcm_to_float(raw, self.info)
+
+    async def read(self, frames: int) -> np.ndarray:
+        if self.ratio == 1.0:
+            block = await self._read_source(frames)
+        else:
+            block = await self._read_resampled(frames)
+        if len(block) < frames:
+            block = np.concatenate([block, np.zeros((frames - len(block), self.info.channels), np.float32)])
+        return block
+
+    async def _read_resampled(self, frames: int) -> np.ndarray:
+        """Linear-interpolation resampling to the output rate"""
+        positions = self.position + np.arange(frames) * self.ratio
+        needed = int(np.floor(positions[-1])) + 2 - self.source_start
+        if needed > len(self.source):
+            more = await self._read_source(needed - len(self.source))
+            self.source = np.concatenate([self.source, more])
+        if len(self.source) == 0:
+            return self.source
+        with timed("resample"):
+            local = positions - self.source_start
+            valid = local < len(self.source) - 1
+            local = local[valid]
+            index = local.astype(np.int64)
+            frac = (local - index)[:, None].astype(np.float32)
+            block = self.source[index] * (1 - frac) + self.source[index + 1] * frac
+
+        self.position += frames * self.ratio
+        drop = min(int(np.floor(self.position)) - self.source_start, len(self.source))
+        self.source = self.source[drop:]
+        self.source_start += drop
+        return block
+
+
+async def _probe(track: dict, reader_for):
+    """Resolve a track's byte reader and WAV header, or (reader, None)"""
+    source = await reader_for(track)
+    if source is None:
+        return None, None
+    read, size = source
+    try:
+        return read, await read_wav_info(read, size)
+    except ValueError:
+        return read, None
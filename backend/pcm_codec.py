@@ -0,0 +1,267 @@
+"""Lossless block codec for stored 16/24-bit PCM audio.
+
+Audio is cut into blocks of ``BLOCK_FRAMES`` frames that are coded
+independently. Each channel of a block picks the fixed predictor (none,
+delta or linear) that leaves the smallest residuals; the residuals are
+zig-zag mapped, split into byte planes and deflated with zlib. A table of
+block offsets follows the header, so any frame range decodes by fetching
+and inflating only the blocks it overlaps.
+
+Layout::
+
+    header  magic, channels, bits, sample rate, frames, block frames, blocks
+    index   (blocks + 1) little-endian u64 offsets into the payload
+    payload per block: one predictor order per channel, byte width, then
+            each byte plane either deflated or stored raw
+
+``EncodedReader`` presents an encoded blob as the canonical WAV file it
+decodes to, so code that reads WAV byte ranges works unchanged.
+"""
+import asyncio
+import struct
+import zlib
+from typing import Awaitable, Callable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from audio_io import parse_wav_header, wav_header
+from metrics import timed
+
+MAGIC = b"DPC1"
+# Value of a track's ``encoding`` field when its stored audio uses this codec
+ENCODING = "dpc1"
+BLOCK_FRAMES = 8192
+COMPRESSION_LEVEL = 6
+# WAV bytes produced per step when streaming a whole range
+STREAM_WINDOW = 256 * 1024
+WAV_HEADER_SIZE = 44
+_HEADER = struct.Struct("<4sHHIQII")  # magic, channels, bits, sample rate, frames, block frames, blocks
+_PLANE = struct.Struct("<BI")  # storage method, stored size
+_RAW, _DEFLATE = 0, 1
+_MAX_ORDER = 2
+
+ByteReader = Callable[[int, int], Awaitable[bytes]]
+
+
+class CodecHeader(NamedTuple):
+    channels: int
+    bits: int
+    sample_rate: int
+    frames: int
+    block_frames: int
+    offsets: np.ndarray  # u64 block offsets relative to the payload, one extra at the end
+
+    @property
+    def blocks(self) -> int:
+        return len(self.offsets) - 1
+
+    @property
+    def payload_offset(self) -> int:
+        return index_end(self.blocks)
+
+    @property
+    def frame_size(self) -> int:
+        return self.channels * self.bits // 8
+
+    @property
+    def wav_size(self) -> int:
+        return WAV_HEADER_SIZE + self.frames * self.frame_size
+
+
+def is_encoded(data: bytes) -> bool:
+    return data[:4] == MAGIC
+
+
+def index_end(blocks: int) -> int:
+    return _HEADER.size + 8 * (blocks + 1)
+
+
+def _pcm_to_ints(raw: bytes, channels: int, bits: int) -> np.ndarray:
+    if bits == 16:
+        ints = np.frombuffer(raw, "<i2").astype(np.int64)
+    else:
+        bytes3 = np.frombuffer(raw, np.uint8).reshape(-1, 3).astype(np.int64)
+        ints = bytes3[:, 0] | (bytes3[:, 1] << 8) | (bytes3[:, 2] << 16)
+        ints = np.where(ints >= 1 << 23, ints - (1 << 24), ints)
+    return ints.reshape(-1, channels)
+
+
+def _ints_to_pcm(ints: np.ndarray, bits: int) -> bytes:
+    if bits == 16:
+        return ints.astype("<i2").tobytes()
+    return np.ascontiguousarray(ints, "<i4").view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+
+
+def _encode_block(block: np.ndarray) -> bytes:
+    """Predict, zig-zag and deflate one (frames, channels) int64 block"""
+    channels = block.shape[1]
+    residuals = [block]
+    for _ in range(_MAX_ORDER):
+        residuals.append(np.diff(residuals[-1], axis=0, prepend=np.zeros((1, channels), np.int64)))
+    costs = np.stack([np.abs(r).sum(axis=0) for r in residuals])
+    orders = costs.argmin(axis=0)
+    chosen = np.stack(residuals)[orders, :, np.arange(channels)]  # (channels, frames)
+
+    zigzag = ((chosen << 1) ^ (chosen >> 63)).astype("<u4")
+    width = max((int(zigzag.max(initial=0)).bit_length() + 7) // 8, 1)
+    planes = zigzag.reshape(-1).view(np.uint8).reshape(-1, 4)[:, :width].T
+    parts = [bytes(orders.astype(np.uint8)), bytes([width])]
+    for plane in planes:
+        # Low planes are close to noise; storing them raw keeps decoding cheap
+        raw = plane.tobytes()
+        packed = zlib.compress(raw, COMPRESSION_LEVEL)
+        stored, method = (packed, _DEFLATE) if len(packed) < len(raw) * 0.95 else (raw, _RAW)
+        parts.append(_PLANE.pack(method, len(stored)))
+        parts.append(stored)
+    return b"".join(parts)
+
+
+def _decode_block(data: bytes, channels: int, frames: int) -> np.ndarray:
+    """Inverse of ``_encode_block``; returns (channels, frames) int32 samples"""
+    orders = np.frombuffer(data, np.uint8, channels)
+    width = data[channels]
+    offset = channels + 1
+    zigzag = np.zeros((channels, frames), np.int32)
+    for plane in range(width):
+        method, size = _PLANE.unpack_from(data, offset)
+        offset += _PLANE.size
+        stored = data[offset:offset + size]
+        offset += size
+        values = np.frombuffer(zlib.decompress(stored) if method == _DEFLATE else stored, np.uint8)
+        zigzag |= values.reshape(channels, frames).astype(np.int32) << (8 * plane)
+    ints = (zigzag >> 1) ^ -(zigzag & 1)
+    for channel, order in enumerate(orders):
+        for _ in range(order):
+            np.cumsum(ints[channel], out=ints[channel])
+    return ints
+
+
+def encode(ints: np.ndarray, sample_rate: int, bits: int, block_frames: int = BLOCK_FRAMES) -> bytes:
+    """Encode (frames, channels) integer PCM samples"""
+    frames, channels = ints.shape
+    ints = ints.astype(np.int64, copy=False)
+    payload = [_encode_block(ints[start:start + block_frames]) for start in range(0, frames, block_frames)]
+    offsets = np.zeros(len(payload) + 1, "<u8")
+    offsets[1:] = np.cumsum([len(block) for block in payload])
+    header = _HEADER.pack(MAGIC, channels, bits, sample_rate, frames, block_frames, len(payload))
+    return b"".join([header, offsets.tobytes(), *payload])
+
+
+def encode_wav_file(data: bytes) -> Optional[bytes]:
+    """Encode a 16/24-bit PCM WAV file; None for anything the codec doesn't cover"""
+    try:
+        info = parse_wav_header(data)
+    except ValueError:
+        return None
+    if info.is_float or info.bits not in (16, 24):
+        return None
+    raw = data[info.data_offset:info.data_offset + info.data_size]
+    return encode(_pcm_to_ints(raw, info.channels, info.bits), info.sample_rate, info.bits)
+
+
+def parse_header(data: bytes) -> CodecHeader:
+    """Parse the header and block index; ``data`` must reach ``index_end``"""
+    magic, channels, bits, sample_rate, frames, block_frames, blocks = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not an encoded audio blob")
+    offsets = np.frombuffer(data, "<u8", blocks + 1, _HEADER.size)
+    return CodecHeader(channels, bits, sample_rate, frames, block_frames, offsets)
+
+
+def block_range(header: CodecHeader, start_frame: int, end_frame: int) -> Tuple[int, int]:
+    """Blocks ``[first, last)`` overlapping a frame range"""
+    first = start_frame // header.block_frames
+    last = min(-(-end_frame // header.block_frames), header.blocks)
+    return first, max(last, first)
+
+
+def decode_blocks(header: CodecHeader, payload: bytes, first: int, last: int) -> np.ndarray:
+    """Decode blocks ``[first, last)`` from their payload bytes to (frames, channels) int32"""
+    base = int(header.offsets[first])
+    out = []
+    for block in range(first, last):
+        start, end = int(header.offsets[block]) - base, int(header.offsets[block + 1]) - base
+        frames = min(header.block_frames, header.frames - block * header.block_frames)
+        out.append(_decode_block(payload[start:end], header.channels, frames))
+    if not out:
+        return np.zeros((0, header.channels), np.int32)
+    return np.concatenate(out, axis=1).T
+
+
+def _timed_decode(header: CodecHeader, payload: bytes, first: int, last: int) -> np.ndarray:
+    with timed("codec"):
+        return decode_blocks(header, payload, first, last)
+
+
+def decode_wav_file(data: bytes) -> bytes:
+    """Rebuild the canonical WAV file of a whole encoded blob"""
+    header = parse_header(data)
+    ints = decode_blocks(header, data[header.payload_offset:], 0, header.blocks)
+    return wav_header(header.frames, header.channels, header.sample_rate, header.bits) + _ints_to_pcm(ints, header.bits)
+
+
+class EncodedReader:
+    """Byte-range reads of the WAV file an encoded blob decodes to"""
+
+    def __init__(self, header: CodecHeader, fetch: ByteReader):
+        self.header = header
+        self.fetch = fetch
+        self.wav_header = wav_header(header.frames, header.channels, header.sample_rate, header.bits)
+        # The most recently decoded block; sequential readers straddle block edges
+        self.last_block: Optional[Tuple[int, np.ndarray]] = None
+
+    @classmethod
+    async def open(cls, fetch: ByteReader, size: int) -> "EncodedReader":
+        head = await fetch(0, min(_HEADER.size, size))
+        blocks = _HEADER.unpack_from(head, 0)[-1] if len(head) == _HEADER.size and is_encoded(head) else -1
+        if blocks < 0 or index_end(blocks) > size:
+            raise ValueError("Not an encoded audio blob")
+        return cls(parse_header(head + await fetch(len(head), index_end(blocks))), fetch)
+
+    @property
+    def size(self) -> int:
+        return self.header.wav_size
+
+    async def frames(self, start: int, end: int) -> np.ndarray:
+        """Integer samples of frames ``[start, end)``"""
+        header = self.header
+        end = min(end, header.frames)
+        if start >= end:
+            return np.zeros((0, header.channels), np.int32)
+        first, last = block_range(header, start, end)
+        decoded = []
+        fetch_from = first
+        if self.last_block and self.last_block[0] == first:
+            decoded.append(self.last_block[1])
+            fetch_from += 1
+        if fetch_from < last:
+            payload = await self.fetch(header.payload_offset + int(header.offsets[fetch_from]),
+                                       header.payload_offset + int(header.offsets[last]))
+            # zlib and numpy release the GIL, so tracks decode in parallel off the loop
+            decoded.append(await asyncio.to_thread(_timed_decode, header, payload, fetch_from, last))
+        ints = np.concatenate(decoded) if len(decoded) > 1 else decoded[0]
+        self.last_block = (last - 1, ints[(last - 1 - first) * header.block_frames:])
+        origin = first * header.block_frames
+        return ints[start - origin:end - origin]
+
+    async def read(self, start: int, end: int) -> bytes:
+        end = min(end, self.size)
+        if start >= end:
+            return b""
+        parts = []
+        if start < WAV_HEADER_SIZE:
+            parts.append(self.wav_header[start:min(end, WAV_HEADER_SIZE)])
+        if end > WAV_HEADER_SIZE:
+            frame_size = self.header.frame_size
+            byte_start = max(start, WAV_HEADER_SIZE) - WAV_HEADER_SIZE
+            byte_end = end - WAV_HEADER_SIZE
+            first_frame = byte_start // frame_size
+            ints = await self.frames(first_frame, -(-byte_end // frame_size))
+            pcm = _ints_to_pcm(ints, self.header.bits)
+            skip = byte_start - first_frame * frame_size
+            parts.append(pcm[skip:skip + byte_end - byte_start])
+        return b"".join(parts)
+
+    async def iter_range(self, start: int, end: int):
+        for position in range(start, end, STREAM_WINDOW):
+            yield await self.read(position, min(position + STREAM_WINDOW, end))
@@ -0,0 +1,137 @@
+"""Multi-resolution waveform peak pyramids.
+
+Level 0 holds the min/max of every ``BASE_BUCKET`` frames (all channels
+folded together); each further level halves the resolution. Values are
+quantized to int8, so a five-minute track costs roughly 200 KB for the whole
+pyramid and any zoom level can be served without touching the audio.
+Pyramids are immutable once stored, so ``PyramidCache`` keeps recently
+drawn ones by reference instead of reading them back for every request.
+"""
+import struct
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+BASE_BUCKET = 256
+MAGIC = b"PKS1"
+_HEADER = struct.Struct("<4sIQII")  # magic, sample rate, frames, base bucket, levels
+
+
+class PeakPyramid(NamedTuple):
+    sample_rate: int
+    frames: int
+    base_bucket: int
+    levels: List[np.ndarray]  # int8 arrays shaped (buckets, 2) of (min, max)
+
+    def bucket_size(self, level: int) -> int:
+        return self.base_bucket << level
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels)
+
+
+def _quantize(values: np.ndarray) -> np.ndarray:
+    return np.clip(np.round(values * 127.0), -127, 127).astype(np.int8)
+
+
+def build_pyramid(samples: np.ndarray, sample_rate: int, base_bucket: int = BASE_BUCKET) -> PeakPyramid:
+    """Compute min/max buckets at every power-of-two resolution"""
+    frames = len(samples)
+    buckets = max(-(-frames // base_bucket), 1)
+    padded = np.zeros((buckets * base_bucket, samples.shape[1]), np.float32)
+    padded[:frames] = samples
+    grouped = padded.reshape(buckets, -1)
+    lows, highs = grouped.min(axis=1), grouped.max(axis=1)
+
+    levels = [np.stack([_quantize(lows), _quantize(highs)], axis=1)]
+    while len(levels[-1]) > 1:
+        prev = levels[-1]
+        if len(prev) % 2:
+            prev = np.concatenate([prev, prev[-1:]])
+        pairs = prev.reshape(-1, 2, 2)
+        levels.append(np.stack([pairs[:, :, 0].min(axis=1), pairs[:, :, 1].max(axis=1)], axis=1))
+    return PeakPyramid(sample_rate, frames, base_bucket, levels)
+
+
+def serialize(pyramid: PeakPyramid) -> bytes:
+    parts = [_HEADER.pack(MAGIC, pyramid.sample_rate, pyramid.frames, pyramid.base_bucket, len(pyramid.levels))]
+    parts += [struct.pack("<I", len(level)) for level in pyramid.levels]
+    parts += [level.tobytes() for level in pyramid.levels]
+    return b"".join(parts)
+
+
+def deserialize(data: bytes) -> PeakPyramid:
+    magic, sample_rate, frames, base_bucket, count = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a peak pyramid")
+    offset = _HEADER.size
+    sizes = struct.unpack_from(f"<{count}I", data, offset)
+    offset += 4 * count
+    levels = []
+    for size in sizes:
+        levels.append(np.frombuffer(data, np.int8, size * 2, offset).reshape(size, 2))
+        offset += size * 2
+    return PeakPyramid(sample_rate, frames, base_bucket, levels)
+
+
+def query(pyramid: PeakPyramid, start: float, end: float, pixels: int) -> dict:
+    """Min/max per pixel for ``[start, end)`` seconds, in O(pixels); an empty range raises ValueError"""
+    if end <= start:
+        raise ValueError("end must be after start")
+    first = int(max(start, 0.0) * pyramid.sample_rate)
+    last = int(min(end, pyramid.frames / pyramid.sample_rate) * pyramid.sample_rate)
+    # A range inside one frame still covers that frame
+    last = max(last, first + 1)
+    frames_per_pixel = (last - first) / pixels
+
+    # Coarsest level that still has at least one bucket per pixel
+    level = 0
+    while level + 1 < len(pyramid.levels) and pyramid.bucket_size(level + 1) <= frames_per_pixel:
+        level += 1
+    data = pyramid.levels[level]
+    bucket = pyramid.bucket_size(level)
+
+    edges = first + np.arange(pixels + 1) * frames_per_pixel
+    lo = np.minimum((edges[:-1] // bucket).astype(np.int64), len(data) - 1)
+    hi = np.maximum(np.minimum(np.ceil(edges[1:] / bucket).astype(np.int64), len(data)), lo + 1)
+    # With bucket <= frames_per_pixel < 2 * bucket a pixel overlaps at most
+    # three buckets, so three gathers cover every pixel
+    mid = np.minimum(lo + 1, hi - 1)
+    mins = np.minimum(np.minimum(data[lo, 0], data[mid, 0]), data[hi - 1, 0])
+    maxs = np.maximum(np.maximum(data[lo, 1], data[mid, 1]), data[hi - 1, 1])
+
+    return {
+        "start": first / pyramid.sample_rate,
+        "end": last / pyramid.sample_rate,
+        "pixels": pixels,
+        "frames_per_pixel": frames_per_pixel,
+        "bucket_size": bucket,
+        "min": (mins / 127.0).round(4).tolist(),
+        "max": (maxs / 127.0).round(4).tolist(),
+    }
+
+
+class PyramidCache:
+    """Byte-bounded LRU of deserialized pyramids keyed by their stored reference"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.entries: "OrderedDict[str, PeakPyramid]" = OrderedDict()
+        self.bytes = 0
+
+    def get(self, ref: str) -> Optional[PeakPyramid]:
+        pyramid = self.entries.get(ref)
+        if pyramid is not None:
+            self.entries.move_to_end(ref)
+        return pyramid
+
+    def put(self, ref: str, pyramid: PeakPyramid):
+        if pyramid.nbytes > self.max_bytes or ref in self.entries:
+            return
+        self.entries[ref] = pyramid
+        self.bytes += pyramid.nbytes
+        while self.bytes > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= evicted.nbytes
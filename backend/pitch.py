@@ -0,0 +1,217 @@
+"""Pitch detection and correction for the Auto-Tune effect.
+
+Pitch is detected with YIN: every analysis frame's difference function is
+built from an FFT cross-correlation and running energy sums, so a whole batch
+of frames is one pair of FFTs. The resulting pitch track depends only on the
+audio, so it is computed once, serialized and reused while the Correction
+and Speed parameters change.
+
+Correction snaps the track to the nearest note of a key's scale (chromatic
+without a key), smooths the pitch shift with the retune speed and
+resynthesizes with TD-PSOLA, placing pitch-synchronous grains at the shifted
+period, which moves pitch without moving time.
+"""
+import struct
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+
+from dsp import effect_params, one_pole
+from metrics import timed
+from sample_catalog import parse_key
+
+EFFECT_TYPE = "Auto-Tune"
+PARAMETERS = {"Correction": 85.0, "Speed": 50.0}
+
+HOP = 256
+WINDOW = 1024  # integration window of the YIN difference function
+MIN_FREQUENCY = 70.0
+MAX_FREQUENCY = 1000.0
+THRESHOLD = 0.15
+SILENCE_RMS = 1e-3
+BATCH_FRAMES = 1024
+
+# Grain rate used through unvoiced frames
+UNVOICED_RATE = 100.0
+# Retune time constant at Speed 0; Speed 100 retunes instantly
+MAX_RETUNE_SECONDS = 0.2
+
+MAJOR = (0, 2, 4, 5, 7, 9, 11)
+MINOR = (0, 2, 3, 5, 7, 8, 10)
+
+MAGIC = b"PIT1"
+_HEADER = struct.Struct("<4sIII")  # magic, sample rate, hop, frames
+
+
+class PitchTrack(NamedTuple):
+    sample_rate: int
+    hop: int
+    f0: np.ndarray  # float32 Hz per frame, 0 where unvoiced
+
+
+def serialize(track: PitchTrack) -> bytes:
+    f0 = track.f0.astype("<f4")
+    return _HEADER.pack(MAGIC, track.sample_rate, track.hop, len(f0)) + f0.tobytes()
+
+
+def deserialize(data: bytes) -> PitchTrack:
+    magic, sample_rate, hop, frames = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a pitch track")
+    return PitchTrack(sample_rate, hop, np.frombuffer(data, "<f4", frames, _HEADER.size))
+
+
+def _yin(frames: np.ndarray, sample_rate: int) -> np.ndarray:
+    """f0 of each row of ``frames`` (each ``WINDOW + max lag`` long), 0 if unvoiced"""
+    max_lag = frames.shape[1] - WINDOW
+    min_lag = max(int(sample_rate / MAX_FREQUENCY), 2)
+    size = 1 << int(np.ceil(np.log2(frames.shape[1] + WINDOW)))
+
+    head = np.fft.rfft(frames[:, :WINDOW], size, axis=1)
+    whole = np.fft.rfft(frames, size, axis=1)
+    correlation = np.fft.irfft(np.conj(head) * whole, size, axis=1)[:, :max_lag + 1]
+    energy = np.concatenate([np.zeros((len(frames), 1), frames.dtype), np.cumsum(frames ** 2, axis=1)], axis=1)
+    shifted = energy[:, WINDOW:WINDOW + max_lag + 1] - energy[:, :max_lag + 1]
+    difference = np.maximum(shifted[:, :1] + shifted - 2 * correlation, 0.0)
+
+    # Cumulative mean normalized difference
+    lags = np.arange(1, max_lag + 1)
+    running = np.cumsum(difference[:, 1:], axis=1)
+    normalized = np.ones_like(difference)
+    normalized[:, 1:] = difference[:, 1:] * lags / np.maximum(running, 1e-12)
+
+    # First dip under the threshold, followed to its local minimum
+    candidates = normalized[:, min_lag:max_lag]
+    dips = (candidates < THRESHOLD) & (candidates <= normalized[:, min_lag + 1:max_lag + 1])
+    voiced = dips.any(axis=1)
+    lag = dips.argmax(axis=1) + min_lag
+
+    # Parabolic interpolation around the chosen lag
+    rows = np.arange(len(frames))
+    before = normalized[rows, lag - 1]
+    at = normalized[rows, lag]
+    after = normalized[rows, np.minimum(lag + 1, max_lag)]
+    curvature = before - 2 * at + after
+    offset = np.where(np.abs(curvature) > 1e-12, 0.5 * (before - after) / np.where(curvature == 0, 1, curvature), 0.0)
+    f0 = sample_rate / (lag + np.clip(offset, -1, 1))
+
+    loud = np.sqrt(energy[:, WINDOW] / WINDOW) > SILENCE_RMS
+    return np.where(voiced & loud, f0, 0.0).astype(np.float32)
+
+
+def detect_pitch(samples: np.ndarray, sample_rate: int) -> PitchTrack:
+    """Pitch track of ``(frames, channels)`` audio, one value per ``HOP`` frames"""
+    mono = samples.mean(axis=1, dtype=np.float32)
+    max_lag = int(np.ceil(sample_rate / MIN_FREQUENCY))
+    length = WINDOW + max_lag
+    count = -(-len(mono) // HOP)
+    # Frame i is centred on sample i * HOP
+    padded = np.pad(mono, (WINDOW // 2, (count - 1) * HOP + length))
+    views = np.lib.stride_tricks.sliding_window_view(padded, length)[::HOP][:count]
+
+    f0 = np.zeros(count, np.float32)
+    with timed("pitch_detect"):
+        for start in range(0, count, BATCH_FRAMES):
+            f0[start:start + BATCH_FRAMES] = _yin(views[start:start + BATCH_FRAMES].astype(np.float64), sample_rate)
+    return PitchTrack(sample_rate, HOP, f0)
+
+
+def scale_classes(key: Optional[str]) -> List[int]:
+    """Pitch classes allowed by ``key``'s major or natural minor scale; all twelve without a key"""
+    if not key:
+        return list(range(12))
+    tonic, minor = parse_key(key)
+    return sorted((tonic + step) % 12 for step in (MINOR if minor else MAJOR))
+
+
+def snap(midi: np.ndarray, classes: List[int]) -> np.ndarray:
+    """Nearest note in ``classes`` for each fractional MIDI pitch"""
+    candidates = np.round(midi)[:, None] + np.arange(-2, 3)
+    allowed = np.isin(candidates.astype(np.int64) % 12, classes)
+    distance = np.where(allowed, np.abs(candidates - midi[:, None]), np.inf)
+    return candidates[np.arange(len(midi)), distance.argmin(axis=1)]
+
+
+def correction_curve(track: PitchTrack, correction: float, speed: float, key: Optional[str]) -> np.ndarray:
+    """Pitch shift in semitones per pitch frame"""
+    voiced = track.f0 > 0
+    midi = np.zeros(len(track.f0))
+    midi[voiced] = 69 + 12 * np.log2(track.f0[voiced] / 440.0)
+    shift = np.where(voiced, snap(midi, scale_classes(key)) - midi, 0.0) * min(max(correction, 0.0), 100.0) / 100.0
+
+    retune = (1 - min(max(speed, 0.0), 100.0) / 100.0) * MAX_RETUNE_SECONDS
+    if retune <= 0:
+        return shift
+    coeff = float(np.exp(-track.hop / (retune * track.sample_rate)))
+    smoothed, _ = one_pole((1 - coeff) * shift[:, None], coeff, np.zeros(1))
+    return smoothed[:, 0]
+
+
+def _marks(frequency: np.ndarray, hop: int) -> np.ndarray:
+    """Sample positions of successive cycles of a per-frame frequency (cycles per sample)"""
+    cycles = np.concatenate([[0.0], np.cumsum(frequency * hop)])
+    times = np.arange(len(cycles)) * float(hop)
+    return np.interp(np.arange(np.floor(cycles[-1]) + 1), cycles, times)
+
+
+def shift_pitch(samples: np.ndarray, track: PitchTrack, semitones: np.ndarray) -> np.ndarray:
+    """TD-PSOLA resynthesis with a pitch shift in semitones per pitch frame.
+
+    Grains two source periods long are cut at analysis pitch marks and laid
+    down at synthesis marks spaced by the shifted period, which moves pitch
+    but keeps timing and formants. Unvoiced frames use a fixed grain rate and
+    no shift, so they pass through unchanged.
+    """
+    frames, channels = samples.shape
+    source = np.where(track.f0 > 0, track.f0, UNVOICED_RATE) / track.sample_rate
+    analysis = _marks(source, track.hop)
+    synthesis = _marks(source * 2.0 ** (semitones / 12.0), track.hop)
+    synthesis = synthesis[synthesis < frames]
+
+    # Each synthesis mark reuses the nearest analysis grain
+    after = np.clip(np.searchsorted(analysis, synthesis), 1, len(analysis) - 1)
+    nearest = np.where(synthesis - analysis[after - 1] < analysis[after] - synthesis, after - 1, after)
+    # Pitch frames cover the audio rounded up to a hop, so marks can round past its end
+    grain_at = np.clip(np.rint(analysis[nearest]).astype(np.int64), 0, frames - 1)
+    place_at = np.clip(np.rint(synthesis).astype(np.int64), 0, frames - 1)
+    period = 1.0 / source[np.minimum(grain_at // track.hop, len(source) - 1)]
+    # Marks get denser as pitch rises, so scale grains to keep the source level
+    level = 2.0 ** (-semitones[np.minimum(place_at // track.hop, len(semitones) - 1)] / 12.0)
+
+    reach = int(np.ceil(track.sample_rate / min(MIN_FREQUENCY, UNVOICED_RATE)))
+    offsets = np.arange(-reach, reach + 1)
+    padded = np.pad(samples, ((reach, reach), (0, 0)))
+    out = np.zeros((frames + 2 * reach, channels), np.float64)
+    for start in range(0, len(place_at), BATCH_FRAMES):
+        batch = slice(start, start + BATCH_FRAMES)
+        # Hann window spanning one source period either side of the mark
+        u = offsets / period[batch, None]
+        window = np.where(np.abs(u) < 1, 0.5 + 0.5 * np.cos(np.pi * u), 0.0) * level[batch, None]
+        grains = padded[grain_at[batch, None] + offsets + reach] * window[..., None]
+        first = int(place_at[batch].min())
+        positions = (place_at[batch, None] + offsets + reach - first).ravel()
+        span = int(positions.max()) + 1
+        for channel in range(channels):
+            out[first:first + span, channel] += np.bincount(
+                positions, grains[..., channel].ravel(), minlength=span)
+    return out[reach:reach + frames].astype(np.float32)
+
+
+def autotune_params(effects: List[dict]) -> Optional[dict]:
+    """Parameters of the first enabled Auto-Tune effect, or None"""
+    for effect in effects:
+        if effect.get("type") == EFFECT_TYPE and effect.get("enabled", True):
+            params = effect_params(effect)
+            return {name: params.get(name, default) for name, default in PARAMETERS.items()}
+    return None
+
+
+def autotune(samples: np.ndarray, track: PitchTrack, params: dict, key: Optional[str] = None) -> np.ndarray:
+    """Pitch-correct audio using its precomputed pitch track"""
+    if len(samples) < 2 or not params["Correction"]:
+        return samples
+    curve = correction_curve(track, params["Correction"], params["Speed"], key)
+    if not np.any(curve):
+        return samples
+    with timed("pitch_correct"):
+        return shift_pitch(samples, track, curve)
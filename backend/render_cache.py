@@ -0,0 +1,167 @@
+"""Two-tier cache for processed audio.
+
+Entries are keyed on the content hash of the input audio, the canonicalized
+effect chain and the sample rate, so the same input rendered with the same
+settings is only processed once. A byte-bounded in-memory LRU sits in front
+of a size-bounded directory on disk; both evict least recently used entries.
+
+Job workers in other processes open a ``shared`` view of the same directory:
+it reads any entry on disk and writes new ones, but leaves indexing and
+eviction to the owning cache, which ``adopts`` what a worker wrote.
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from dsp import active_effects, effect_params
+
+
+def canonical_effects(effects: List[dict]) -> list:
+    """Reduce an effect chain to what affects the output: order, type, params"""
+    return [
+        [e["type"], sorted(effect_params(e).items())]
+        for e in active_effects(effects)
+    ]
+
+
+def cache_key(audio_hash: str, effects: List[dict], sample_rate: int, *extra) -> str:
+    payload = json.dumps([audio_hash, canonical_effects(effects), sample_rate, *extra], separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class RenderCache:
+    def __init__(self, directory: Path, max_memory_bytes: int, max_disk_bytes: int, shared: bool = False):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_memory_bytes = max_memory_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.shared = shared
+        # Entries a shared view wrote, for the owning cache to adopt
+        self.written: List[Tuple[str, int]] = []
+        self.memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self.memory_bytes = 0
+        self.disk: "OrderedDict[str, int]" = OrderedDict()
+        self.disk_bytes = 0
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(
+            ("memory_hits", "disk_hits", "misses", "memory_evictions", "disk_evictions", "writes"), 0
+        )
+        if not shared:
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        """Rebuild the disk LRU from file mtimes, dropping stale temporaries"""
+        entries = []
+        for path in self.directory.iterdir():
+            if path.name.startswith("."):
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.name, stat.st_size))
+        for _, key, size in sorted(entries):
+            self.disk[key] = size
+            self.disk_bytes += size
+        self._evict_disk()
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            data = self.memory.get(key)
+            if data is not None:
+                self.memory.move_to_end(key)
+                self.counters["memory_hits"] += 1
+                return data
+            if key in self.disk:
+                self.disk.move_to_end(key)
+            elif not self.shared:
+                self.counters["misses"] += 1
+                return None
+        try:
+            data = self._path(key).read_bytes()
+        except FileNotFoundError:
+            with self.lock:
+                self._forget_disk(key)
+                self.counters["misses"] += 1
+            return None
+        os.utime(self._path(key))
+        with self.lock:
+            self.counters["disk_hits"] += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes):
+        # Written under a temporary name so readers never see a partial entry
+        temp_path = self.directory / f".{key}.{uuid.uuid4().hex}.tmp"
+        temp_path.write_bytes(data)
+        os.replace(temp_path, self._path(key))
+        with self.lock:
+            self.counters["writes"] += 1
+            if self.shared:
+                self.written.append((key, len(data)))
+            else:
+                self._index(key, len(data))
+            self._remember(key, data)
+
+    def adopt(self, entries: List[Tuple[str, int]]):
+        """Index entries a shared view wrote to this cache's directory"""
+        with self.lock:
+            for key, size in entries:
+                if self._path(key).exists():
+                    self._index(key, size)
+
+    def contains(self, key: str) -> bool:
+        """Whether an entry exists, without counting a hit or touching its recency"""
+        with self.lock:
+            return key in self.memory or key in self.disk
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                **self.counters,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory_bytes,
+                "max_memory_bytes": self.max_memory_bytes,
+                "disk_entries": len(self.disk),
+                "disk_bytes": self.disk_bytes,
+                "max_disk_bytes": self.max_disk_bytes,
+            }
+
+    def _index(self, key: str, size: int):
+        """Record an entry in the disk tier; callers hold the lock"""
+        self._forget_disk(key)
+        self.disk[key] = size
+        self.disk_bytes += size
+        self._evict_disk()
+
+    def _remember(self, key: str, data: bytes):
+        """Insert into the memory tier; callers hold the lock"""
+        if len(data) > self.max_memory_bytes:
+            return
+        old = self.memory.pop(key, None)
+        if old is not None:
+            self.memory_bytes -= len(old)
+        self.memory[key] = data
+        self.memory_bytes += len(data)
+        while self.memory_bytes > self.max_memory_bytes:
+            _, evicted = self.memory.popitem(last=False)
+            self.memory_bytes -= len(evicted)
+            self.counters["memory_evictions"] += 1
+
+    def _forget_disk(self, key: str):
+        size = self.disk.pop(key, None)
+        if size is not None:
+            self.disk_bytes -= size
+
+    def _evict_disk(self):
+        while self.disk_bytes > self.max_disk_bytes and self.disk:
+            key, size = self.disk.popitem(last=False)
+            self.disk_bytes -= size
+            self._path(key).unlink(missing_ok=True)
+            self.counters["disk_evictions"] += 1
@@ -0,0 +1,175 @@
+"""In-memory search index over the sample library.
+
+Samples live in the ``samples`` collection; this process keeps every
+sample's metadata in an index built once at startup and extended on each
+insert. Tags, keys and categories map to sets of sample ordinals, BPM and
+duration are kept as sorted ``(value, ordinal)`` lists for range queries,
+and name words are kept sorted for prefix search. A query intersects the
+candidate sets from the most selective filter outwards, so its cost tracks
+the size of the answer rather than the size of the library.
+"""
+import bisect
+import heapq
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+NOTE_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+_NOTE_INDEX = {
+    "C": 0, "D": 2, "E": 4, "F": 5, "G": 7, "A": 9, "B": 11,
+}
+_KEY_PATTERN = re.compile(r"^\s*([A-Ga-g])([#b]?)\s*(m|min|minor|maj|major)?\s*$")
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def parse_key(key: str) -> Tuple[int, bool]:
+    """``(pitch class, is_minor)`` of names like ``C``, ``F#m``, ``Bb minor``"""
+    match = _KEY_PATTERN.match(key or "")
+    if not match:
+        raise ValueError(f"Unrecognized key: {key}")
+    letter, accidental, mode = match.groups()
+    pitch = _NOTE_INDEX[letter.upper()] + {"#": 1, "b": -1}.get(accidental, 0)
+    return pitch % 12, (mode or "").lower() in ("m", "min", "minor")
+
+
+def key_name(pitch: int, minor: bool) -> str:
+    return NOTE_NAMES[pitch % 12] + ("m" if minor else "")
+
+
+def normalize_key(key: str) -> str:
+    return key_name(*parse_key(key))
+
+
+def compatible_keys(key: str) -> List[str]:
+    """Keys that mix harmonically: the key, its relative and its fifth neighbours"""
+    pitch, minor = parse_key(key)
+    relative = (pitch + 3) % 12 if minor else (pitch - 3) % 12
+    return [
+        key_name(pitch, minor),
+        key_name(relative, not minor),
+        key_name(pitch + 7, minor),
+        key_name(pitch + 5, minor),
+    ]
+
+
+def _words(name: str) -> Set[str]:
+    return set(_WORD.findall(name.lower()))
+
+
+class SampleIndex:
+    def __init__(self):
+        self.samples: List[dict] = []
+        self.ordinals: Dict[str, int] = {}
+        self.tags: Dict[str, Set[int]] = {}
+        self.keys: Dict[str, Set[int]] = {}
+        self.categories: Dict[str, Set[int]] = {}
+        self.bpm: List[Tuple[float, int]] = []
+        self.duration: List[Tuple[float, int]] = []
+        self.words: List[Tuple[str, int]] = []
+
+    def __len__(self) -> int:
+        return len(self.samples)
+
+    def build(self, samples: Iterable[dict]):
+        """Index many samples at once, sorting each range list a single time"""
+        for sample in samples:
+            self._add(sample, bulk=True)
+        self.bpm.sort()
+        self.duration.sort()
+        self.words.sort()
+
+    def add(self, sample: dict):
+        self._add(sample, bulk=False)
+
+    def _add(self, sample: dict, bulk: bool):
+        if sample["id"] in self.ordinals:
+            return
+        ordinal = len(self.samples)
+        self.samples.append(sample)
+        self.ordinals[sample["id"]] = ordinal
+        insert = list.append if bulk else bisect.insort
+        for tag in {t.lower() for t in sample.get("tags", [])}:
+            self.tags.setdefault(tag, set()).add(ordinal)
+        if sample.get("key"):
+            self.keys.setdefault(sample["key"], set()).add(ordinal)
+        if sample.get("category"):
+            self.categories.setdefault(sample["category"], set()).add(ordinal)
+        if sample.get("bpm") is not None:
+            insert(self.bpm, (sample["bpm"], ordinal))
+        insert(self.duration, (sample.get("duration", 0.0), ordinal))
+        for word in _words(sample["name"]):
+            insert(self.words, (word, ordinal))
+
+    def get(self, sample_id: str) -> Optional[dict]:
+        ordinal = self.ordinals.get(sample_id)
+        return None if ordinal is None else self.samples[ordinal]
+
+    @staticmethod
+    def _range(values: List[Tuple[float, int]], low: Optional[float], high: Optional[float]) -> Tuple[int, int]:
+        start = 0 if low is None else bisect.bisect_left(values, (low, -1))
+        end = len(values) if high is None else bisect.bisect_right(values, (high, float("inf")))
+        return start, end
+
+    def _prefix(self, prefix: str) -> Set[int]:
+        start = bisect.bisect_left(self.words, (prefix, -1))
+        end = bisect.bisect_left(self.words, (prefix + "\uffff", -1))
+        return {ordinal for _, ordinal in self.words[start:end]}
+
+    def search(self, query: Optional[str] = None, tags: Iterable[str] = (), key: Optional[str] = None,
+               compatible: bool = False, category: Optional[str] = None,
+               bpm_min: Optional[float] = None, bpm_max: Optional[float] = None,
+               duration_min: Optional[float] = None, duration_max: Optional[float] = None,
+               limit: int = 50, offset: int = 0) -> Tuple[int, List[dict]]:
+        """Samples matching every given filter, in insertion order; returns ``(total, page)``"""
+        candidates: List[Set[int]] = []
+        for tag in {t.lower() for t in tags}:
+            candidates.append(self.tags.get(tag, set()))
+        if key:
+            wanted = compatible_keys(key) if compatible else [normalize_key(key)]
+            candidates.append(set().union(*(self.keys.get(k, set()) for k in wanted)))
+        if category:
+            candidates.append(self.categories.get(category, set()))
+        for word in _words(query or ""):
+            candidates.append(self._prefix(word))
+
+        ranges = []
+        if bpm_min is not None or bpm_max is not None:
+            ranges.append((self.bpm, "bpm", bpm_min, bpm_max, self._range(self.bpm, bpm_min, bpm_max)))
+        if duration_min is not None or duration_max is not None:
+            ranges.append((self.duration, "duration", duration_min, duration_max,
+                           self._range(self.duration, duration_min, duration_max)))
+
+        if candidates:
+            candidates.sort(key=len)
+            matches = set(candidates[0])
+            for other in candidates[1:]:
+                if not matches:
+                    break
+                matches &= other
+        elif ranges:
+            # Seed from the narrowest range slice instead of the whole library
+            ranges.sort(key=lambda r: r[4][1] - r[4][0])
+            values, _, _, _, (start, end) = ranges.pop(0)
+            matches = {ordinal for _, ordinal in values[start:end]}
+        else:
+            matches = None
+
+        for values, field, low, high, (start, end) in ranges:
+            if matches is None:
+                break
+            if len(matches) < end - start:
+                # Cheaper to check the survivors than to materialize the slice
+                matches = {o for o in matches if self._within(self.samples[o].get(field), low, high)}
+            else:
+                matches &= {ordinal for _, ordinal in values[start:end]}
+
+        if matches is None:
+            total = len(self.samples)
+            return total, self.samples[offset:offset + limit]
+        page = heapq.nsmallest(offset + limit, matches)[offset:]
+        return len(matches), [self.samples[o] for o in page]
+
+    @staticmethod
+    def _within(value, low, high) -> bool:
+        if value is None:
+            return False
+        return (low is None or value >= low) and (high is None or value <= high)
@@ -0,0 +1,155 @@
+"""Step-sequencer pattern renderer.
+
+Drum samples are decoded once per sample rate into an in-process bank. A
+pattern is rendered by building one loop of per-pad impulse trains and
+convolving all pads with their samples in a single batched FFT; the loop is
+then folded so sample tails ring into the following bar and tiled out to
+the requested number of bars. Rendering cost is dominated by that one loop,
+so long patterns take about as long as short ones.
+"""
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+import numpy as np
+
+from audio_io import decode_wav
+
+# Pads exposed by frontend/app/sequencer.tsx; samples are loaded from <pad>.wav
+DRUM_PADS = (
+    "kick", "snare", "hihat", "openhat", "crash", "ride",
+    "tom1", "tom2", "clap", "perc", "shaker", "cowbell",
+)
+STEPS_PER_BEAT = 4
+SAMPLES_DIR = Path(os.environ.get("DRUM_SAMPLES_DIR", Path(__file__).parent / "drum_samples"))
+
+
+def _envelope(t, decay):
+    return np.exp(-t / decay)
+
+
+def synthesize_voice(pad: str, sample_rate: int) -> np.ndarray:
+    """Built-in drum voice used when no sample file is installed for a pad"""
+    rng = np.random.default_rng(DRUM_PADS.index(pad))
+    length = {"crash": 2.0, "ride": 1.5, "openhat": 0.6}.get(pad, 0.5)
+    t = np.arange(int(length * sample_rate)) / sample_rate
+    noise = rng.uniform(-1.0, 1.0, len(t))
+    bright = np.diff(noise, prepend=0.0) * 0.5
+
+    def sweep(start, end, decay):
+        freq = end + (start - end) * _envelope(t, decay / 3)
+        return np.sin(2 * np.pi * np.cumsum(freq) / sample_rate) * _envelope(t, decay)
+
+    if pad == "kick":
+        voice = sweep(150.0, 48.0, 0.35)
+    elif pad == "snare":
+        voice = 0.6 * noise * _envelope(t, 0.12) + 0.5 * sweep(220.0, 180.0, 0.08)
+    elif pad == "hihat":
+        voice = bright * _envelope(t, 0.04)
+    elif pad == "openhat":
+        voice = bright * _envelope(t, 0.25)
+    elif pad == "crash":
+        voice = 0.8 * bright * _envelope(t, 0.9) + 0.2 * noise * _envelope(t, 0.3)
+    elif pad == "ride":
+        bell = sum(np.sin(2 * np.pi * f * t) for f in (2800.0, 3760.0, 5120.0)) / 3
+        voice = 0.5 * bright * _envelope(t, 0.6) + 0.3 * bell * _envelope(t, 0.8)
+    elif pad == "tom1":
+        voice = sweep(220.0, 140.0, 0.3)
+    elif pad == "tom2":
+        voice = sweep(150.0, 90.0, 0.35)
+    elif pad == "clap":
+        bursts = sum(((t >= d) & (t < d + 0.01)).astype(float) for d in (0.0, 0.012, 0.024))
+        voice = noise * (0.8 * bursts + 0.6 * (t >= 0.024) * _envelope(np.maximum(t - 0.024, 0), 0.12))
+    elif pad == "perc":
+        voice = np.sin(2 * np.pi * 820.0 * t) * _envelope(t, 0.06)
+    elif pad == "shaker":
+        voice = bright * np.minimum(t / 0.02, 1.0) * _envelope(t, 0.07)
+    else:  # cowbell
+        square = np.sign(np.sin(2 * np.pi * 545.0 * t)) + np.sign(np.sin(2 * np.pi * 815.0 * t))
+        voice = 0.35 * square * _envelope(t, 0.18)
+    return (voice / max(np.abs(voice).max(), 1e-9) * 0.9).astype(np.float32)
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """Linear-interpolation resampling of a mono signal"""
+    if source_rate == target_rate:
+        return samples
+    length = int(round(len(samples) * target_rate / source_rate))
+    positions = np.arange(length) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+class SampleBank:
+    """Decoded drum samples per sample rate, loaded once and kept in memory"""
+
+    def __init__(self, directory: Path = SAMPLES_DIR):
+        self.directory = Path(directory)
+        self.banks: Dict[int, Dict[str, np.ndarray]] = {}
+        self.lock = threading.Lock()
+
+    def _load(self, pad: str, sample_rate: int) -> np.ndarray:
+        path = self.directory / f"{pad}.wav"
+        if path.is_file():
+            samples, source_rate = decode_wav(path.read_bytes())
+            return resample(samples.mean(axis=1), source_rate, sample_rate)
+        return synthesize_voice(pad, sample_rate)
+
+    def bank(self, sample_rate: int) -> Dict[str, np.ndarray]:
+        with self.lock:
+            if sample_rate not in self.banks:
+                self.banks[sample_rate] = {pad: self._load(pad, sample_rate) for pad in DRUM_PADS}
+            return self.banks[sample_rate]
+
+
+def step_onsets(steps: int, bpm: float, swing: float, sample_rate: int) -> np.ndarray:
+    """Sample offset of every step in one loop; swing delays the off-beat 16ths"""
+    step_length = 60.0 / bpm / STEPS_PER_BEAT * sample_rate
+    onsets = np.arange(steps) * step_length
+    onsets[1::2] += swing * step_length
+    return np.round(onsets).astype(np.int64)
+
+
+def render_pattern(pattern: Dict[str, List[bool]], bpm: float, bars: int, bank: Dict[str, np.ndarray],
+                   sample_rate: int, swing: float = 0.0) -> np.ndarray:
+    """Render ``bars`` repetitions of a pattern to a mono float32 signal"""
+    rows = {pad: np.asarray(steps, dtype=np.float32) for pad, steps in pattern.items() if any(steps)}
+    steps = max((len(r) for r in pattern.values()), default=STEPS_PER_BEAT * 4)
+    loop_length = int(round(steps * 60.0 / bpm / STEPS_PER_BEAT * sample_rate))
+    total = loop_length * bars
+    if not rows:
+        return np.zeros(total, np.float32)
+
+    onsets = step_onsets(steps, bpm, swing, sample_rate)
+    longest = max(len(bank[pad]) for pad in rows)
+    size = 1 << int(np.ceil(np.log2(loop_length + longest)))
+
+    # One row per pad: an impulse train of its hits and its sample, convolved
+    # for every pad at once
+    impulses = np.zeros((len(rows), size), np.float32)
+    voices = np.zeros((len(rows), size), np.float32)
+    for i, (pad, row) in enumerate(rows.items()):
+        hits = np.nonzero(row)[0]
+        impulses[i, onsets[hits]] = row[hits]
+        voices[i, :len(bank[pad])] = bank[pad]
+    loop = np.fft.irfft(np.fft.rfft(impulses) * np.fft.rfft(voices), size).sum(axis=0)
+    loop = loop[:loop_length + longest]
+
+    # Fold the loop into bar-length segments: bar n hears segments 0..n, so
+    # tails carry into following bars without rendering every bar
+    segment_count = -(-len(loop) // loop_length)
+    segments = np.zeros((segment_count, loop_length), np.float32)
+    segments.reshape(-1)[:len(loop)] = loop
+    ramp = np.cumsum(segments, axis=0)
+
+    out = np.empty((bars, loop_length), np.float32)
+    lead = min(bars, segment_count)
+    out[:lead] = ramp[:lead]
+    out[lead:] = ramp[-1]
+    out = out.reshape(-1)[:total]
+
+    # Stacked hits can exceed full scale; pull the whole loop down instead of clipping
+    peak = float(np.abs(ramp).max())
+    if peak > 0.99:
+        out *= 0.99 / peak
+    return out
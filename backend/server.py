@@ -1,25 +1,86 @@
-from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import AfterValidator, BaseModel, Field
+from typing import Annotated, Dict, List, Literal, Optional
 import uuid
 from datetime import datetime
 import base64
+import math
+import binascii
+import json
 import io
 
+from audio_io import decode_wav, encode_wav, is_wav, parse_wav_header
+from audio_store import AudioStore, content_hash
+from bundle import BLOB_FIELDS, BundleError, BundleReader, BundleWriter, import_blobs
+from dsp import EFFECTS, active_effects, check_effects, process_signal
+from jobs import JobManager, QueueFull
+import metrics
+from metrics import MetricsMiddleware, MongoCommandListener, timed
+import pcm_codec
+from history import ProjectHistory
+from live import LiveSessions
+from mixer import audible_tracks
+from render_cache import RenderCache, cache_key
+from sample_catalog import SampleIndex, normalize_key
+from sequencer import DRUM_PADS, SampleBank, render_pattern
+from stems import SegmentedMixdown
+from storage import ProjectStore
+from stretch import tempo_ratio, time_stretch
+import loudness
+import peaks
+import pitch
+
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[
+    MongoCommandListener(size_sample_every=int(os.environ.get('MONGO_SIZE_SAMPLE_EVERY', 100))),
+])
 db = client[os.environ['DB_NAME']]
+audio_store = AudioStore(db)
+project_store = ProjectStore(
+    db,
+    cache_size=int(os.environ.get('PROJECT_CACHE_SIZE', 1024)),
+    cache_ttl=float(os.environ.get('PROJECT_CACHE_TTL', 30.0)),
+)
+
+# Versions of every project as deltas with periodic full checkpoints
+project_history = ProjectHistory(
+    db,
+    audio_store,
+    checkpoint_interval=int(os.environ.get('HISTORY_CHECKPOINT_INTERVAL', 20)),
+)
+
+sample_bank = SampleBank()
+# Search index over db.samples, loaded at startup and extended on insert
+sample_index = SampleIndex()
+
+# CPU-heavy renders run in worker processes, never on the event loop
+job_manager = JobManager(
+    max_workers=int(os.environ['JOB_WORKERS']) if os.environ.get('JOB_WORKERS') else None,
+    max_queue=int(os.environ['JOB_QUEUE_DEPTH']) if os.environ.get('JOB_QUEUE_DEPTH') else None,
+)
+
+# Processed-audio cache shared by /audio/process and project renders
+render_cache = RenderCache(
+    Path(os.environ.get('RENDER_CACHE_DIR', ROOT_DIR / 'render_cache')),
+    max_memory_bytes=int(os.environ.get('RENDER_CACHE_MEMORY_MB', 256)) * 1024 * 1024,
+    max_disk_bytes=int(os.environ.get('RENDER_CACHE_DISK_MB', 4096)) * 1024 * 1024,
+)
+
+# Peak pyramids recently drawn, so zooming and scrolling skip the chunk store
+peak_cache = peaks.PyramidCache(int(os.environ.get('PEAKS_CACHE_MB', 32)) * 1024 * 1024)
 
 # Create the main app without a prefix
 app = FastAPI()
@@ -28,11 +89,29 @@ app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
 # Audio Project Models
+class TrackLoudness(BaseModel):
+    # Levels in dBFS and loudness in LUFS; None where the audio is silent
+    peak_db: Optional[float] = None
+    rms_db: Optional[float] = None
+    integrated_lufs: Optional[float] = None
+    short_term_max_lufs: Optional[float] = None
+    loudness_range: Optional[float] = None  # LU
+
 class AudioTrack(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
-    audio_data: str  # base64 encoded audio data
-    duration: float
+    audio_data: Optional[str] = None  # legacy inline base64 audio, new tracks use audio_ref
+    audio_ref: Optional[str] = None  # content hash of the audio in the chunk store
+    audio_size: int = 0
+    content_type: str = "application/octet-stream"
+    encoding: Optional[str] = None  # storage codec of audio_ref; None means stored verbatim
+    peaks_ref: Optional[str] = None  # serialized peak pyramid in the chunk store
+    pitch_ref: Optional[str] = None  # serialized pitch track, detected on first Auto-Tune use
+    source_ref: Optional[str] = None  # unstretched audio for tracks conformed to the project tempo
+    source_bpm: Optional[float] = None
+    stretch_ratio: float = 1.0
+    duration: float  # measured from the audio for WAV, as reported by the client otherwise
+    loudness: Optional[TrackLoudness] = None  # measured at ingest for WAV audio
     volume: float = 1.0
     pan: float = 0.0  # -1 (left) to 1 (right)
     muted: bool = False
@@ -44,10 +123,64 @@ class AudioProject(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     name: str
     tempo: int = 120
+    key: Optional[str] = None  # e.g. "F#m"; Auto-Tune snaps to this key's scale
     tracks: List[AudioTrack] = []
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
+class ProjectSummary(BaseModel):
+    id: str
+    name: str
+    tempo: int
+    track_count: int
+    total_duration: float  # length of the longest track in seconds
+    created_at: datetime
+    updated_at: datetime
+    tracks: Optional[List[AudioTrack]] = None  # only with fields=tracks, never includes audio
+
+class ProjectPage(BaseModel):
+    items: List[ProjectSummary]
+    next_cursor: Optional[str] = None
+
+class HistoryEntry(BaseModel):
+    version: int
+    kind: str  # "checkpoint" or "delta"
+    summary: str
+    changes: int  # patch operations in a delta
+    created_at: datetime
+
+class HistoryPage(BaseModel):
+    items: List[HistoryEntry]
+    next_before: Optional[int] = None
+
+class TrackLoudnessEntry(BaseModel):
+    track_id: str
+    name: str
+    duration: float
+    loudness: Optional[TrackLoudness] = None
+    normalize_gain_db: Optional[float] = None  # gain a normalized render applies
+
+class ProjectLoudness(BaseModel):
+    target_lufs: float
+    tracks: List[TrackLoudnessEntry]
+
+class ProjectImportResult(BaseModel):
+    project: AudioProject
+    blobs_stored: int  # audio entries written to the chunk store
+    blobs_deduplicated: int  # audio entries skipped because they were already stored
+
+SUMMARY_EXTRA_FIELDS = {"tracks"}
+
+def scale_key(key: Optional[str]) -> Optional[str]:
+    """Normalize a musical key like ``Bb minor`` to ``A#m``; an invalid key fails validation"""
+    return normalize_key(key) if key else None
+
+# A musical key, normalized wherever a request or live delta sets one
+ScaleKey = Annotated[Optional[str], AfterValidator(scale_key)]
+
+# An effect chain whose parameters the engine can use
+EffectList = Annotated[List[dict], AfterValidator(check_effects)]
+
 class TrackCreate(BaseModel):
     name: str
     audio_data: str
@@ -56,6 +189,91 @@ class TrackCreate(BaseModel):
 class ProjectCreate(BaseModel):
     name: str
     tempo: Optional[int] = 120
+    key: ScaleKey = None
+
+class AudioProcessRequest(BaseModel):
+    audio_data: Optional[str] = None  # base64 encoded WAV...
+    project_id: Optional[str] = None  # ...or a project track, whose pitch track is kept
+    track_id: Optional[str] = None
+    effects: EffectList = []
+    key: ScaleKey = None  # Auto-Tune scale; defaults to the project key
+
+class AudioProcessResult(BaseModel):
+    processed_audio: str
+    effects_applied: List[dict]
+
+class AudioStretchRequest(BaseModel):
+    audio_data: str  # base64 encoded WAV
+    ratio: Optional[float] = Field(None, gt=0, le=8)  # output length / input length...
+    source_bpm: Optional[float] = Field(None, gt=0)  # ...or the tempo to conform from
+    target_bpm: Optional[float] = Field(None, gt=0)
+
+class AudioStretchResult(BaseModel):
+    stretched_audio: str
+    ratio: float
+
+class Sample(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    name: str
+    pack_id: Optional[str] = None
+    category: Optional[str] = None
+    duration: float
+    bpm: Optional[float] = None
+    key: Optional[str] = None
+    tags: List[str] = []
+    blessing: Optional[str] = None
+    audio_ref: Optional[str] = None
+    audio_size: int = 0
+    content_type: Optional[str] = None
+    encoding: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+class SampleCreate(BaseModel):
+    name: str
+    pack_id: Optional[str] = None
+    category: Optional[str] = None
+    duration: float = Field(..., ge=0)
+    bpm: Optional[float] = Field(None, gt=0)
+    key: Optional[str] = None
+    tags: List[str] = []
+    blessing: Optional[str] = None
+    audio_data: Optional[str] = None  # base64 audio, optional for catalog-only entries
+
+class SamplePage(BaseModel):
+    total: int
+    items: List[Sample]
+
+class SampleTrackCreate(BaseModel):
+    sample_id: str
+    name: Optional[str] = None
+    conform_tempo: bool = True  # stretch the sample from its bpm to the project tempo
+
+class SequencerRenderRequest(BaseModel):
+    pattern: Dict[str, List[bool]]  # pad id -> one flag per 16th-note step
+    bpm: float = Field(120.0, ge=20, le=300)
+    swing: float = Field(0.0, ge=0, le=0.75)  # fraction of a step to delay off-beats
+    bars: int = Field(4, ge=1, le=256)
+    sample_rate: int = Field(44100, ge=8000, le=192000)
+
+class JobCreate(BaseModel):
+    kind: Literal["process", "render"]
+    project_id: Optional[str] = None  # render: project to mix down
+    track_id: Optional[str] = None  # process: a track of project_id, whose pitch track is kept...
+    audio_ref: Optional[str] = None  # ...or stored audio to process...
+    audio_data: Optional[str] = None  # ...or base64 WAV sent inline
+    effects: EffectList = []
+    key: ScaleKey = None  # process: Auto-Tune scale
+    normalize_lufs: Optional[float] = Field(None, ge=-70, le=0)  # render: bring each track to this loudness
+
+class JobStatus(BaseModel):
+    id: str
+    kind: str
+    status: str
+    progress: float
+    result: Optional[dict] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
 
 class TrackUpdate(BaseModel):
     name: Optional[str] = None
@@ -63,7 +281,104 @@ class TrackUpdate(BaseModel):
     pan: Optional[float] = None
     muted: Optional[bool] = None
     solo: Optional[bool] = None
-    effects: Optional[List[dict]] = None
+    effects: Optional[EffectList] = None
+
+class TrackBatchUpdate(TrackUpdate):
+    id: str
+
+class ProjectUpdate(BaseModel):
+    name: Optional[str] = None
+    tempo: Optional[int] = None
+    key: ScaleKey = None
+
+# Live editing sessions; mixer changes are persisted at most once per interval
+live_sessions = LiveSessions(
+    project_store,
+    track_model=TrackUpdate,
+    project_model=ProjectUpdate,
+    flush_interval=float(os.environ.get('LIVE_FLUSH_SECONDS', 1.0)),
+    on_flush=lambda project_id, fields, tracks: live_edit_flushed(project_id, fields, tracks),
+    effect_parameters={**{name: effect.PARAMETERS for name, effect in EFFECTS.items()},
+                       pitch.EFFECT_TYPE: pitch.PARAMETERS},
+    write_lock=lambda project_id: project_history.lock(project_id),
+)
+
+async def record_history(project_id: str, summary: str, project: Optional[dict] = None, **changes):
+    """Append a version to the project's history; failures never fail the edit.
+
+    Pass the whole ``project`` when the caller has it, or the ``fields``,
+    ``tracks``, ``added`` and ``removed`` an edit wrote so the version is
+    derived from the last one in memory. With neither the project is read.
+    Callers hold ``project_history.lock(project_id)`` from their write on.
+    """
+    try:
+        if project is not None:
+            await project_history.record(project, summary)
+        elif changes:
+            await project_history.record_changes(
+                project_id, summary, lambda: project_store.find_one({"id": project_id}, {"_id": 0}), **changes)
+        else:
+            project = await project_store.find_one({"id": project_id}, {"_id": 0})
+            if project:
+                await project_history.record(project, summary)
+    except Exception:
+        logger.exception("Failed to record history for project %s", project_id)
+
+async def live_edit_flushed(project_id: str, fields: dict, tracks: Dict[str, dict]):
+    """Follow up a live session write the way the REST endpoints follow up theirs"""
+    if "tempo" in fields:
+        try:
+            project = await load_project(project_id)
+            conformed = bool(project) and await conform_tracks(project)
+        except Exception:
+            logger.exception("Failed to conform tracks of project %s to its new tempo", project_id)
+            conformed = False
+        if conformed:
+            # Re-stretched tracks changed too, so record the project as a whole
+            await record_history(project_id, "Live edit")
+            return
+    await record_history(project_id, "Live edit", fields=fields, tracks=tracks)
+
+def decode_audio_payload(audio_data: str):
+    """Decode base64 audio (optionally a data: URL) into bytes and a content type"""
+    content_type = "application/octet-stream"
+    if audio_data.startswith("data:"):
+        header, _, audio_data = audio_data.partition(",")
+        mime = header[len("data:"):].split(";")[0]
+        if mime:
+            content_type = mime
+    try:
+        audio_bytes = base64.b64decode(audio_data, validate=True)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="audio_data is not valid base64")
+    if content_type == "application/octet-stream" and is_wav(audio_bytes):
+        content_type = "audio/wav"
+    return audio_bytes, content_type
+
+def parse_range_header(range_header: Optional[str], size: int):
+    """Parse a single-range ``Range: bytes=`` header into a [start, end) pair"""
+    if not range_header:
+        return None
+    unit, _, spec = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else size
+        else:
+            start = max(size - int(last), 0)
+            end = size
+    except ValueError:
+        return None
+    if start >= size or start >= end:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, min(end, size)
 
 # Project endpoints
 @api_router.post("/projects", response_model=AudioProject)
@@ -71,117 +386,1064 @@ async def create_project(project_data: ProjectCreate):
     """Create a new DAW project"""
     project = AudioProject(
         name=project_data.name,
-        tempo=project_data.tempo or 120
+        tempo=project_data.tempo or 120,
+        key=project_data.key,
     )
-    await db.projects.insert_one(project.dict())
+    async with project_history.lock(project.id):
+        await project_store.insert(project.dict())
+        await record_history(project.id, "Create project", project=project.dict())
     return project
 
-@api_router.get("/projects", response_model=List[AudioProject])
-async def get_projects():
-    """Get all DAW projects"""
-    projects = await db.projects.find().to_list(1000)
-    return [AudioProject(**project) for project in projects]
+async def load_project(project_id: str) -> Optional[dict]:
+    """Project document from the metadata cache, re-read in full if a track still keeps inline audio"""
+    project = await project_store.get(project_id)
+    if project and any(not t.get("audio_ref") for t in project.get("tracks", [])):
+        project = await project_store.find_one({"id": project_id}, {"_id": 0})
+    return project
+
+async def find_track(project_id: str, track_id: str) -> dict:
+    project = await load_project(project_id)
+    track = next((t for t in project.get("tracks", []) if t["id"] == track_id), None) if project else None
+    if track is None:
+        raise HTTPException(status_code=404, detail="Project or track not found")
+    return track
+
+def encode_cursor(project: dict) -> str:
+    raw = f"{project['updated_at'].isoformat()}|{project['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode("ascii")
+
+def decode_cursor(cursor: str):
+    try:
+        updated_at, _, project_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition("|")
+        return datetime.fromisoformat(updated_at), project_id
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+@api_router.get("/projects", response_model=ProjectPage)
+async def get_projects(
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = Query(None, description="Comma-separated extra fields: tracks"),
+):
+    """List projects newest first as lightweight summaries, one page at a time"""
+    extra = {f.strip() for f in fields.split(",") if f.strip()} if fields else set()
+    unknown = extra - SUMMARY_EXTRA_FIELDS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+
+    projection = {"_id": 0, "id": 1, "name": 1, "tempo": 1, "created_at": 1, "updated_at": 1}
+    if "tracks" in extra:
+        # Every track field except the legacy inline audio
+        projection.update({f"tracks.{name}": 1 for name in AudioTrack.model_fields if name != "audio_data"})
+    else:
+        projection["tracks.duration"] = 1
+
+    query = {}
+    if cursor:
+        updated_at, project_id = decode_cursor(cursor)
+        query = {"$or": [
+            {"updated_at": {"$lt": updated_at}},
+            {"updated_at": updated_at, "id": {"$lt": project_id}},
+        ]}
+
+    projects = await project_store.find(query, projection).sort(
+        [("updated_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    has_more = len(projects) > limit
+    projects = projects[:limit]
+
+    items = [
+        ProjectSummary(
+            id=project["id"],
+            name=project["name"],
+            tempo=project.get("tempo", 120),
+            track_count=len(project.get("tracks", [])),
+            total_duration=max((t.get("duration", 0.0) for t in project.get("tracks", [])), default=0.0),
+            created_at=project["created_at"],
+            updated_at=project["updated_at"],
+            tracks=[AudioTrack(**t) for t in project.get("tracks", [])] if "tracks" in extra else None,
+        )
+        for project in projects
+    ]
+    return ProjectPage(items=items, next_cursor=encode_cursor(projects[-1]) if has_more else None)
 
 @api_router.get("/projects/{project_id}", response_model=AudioProject)
 async def get_project(project_id: str):
     """Get a specific project by ID"""
-    project = await db.projects.find_one({"id": project_id})
+    project = await load_project(project_id)
     if not project:
         raise HTTPException(status_code=404, detail="Project not found")
     return AudioProject(**project)
 
 @api_router.put("/projects/{project_id}", response_model=AudioProject)
-async def update_project(project_id: str, update_data: dict):
+async def update_project(project_id: str, update: ProjectUpdate):
     """Update project details"""
+    update_data = update.dict(exclude_unset=True)
     update_data["updated_at"] = datetime.utcnow()
-    result = await db.projects.update_one(
-        {"id": project_id}, 
-        {"$set": update_data}
-    )
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
-    project = await db.projects.find_one({"id": project_id})
+    async with project_history.lock(project_id):
+        result = await project_store.update_one(
+            {"id": project_id},
+            {"$set": update_data}
+        )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Project not found")
+
+        project = await load_project(project_id)
+        if "tempo" in update_data and await conform_tracks(project):
+            # Re-stretched tracks changed too, so record the project as a whole
+            await record_history(project_id, "Update project")
+            project = await load_project(project_id)
+        else:
+            await record_history(project_id, "Update project", fields=update_data)
+    await live_sessions.refresh(project_id)
     return AudioProject(**project)
 
 @api_router.delete("/projects/{project_id}")
 async def delete_project(project_id: str):
     """Delete a project"""
-    result = await db.projects.delete_one({"id": project_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Project not found")
+    async with project_history.lock(project_id):
+        result = await project_store.delete(project_id)
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Project not found")
+        await project_history.delete(project_id)
+    await live_sessions.refresh(project_id)
     return {"message": "Project deleted successfully"}
 
+# Bundle endpoints
+@api_router.get("/projects/{project_id}/export")
+async def export_project(project_id: str):
+    """Stream a project and its stored audio as a tar bundle built on the fly"""
+    project = await load_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    exported = AudioProject(**project).dict()
+    for track in exported["tracks"]:
+        if track.get("audio_data") and not track.get("audio_ref"):
+            # Legacy inline audio travels as a blob like any other track's
+            audio_bytes, content_type = decode_audio_payload(track.pop("audio_data"))
+            track.update(audio_ref=await audio_store.put(audio_bytes), audio_size=len(audio_bytes),
+                         content_type=content_type, encoding=None)
+    writer = await BundleWriter.open(exported, audio_store)
+    headers = {
+        "Content-Length": str(writer.content_length),
+        "Content-Disposition": f'attachment; filename="{project_id}.tar"',
+    }
+    return StreamingResponse(writer.stream(), media_type="application/x-tar", headers=headers)
+
+@api_router.post("/projects/import", response_model=ProjectImportResult)
+async def import_project(file: UploadFile = File(...)):
+    """Create a project from an exported bundle, storing only audio not already stored"""
+    reader = BundleReader(file.read)
+    try:
+        manifest = await reader.read_manifest()
+        try:
+            project = AudioProject(**manifest["project"])
+        except ValueError as e:
+            raise BundleError(f"Invalid project in bundle: {e}")
+        stored = await import_blobs(reader, audio_store)
+    except BundleError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    for track in project.tracks:
+        for field in BLOB_FIELDS:
+            ref = getattr(track, field)
+            if ref and ref not in stored and not await audio_store.exists(ref):
+                raise HTTPException(status_code=400, detail=f"Bundle is missing audio {ref} of track {track.id}")
+
+    # Imports never overwrite: the project always gets a fresh id
+    project.id = str(uuid.uuid4())
+    project.updated_at = datetime.utcnow()
+    async with project_history.lock(project.id):
+        await project_store.insert(project.dict())
+        await record_history(project.id, f"Import project {project.name}", project=project.dict())
+    return ProjectImportResult(
+        project=project,
+        blobs_stored=sum(stored.values()),
+        blobs_deduplicated=len(stored) - sum(stored.values()),
+    )
+
+# History endpoints
+@api_router.get("/projects/{project_id}/history", response_model=HistoryPage)
+async def get_project_history(
+    project_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    before: Optional[int] = Query(None, ge=1, description="Only versions older than this one"),
+):
+    """List a project's versions, newest first"""
+    items = await project_history.versions(project_id, limit + 1, before)
+    if not items and not await project_store.exists(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    has_more = len(items) > limit
+    items = items[:limit]
+    return HistoryPage(
+        items=[HistoryEntry(**item) for item in items],
+        next_before=items[-1]["version"] if has_more else None,
+    )
+
+async def project_version(project_id: str, version: int) -> dict:
+    state = await project_history.state(project_id, version)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Project version not found")
+    return project_history.restore(state, await load_project(project_id))
+
+@api_router.get("/projects/{project_id}/history/{version}", response_model=AudioProject)
+async def get_project_version(project_id: str, version: int):
+    """A project as it was at a version"""
+    return AudioProject(**await project_version(project_id, version))
+
+@api_router.post("/projects/{project_id}/history/{version}/revert", response_model=AudioProject)
+async def revert_project(project_id: str, version: int):
+    """Restore a project to a version; the revert is itself recorded as a new version"""
+    async with project_history.lock(project_id):
+        project = await project_version(project_id, version)
+        project["updated_at"] = datetime.utcnow()
+        result = await project_store.replace_one(project_id, project)
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Project not found")
+        await record_history(project_id, f"Revert to version {version}", project=project)
+    await live_sessions.refresh(project_id)
+    return AudioProject(**project)
+
 # Track endpoints
 @api_router.post("/projects/{project_id}/tracks", response_model=AudioTrack)
 async def add_track_to_project(project_id: str, track_data: TrackCreate):
     """Add a new audio track to a project"""
-    # Create new track
+    if not await project_store.exists(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    audio_bytes, content_type = decode_audio_payload(track_data.audio_data)
+    return await insert_track(project_id, track_data.name, audio_bytes, content_type, track_data.duration)
+
+async def insert_track(project_id: str, name: str, audio_bytes: bytes, content_type: str, duration: float,
+                       **source) -> AudioTrack:
+    """Store track audio and its derived data, then append the track to a project.
+
+    ``source`` carries ``source_ref``, ``source_bpm`` and ``stretch_ratio``
+    for audio that was conformed to the project tempo.
+    """
+    # Create new track; WAV audio replaces the reported duration with its measured one
+    fields = await store_track_audio(audio_bytes)
+    fields.setdefault("duration", duration)
     track = AudioTrack(
-        name=track_data.name,
-        audio_data=track_data.audio_data,
-        duration=track_data.duration
+        name=name,
+        content_type=content_type,
+        **fields,
+        **source,
     )
     
     # Add track to project
-    result = await db.projects.update_one(
-        {"id": project_id},
-        {"$push": {"tracks": track.dict()}, "$set": {"updated_at": datetime.utcnow()}}
-    )
-    
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Project not found")
-    
+    now = datetime.utcnow()
+    async with project_history.lock(project_id):
+        result = await project_store.update_one(
+            {"id": project_id},
+            {"$push": {"tracks": track.dict()}, "$set": {"updated_at": now}}
+        )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Project not found")
+        await record_history(project_id, f"Add track {name}", fields={"updated_at": now}, added=[track.dict()])
+    await live_sessions.refresh(project_id)
     return track
 
+async def read_stored_audio(audio_ref: str) -> bytes:
+    """Read audio from the chunk store, decoding the lossless codec back to WAV"""
+    data = await audio_store.read(audio_ref)
+    if pcm_codec.is_encoded(data):
+        data = await run_in_threadpool(pcm_codec.decode_wav_file, data)
+    return data
+
+async def stretch_source(source_ref: str, ratio: float, audio: Optional[bytes] = None) -> bytes:
+    """Stored source audio stretched by ``ratio``"""
+    if audio is None:
+        audio = await read_stored_audio(source_ref)
+    return await run_in_threadpool(stretch_wav, audio, source_ref, ratio)
+
+async def conform_tracks(project: dict) -> bool:
+    """Re-stretch tempo-conformed tracks whose ratio changed; True if any did"""
+    operations = []
+    for track in project.get("tracks", []):
+        if not (track.get("source_ref") and track.get("source_bpm")):
+            continue
+        ratio = tempo_ratio(track["source_bpm"], project.get("tempo", 120))
+        if ratio == track.get("stretch_ratio", 1.0):
+            continue
+        stretched = await stretch_source(track["source_ref"], ratio)
+        info = parse_wav_header(stretched)
+        fields = {
+            **await store_track_audio(stretched),
+            "stretch_ratio": ratio,
+            "duration": info.frames / info.sample_rate,
+            # The pitch track was detected from the old audio; it is redetected on next use
+            "pitch_ref": None,
+        }
+        operations.append(UpdateOne(
+            {"id": project["id"]},
+            {"$set": {f"tracks.$[t].{k}": v for k, v in fields.items()}},
+            array_filters=[{"t.id": track["id"]}],
+        ))
+    if operations:
+        await project_store.bulk_write(project["id"], operations, ordered=True)
+    return bool(operations)
+
+async def store_track_audio(audio_bytes: bytes) -> dict:
+    """Store audio in the chunk store with its peaks and loudness; returns the track's audio fields"""
+    stored, encoding = await run_in_threadpool(encode_for_storage, audio_bytes)
+    decoded = await run_in_threadpool(decode_track_audio, audio_bytes)
+    fields = {
+        "audio_ref": await audio_store.put(stored),
+        "audio_size": pcm_codec.parse_header(stored).wav_size if encoding else len(audio_bytes),
+        "encoding": encoding,
+        "peaks_ref": await store_peaks(audio_bytes, decoded),
+    }
+    if decoded is not None:
+        measured = await run_in_threadpool(loudness.analyze, *decoded)
+        fields["duration"] = measured.pop("duration")
+        fields["loudness"] = measured
+    return fields
+
+def decode_track_audio(audio_bytes: bytes):
+    """``(samples, sample_rate)`` of WAV audio; None for other formats"""
+    if not is_wav(audio_bytes):
+        return None
+    try:
+        with timed("decode"):
+            return decode_wav(audio_bytes)
+    except ValueError:
+        return None
+
+def encode_for_storage(audio_bytes: bytes):
+    """Losslessly compress PCM WAV for the chunk store; other audio is kept as sent"""
+    with timed("codec"):
+        encoded = pcm_codec.encode_wav_file(audio_bytes)
+    if encoded is not None and len(encoded) < len(audio_bytes):
+        return encoded, pcm_codec.ENCODING
+    return audio_bytes, None
+
 @api_router.put("/projects/{project_id}/tracks/{track_id}", response_model=AudioTrack)
 async def update_track(project_id: str, track_id: str, update_data: TrackUpdate):
     """Update track properties (volume, pan, mute, solo, etc.)"""
-    update_dict = {f"tracks.$.{k}": v for k, v in update_data.dict(exclude_unset=True).items()}
+    changes = update_data.dict(exclude_unset=True)
+    update_dict = {f"tracks.$.{k}": v for k, v in changes.items()}
     update_dict["updated_at"] = datetime.utcnow()
     
-    result = await db.projects.update_one(
-        {"id": project_id, "tracks.id": track_id},
-        {"$set": update_dict}
-    )
-    
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Project or track not found")
-    
-    # Get updated track
-    project = await db.projects.find_one({"id": project_id})
-    track = next((t for t in project["tracks"] if t["id"] == track_id), None)
-    if not track:
-        raise HTTPException(status_code=404, detail="Track not found")
-    
-    return AudioTrack(**track)
+    async with project_history.lock(project_id):
+        # Return only the updated track instead of re-reading the whole project
+        project = await project_store.find_one_and_update(
+            {"id": project_id, "tracks.id": track_id},
+            {"$set": update_dict},
+            projection={"_id": 0, "tracks": {"$elemMatch": {"id": track_id}}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if not project or not project.get("tracks"):
+            raise HTTPException(status_code=404, detail="Project or track not found")
+        await record_history(project_id, f"Update track {project['tracks'][0]['name']}",
+                             fields={"updated_at": update_dict["updated_at"]}, tracks={track_id: changes})
+    await live_sessions.refresh(project_id)
+    return AudioTrack(**project["tracks"][0])
+
+@api_router.patch("/projects/{project_id}/tracks", response_model=List[AudioTrack])
+async def update_tracks(project_id: str, updates: List[TrackBatchUpdate]):
+    """Apply parameter updates to several tracks in one round-trip"""
+    if not updates:
+        raise HTTPException(status_code=400, detail="No track updates given")
+    now = datetime.utcnow()
+    track_ids = list(dict.fromkeys(u.id for u in updates))
+
+    operations = []
+    changes: Dict[str, dict] = {}
+    for update in updates:
+        fields = update.dict(exclude_unset=True, exclude={"id"})
+        if not fields:
+            continue
+        changes.setdefault(update.id, {}).update(fields)
+        # Every write requires all the tracks, so a batch naming a missing one changes nothing
+        operations.append(UpdateOne(
+            {"id": project_id, "tracks.id": {"$all": track_ids}},
+            {"$set": {**{f"tracks.$[t].{k}": v for k, v in fields.items()}, "updated_at": now}},
+            array_filters=[{"t.id": update.id}],
+        ))
+    written = False
+    if operations:
+        async with project_history.lock(project_id):
+            result = await project_store.bulk_write(project_id, operations, ordered=True)
+            written = result.matched_count > 0
+            if written:
+                await record_history(project_id, f"Update {len(operations)} tracks",
+                                     fields={"updated_at": now}, tracks=changes)
+
+    # Read back just the touched tracks, without any inline audio
+    projects = await project_store.aggregate([
+        {"$match": {"id": project_id}},
+        {"$project": {"_id": 0, "tracks": {"$filter": {
+            "input": "$tracks", "as": "t", "cond": {"$in": ["$$t.id", track_ids]},
+        }}}},
+        {"$project": {"tracks.audio_data": 0}},
+    ]).to_list(1)
+    if not projects:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    tracks = {t["id"]: t for t in projects[0].get("tracks", [])}
+    missing = [track_id for track_id in track_ids if track_id not in tracks]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Tracks not found: {', '.join(missing)}")
+    if written:
+        await live_sessions.refresh(project_id)
+    return [AudioTrack(**tracks[track_id]) for track_id in track_ids]
 
 @api_router.delete("/projects/{project_id}/tracks/{track_id}")
 async def delete_track(project_id: str, track_id: str):
     """Delete a track from project"""
-    result = await db.projects.update_one(
-        {"id": project_id},
-        {"$pull": {"tracks": {"id": track_id}}, "$set": {"updated_at": datetime.utcnow()}}
-    )
-    
-    if result.matched_count == 0:
-        raise HTTPException(status_code=404, detail="Project or track not found")
-    
+    now = datetime.utcnow()
+    async with project_history.lock(project_id):
+        result = await project_store.update_one(
+            {"id": project_id},
+            {"$pull": {"tracks": {"id": track_id}}, "$set": {"updated_at": now}}
+        )
+        if result.matched_count == 0:
+            raise HTTPException(status_code=404, detail="Project or track not found")
+        await record_history(project_id, "Delete track", fields={"updated_at": now}, removed=[track_id])
+    await live_sessions.refresh(project_id)
     return {"message": "Track deleted successfully"}
 
+@api_router.get("/projects/{project_id}/tracks/{track_id}/audio")
+async def stream_track_audio(project_id: str, track_id: str, range: Optional[str] = Header(None)):
+    """Stream a track's audio, honoring HTTP Range requests"""
+    track = await find_track(project_id, track_id)
+    content_type = track.get("content_type", "application/octet-stream")
+
+    if track.get("encoding") == pcm_codec.ENCODING:
+        # Encoded tracks are served as the WAV they decode to, block range by block range
+        reader = await open_encoded_audio(track)
+        if reader is None:
+            raise HTTPException(status_code=404, detail="Track audio not found")
+        size = reader.size
+        read_range = reader.iter_range
+    elif track.get("audio_ref"):
+        size = await audio_store.size(track["audio_ref"])
+        if size is None:
+            raise HTTPException(status_code=404, detail="Track audio not found")
+
+        def read_range(start, end):
+            return audio_store.iter_range(track["audio_ref"], start, end)
+    else:
+        # Tracks created before the chunk store keep their audio inline
+        legacy_bytes, content_type = decode_audio_payload(track.get("audio_data") or "")
+        size = len(legacy_bytes)
+
+        async def read_range(start, end):
+            yield legacy_bytes[start:end]
+
+    headers = {"Accept-Ranges": "bytes"}
+    byte_range = parse_range_header(range, size)
+    if byte_range is None:
+        headers["Content-Length"] = str(size)
+        return StreamingResponse(read_range(0, size), media_type=content_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    headers["Content-Length"] = str(end - start)
+    return StreamingResponse(read_range(start, end), status_code=206, media_type=content_type, headers=headers)
+
+async def open_encoded_audio(track: dict) -> Optional[pcm_codec.EncodedReader]:
+    size = await audio_store.size(track["audio_ref"])
+    if size is None:
+        return None
+
+    async def fetch(start, end):
+        return await audio_store.read(track["audio_ref"], start, end)
+    return await pcm_codec.EncodedReader.open(fetch, size)
+
+async def track_byte_source(track: dict):
+    """Return ``(read, size)`` for a track's stored audio, or None if it has none"""
+    if track.get("encoding") == pcm_codec.ENCODING:
+        reader = await open_encoded_audio(track)
+        return (reader.read, reader.size) if reader else None
+    if track.get("audio_ref"):
+        size = await audio_store.size(track["audio_ref"])
+        if size is None:
+            return None
+
+        async def read(start, end):
+            return await audio_store.read(track["audio_ref"], start, end)
+        return read, size
+    if track.get("audio_data"):
+        legacy_bytes, _ = decode_audio_payload(track["audio_data"])
+
+        async def read(start, end):
+            return legacy_bytes[start:end]
+        return read, len(legacy_bytes)
+    return None
+
+async def store_peaks(audio_bytes: bytes, decoded=None) -> Optional[str]:
+    """Build and store the peak pyramid for WAV audio; None for other formats"""
+    decoded = decoded or decode_track_audio(audio_bytes)
+    if decoded is None:
+        return None
+    samples, sample_rate = decoded
+    with timed("peaks"):
+        serialized = peaks.serialize(peaks.build_pyramid(samples, sample_rate))
+    return await audio_store.put(serialized)
+
+@api_router.get("/projects/{project_id}/tracks/{track_id}/peaks")
+async def get_track_peaks(
+    project_id: str,
+    track_id: str,
+    start: float = Query(0.0, ge=0),
+    end: Optional[float] = Query(None, gt=0),
+    pixels: int = Query(800, ge=1, le=20000),
+):
+    """Min/max waveform peaks for a time range, one pair per pixel"""
+    if end is not None and end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    track = await find_track(project_id, track_id)
+
+    peaks_ref = track.get("peaks_ref")
+    if not peaks_ref:
+        # Tracks added before peaks existed get their pyramid on first request
+        source = await track_byte_source(track)
+        peaks_ref = await store_peaks(await source[0](0, source[1])) if source else None
+        if not peaks_ref:
+            raise HTTPException(status_code=404, detail="No peaks available for this track")
+        await project_store.update_one(
+            {"id": project_id, "tracks.id": track_id},
+            {"$set": {"tracks.$.peaks_ref": peaks_ref}}
+        )
+
+    pyramid = peak_cache.get(peaks_ref)
+    if pyramid is None:
+        pyramid = peaks.deserialize(await audio_store.read(peaks_ref))
+        peak_cache.put(peaks_ref, pyramid)
+    duration = pyramid.frames / pyramid.sample_rate
+    if start >= duration:
+        raise HTTPException(status_code=400, detail="start is past the end of the track")
+    return peaks.query(pyramid, start, duration if end is None else end, pixels)
+
+async def measure_loudness(project: dict) -> dict:
+    """Fill in loudness for tracks stored before ingest analysis, persisting the results"""
+    operations = []
+    tracks = []
+    durations = {}
+    for track in project.get("tracks", []):
+        if track.get("loudness") is None and track.get("content_type") == "audio/wav":
+            source = await track_byte_source(track)
+            decoded = await run_in_threadpool(decode_track_audio, await source[0](0, source[1])) if source else None
+            if decoded is not None:
+                measured = await run_in_threadpool(loudness.analyze, *decoded)
+                track = {**track, "duration": measured.pop("duration"), "loudness": measured}
+                durations[track["id"]] = {"duration": track["duration"]}
+                operations.append(UpdateOne(
+                    {"id": project["id"]},
+                    {"$set": {"tracks.$[t].duration": track["duration"], "tracks.$[t].loudness": measured}},
+                    array_filters=[{"t.id": track["id"]}],
+                ))
+        tracks.append(track)
+    if operations:
+        async with project_history.lock(project["id"]):
+            await project_store.bulk_write(project["id"], operations, ordered=False)
+            # Loudness is derived and left out of versions, but a corrected duration is recorded
+            await record_history(project["id"], "Measure loudness", tracks=durations)
+    return {**project, "tracks": tracks}
+
+@api_router.get("/projects/{project_id}/loudness", response_model=ProjectLoudness)
+async def get_project_loudness(
+    project_id: str,
+    target_lufs: float = Query(-14.0, ge=-70, le=0, description="Loudness a normalized render aims for"),
+):
+    """Measured levels of every track, with the gain normalization would apply"""
+    project = await load_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    project = await measure_loudness(project)
+    entries = []
+    for track in project.get("tracks", []):
+        measured = track.get("loudness")
+        gain = loudness.normalize_gain(measured, target_lufs) if measured else None
+        entries.append(TrackLoudnessEntry(
+            track_id=track["id"],
+            name=track["name"],
+            duration=track["duration"],
+            loudness=measured,
+            normalize_gain_db=round(20 * math.log10(gain), 2) if gain else None,
+        ))
+    return ProjectLoudness(target_lufs=target_lufs, tracks=entries)
+
+@api_router.post("/projects/{project_id}/render")
+async def render_project(
+    project_id: str,
+    normalize_lufs: Optional[float] = Query(None, ge=-70, le=0, description="Bring each track to this loudness"),
+):
+    """Mix all audible tracks into a stereo WAV, streamed segment by segment.
+
+    Segments whose tracks, effects and mixer settings are unchanged since the
+    last render are served from the cache; ``X-Dirty-Segments`` tells how
+    many had to be mixed again, once every track's audio has been rendered
+    before. With ``normalize_lufs`` each track's volume
+    is scaled by its measured loudness first.
+    """
+    project = await load_project(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    tracks = await render_tracks(project, normalize_lufs)
+    mixdown = await SegmentedMixdown.open(project["id"], tracks, render_source, render_cache)
+    headers = {
+        "Content-Length": str(mixdown.content_length),
+        "Content-Disposition": f'attachment; filename="{project["id"]}.wav"',
+        "X-Segments": str(mixdown.segments),
+    }
+    dirty = mixdown.dirty_segments
+    if dirty is not None:
+        headers["X-Dirty-Segments"] = str(dirty)
+    if mixdown.skipped:
+        headers["X-Skipped-Tracks"] = ",".join(mixdown.skipped)
+    return StreamingResponse(mixdown.stream(), media_type="audio/wav", headers=headers)
+
 # Audio processing endpoints
-@api_router.post("/audio/process")
-async def process_audio(audio_data: str, effects: List[dict]):
-    """Apply effects to audio data (placeholder for future audio processing)"""
-    # This is a placeholder - in a real DAW, you'd process the audio with the specified effects
-    # For now, we'll just return the original audio data
-    return {"processed_audio": audio_data, "effects_applied": effects}
+@api_router.post("/audio/process", response_model=AudioProcessResult)
+async def process_audio(request: AudioProcessRequest):
+    """Apply an effect chain to WAV audio sent inline or taken from a project track"""
+    track = None
+    key = request.key
+    if request.project_id and request.track_id:
+        track = await find_track(request.project_id, request.track_id)
+        source = await track_byte_source(track)
+        if source is None:
+            raise HTTPException(status_code=404, detail="Track audio not found")
+        audio_bytes = await source[0](0, source[1])
+        audio_hash = track.get("audio_ref") or content_hash(audio_bytes)
+        if key is None:
+            key = (await project_store.get(request.project_id) or {}).get("key")
+    elif request.audio_data:
+        audio_bytes, _ = decode_audio_payload(request.audio_data)
+        audio_hash = content_hash(audio_bytes)
+    else:
+        raise HTTPException(status_code=400, detail="Give audio_data or project_id and track_id")
+    try:
+        info = parse_wav_header(audio_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Unsupported audio: {e}")
+
+    applied = active_effects(request.effects)
+    autotune = pitch.autotune_params(applied)
+    # Only Auto-Tune output depends on the key
+    key_part = [key] if autotune and key else []
+    output_key = cache_key(audio_hash, applied, info.sample_rate, *key_part)
+    output = await run_in_threadpool(render_cache.get, output_key)
+    if output is None:
+        pitch_track = None
+        if autotune:
+            pitch_track = await load_pitch_track(audio_bytes, audio_hash, request.project_id, track)
+        output = await run_in_threadpool(render_effects, audio_bytes, applied, pitch_track, key)
+        await run_in_threadpool(render_cache.put, output_key, output)
+    return AudioProcessResult(
+        processed_audio=base64.b64encode(output).decode("ascii"),
+        effects_applied=applied,
+    )
+
+def render_effects(audio_bytes: bytes, effects: List[dict], pitch_track: Optional[pitch.PitchTrack] = None,
+                   key: Optional[str] = None) -> bytes:
+    """Run WAV audio through Auto-Tune (if enabled) and then the block effect chain"""
+    info = parse_wav_header(audio_bytes)
+    with timed("decode"):
+        samples, sample_rate = decode_wav(audio_bytes)
+    autotune = pitch.autotune_params(effects)
+    if autotune:
+        samples = pitch.autotune(samples, pitch_track or pitch.detect_pitch(samples, sample_rate), autotune, key)
+    processed = process_signal(samples, sample_rate, effects)
+    bits = info.bits if info.bits in (16, 24) and not info.is_float else 16
+    with timed("encode"):
+        return encode_wav(processed, sample_rate, bits)
+
+async def load_pitch_track(audio_bytes: bytes, audio_hash: str, project_id: Optional[str] = None,
+                           track: Optional[dict] = None) -> pitch.PitchTrack:
+    """Pitch track of some audio, detected once and then reused.
+
+    Project tracks keep theirs in the chunk store under ``pitch_ref``; inline
+    audio is cached by content hash in the render cache.
+    """
+    stored = await stored_pitch_track(audio_hash, track)
+    if stored is not None:
+        return pitch.deserialize(stored)
+
+    def detect():
+        with timed("decode"):
+            samples, sample_rate = decode_wav(audio_bytes)
+        return pitch.detect_pitch(samples, sample_rate)
+    pitch_track = await run_in_threadpool(detect)
+    await keep_pitch_track(pitch.serialize(pitch_track), audio_hash, project_id, track)
+    return pitch_track
+
+async def stored_pitch_track(audio_hash: str, track: Optional[dict] = None) -> Optional[bytes]:
+    """Serialized pitch track kept for a project track or cached for inline audio, if there is one"""
+    if track:
+        return await audio_store.read(track["pitch_ref"]) if track.get("pitch_ref") else None
+    return await run_in_threadpool(render_cache.get, cache_key(audio_hash, [], 0, "pitch"))
+
+async def keep_pitch_track(serialized: bytes, audio_hash: str, project_id: Optional[str] = None,
+                           track: Optional[dict] = None):
+    """Keep a detected pitch track where ``stored_pitch_track`` looks for it"""
+    if track:
+        pitch_ref = await audio_store.put(serialized)
+        track["pitch_ref"] = pitch_ref
+        # Only while the track still has the audio it was detected from
+        await project_store.update_one(
+            {"id": project_id, "tracks": {"$elemMatch": {"id": track["id"], "audio_ref": track.get("audio_ref")}}},
+            {"$set": {"tracks.$.pitch_ref": pitch_ref}}
+        )
+    else:
+        await run_in_threadpool(render_cache.put, cache_key(audio_hash, [], 0, "pitch"), serialized)
+
+async def render_tracks(project: dict, normalize_lufs: Optional[float] = None) -> List[dict]:
+    """Audible tracks as a mixdown should see them, with Auto-Tune already applied.
+
+    Pitch correction needs the whole track, so it runs here rather than in
+    the block chain. Corrected tracks carry their audio in ``_audio``, point
+    ``audio_ref`` at the corrected audio's cache key (so stem caches follow
+    the project key) and drop Auto-Tune from their effects. With
+    ``normalize_lufs``, volumes include each track's normalization gain.
+    """
+    if normalize_lufs is not None:
+        project = await measure_loudness(project)
+    tracks = []
+    for track in audible_tracks(project.get("tracks", [])):
+        if normalize_lufs is not None and track.get("loudness"):
+            gain = loudness.normalize_gain(track["loudness"], normalize_lufs)
+            track = {**track, "volume": track.get("volume", 1.0) * gain}
+        autotune = pitch.autotune_params(track.get("effects") or [])
+        source = await track_byte_source(track) if autotune else None
+        audio_bytes = await source[0](0, source[1]) if source else b""
+        if not is_wav(audio_bytes):
+            tracks.append(track)
+            continue
+        audio_hash = track.get("audio_ref") or content_hash(audio_bytes)
+        effects = [{"type": pitch.EFFECT_TYPE, "parameters": autotune}]
+        corrected_key = cache_key(audio_hash, effects, 0, project.get("key"))
+        corrected = await run_in_threadpool(render_cache.get, corrected_key)
+        if corrected is None:
+            pitch_track = await load_pitch_track(audio_bytes, audio_hash, project["id"], track)
+            corrected = await run_in_threadpool(render_effects, audio_bytes, effects, pitch_track, project.get("key"))
+            await run_in_threadpool(render_cache.put, corrected_key, corrected)
+        tracks.append({
+            **track,
+            "audio_ref": corrected_key,
+            "effects": [e for e in track["effects"] if e.get("type") != pitch.EFFECT_TYPE],
+            "_audio": corrected,
+        })
+    return tracks
+
+async def render_source(track: dict):
+    """Byte source of a track prepared by ``render_tracks``"""
+    if "_audio" not in track:
+        return await track_byte_source(track)
+    audio = track["_audio"]
+
+    async def read(start, end):
+        return audio[start:end]
+    return read, len(audio)
+
+def stretch_wav(audio_bytes: bytes, source_hash: str, ratio: float) -> bytes:
+    """Time-stretch WAV audio without changing pitch, cached per (source hash, ratio)"""
+    try:
+        info = parse_wav_header(audio_bytes)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Unsupported audio: {e}")
+    if ratio == 1.0:
+        return audio_bytes
+
+    key = cache_key(source_hash, [], info.sample_rate, "stretch", ratio)
+    output = render_cache.get(key)
+    if output is None:
+        with timed("decode"):
+            samples, sample_rate = decode_wav(audio_bytes)
+        stretched = time_stretch(samples, ratio)
+        bits = info.bits if info.bits in (16, 24) and not info.is_float else 16
+        with timed("encode"):
+            output = encode_wav(stretched, sample_rate, bits)
+        render_cache.put(key, output)
+    return output
+
+@api_router.post("/audio/stretch", response_model=AudioStretchResult)
+def stretch_audio(request: AudioStretchRequest):
+    """Change the length of WAV audio without changing its pitch"""
+    if request.ratio is not None:
+        ratio = round(request.ratio, 6)
+    elif request.source_bpm and request.target_bpm:
+        ratio = tempo_ratio(request.source_bpm, request.target_bpm)
+    else:
+        raise HTTPException(status_code=400, detail="Give ratio or source_bpm and target_bpm")
+    audio_bytes, _ = decode_audio_payload(request.audio_data)
+    output = stretch_wav(audio_bytes, content_hash(audio_bytes), ratio)
+    return AudioStretchResult(
+        stretched_audio=base64.b64encode(output).decode("ascii"),
+        ratio=ratio,
+    )
+
+def render_sequence(request: SequencerRenderRequest) -> bytes:
+    """Render a step pattern to WAV bytes"""
+    unknown = sorted(set(request.pattern) - set(DRUM_PADS))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown pads: {', '.join(unknown)}")
+    bank = sample_bank.bank(request.sample_rate)
+    with timed("sequencer"):
+        loop = render_pattern(request.pattern, request.bpm, request.bars, bank, request.sample_rate, request.swing)
+    with timed("encode"):
+        return encode_wav(loop, request.sample_rate)
+
+# Sample library endpoints
+@api_router.post("/samples", response_model=Sample)
+async def create_sample(sample_data: SampleCreate):
+    """Add a sample to the library catalog"""
+    fields = sample_data.dict(exclude={"audio_data"})
+    if sample_data.key:
+        try:
+            fields["key"] = normalize_key(sample_data.key)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if sample_data.audio_data:
+        audio_bytes, content_type = decode_audio_payload(sample_data.audio_data)
+        stored, encoding = await run_in_threadpool(encode_for_storage, audio_bytes)
+        fields.update(
+            audio_ref=await audio_store.put(stored),
+            audio_size=pcm_codec.parse_header(stored).wav_size if encoding else len(audio_bytes),
+            content_type=content_type,
+            encoding=encoding,
+        )
+    sample = Sample(**fields)
+    await db.samples.insert_one(sample.dict())
+    sample_index.add(sample.dict())
+    return sample
+
+@api_router.get("/samples/search", response_model=SamplePage)
+async def search_samples(
+    q: Optional[str] = Query(None, description="Prefix match on words of the sample name"),
+    tags: Optional[str] = Query(None, description="Comma-separated; all must match"),
+    key: Optional[str] = None,
+    compatible: bool = Query(False, description="Also match keys that mix harmonically with key"),
+    category: Optional[str] = None,
+    bpm_min: Optional[float] = None,
+    bpm_max: Optional[float] = None,
+    duration_min: Optional[float] = None,
+    duration_max: Optional[float] = None,
+    limit: int = Query(50, ge=1, le=500),
+    offset: int = Query(0, ge=0),
+):
+    """Faceted search over the sample library"""
+    try:
+        total, items = sample_index.search(
+            query=q,
+            tags=[t.strip() for t in tags.split(",") if t.strip()] if tags else (),
+            key=key,
+            compatible=compatible,
+            category=category,
+            bpm_min=bpm_min,
+            bpm_max=bpm_max,
+            duration_min=duration_min,
+            duration_max=duration_max,
+            limit=limit,
+            offset=offset,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return SamplePage(total=total, items=[Sample(**s) for s in items])
+
+@api_router.get("/samples/{sample_id}", response_model=Sample)
+async def get_sample(sample_id: str):
+    """Get a library sample by ID"""
+    sample = sample_index.get(sample_id)
+    if not sample:
+        raise HTTPException(status_code=404, detail="Sample not found")
+    return Sample(**sample)
+
+@api_router.post("/projects/{project_id}/tracks/sample", response_model=AudioTrack)
+async def add_sample_track(project_id: str, request: SampleTrackCreate):
+    """Add a library sample to a project as a track, stretched to the project tempo"""
+    project = await project_store.get(project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+    sample = sample_index.get(request.sample_id)
+    if not sample:
+        raise HTTPException(status_code=404, detail="Sample not found")
+    if not sample.get("audio_ref"):
+        raise HTTPException(status_code=400, detail="Sample has no audio")
+
+    name = request.name or sample["name"]
+    audio = await read_stored_audio(sample["audio_ref"])
+    content_type = sample.get("content_type") or "application/octet-stream"
+    if not (request.conform_tempo and sample.get("bpm") and is_wav(audio)):
+        return await insert_track(project_id, name, audio, content_type, sample["duration"])
+
+    # Keep the source so a later tempo change re-stretches from the original
+    ratio = tempo_ratio(sample["bpm"], project.get("tempo", 120))
+    stretched = await stretch_source(sample["audio_ref"], ratio, audio)
+    info = parse_wav_header(stretched)
+    return await insert_track(
+        project_id, name, stretched, "audio/wav", info.frames / info.sample_rate,
+        source_ref=sample["audio_ref"], source_bpm=sample["bpm"], stretch_ratio=ratio,
+    )
+
+@api_router.post("/sequencer/render")
+def render_sequencer_pattern(request: SequencerRenderRequest):
+    """Render a step-sequencer pattern to a WAV loop"""
+    return Response(render_sequence(request), media_type="audio/wav")
+
+@api_router.post("/projects/{project_id}/tracks/sequencer", response_model=AudioTrack)
+async def add_sequencer_track(project_id: str, request: SequencerRenderRequest, name: str = "Drum Loop"):
+    """Render a step-sequencer pattern and add it to a project as a track"""
+    if not await project_store.exists(project_id):
+        raise HTTPException(status_code=404, detail="Project not found")
+    wav = await run_in_threadpool(render_sequence, request)
+    duration = (len(wav) - 44) / 2 / request.sample_rate
+    return await insert_track(project_id, name, wav, "audio/wav", duration)
+
+async def store_job_output(output: bytes) -> dict:
+    return {"audio_ref": await audio_store.put(output), "size": len(output)}
+
+async def submit_process_job(job_data: JobCreate):
+    track = None
+    key = job_data.key
+    if job_data.project_id and job_data.track_id:
+        track = await find_track(job_data.project_id, job_data.track_id)
+        source = await track_byte_source(track)
+        if source is None:
+            raise HTTPException(status_code=404, detail="Track audio not found")
+        wav = await source[0](0, source[1])
+        audio_hash = track.get("audio_ref") or content_hash(wav)
+        if key is None:
+            key = (await project_store.get(job_data.project_id) or {}).get("key")
+    elif job_data.audio_ref:
+        if not await audio_store.exists(job_data.audio_ref):
+            raise HTTPException(status_code=404, detail="Audio not found")
+        wav = await audio_store.read(job_data.audio_ref)
+        if pcm_codec.is_encoded(wav):
+            wav = await run_in_threadpool(pcm_codec.decode_wav_file, wav)
+        audio_hash = job_data.audio_ref
+    elif job_data.audio_data:
+        wav, _ = decode_audio_payload(job_data.audio_data)
+        audio_hash = content_hash(wav)
+    else:
+        raise HTTPException(status_code=400, detail="process jobs need a track, audio_ref or audio_data")
+    try:
+        info = parse_wav_header(wav)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Unsupported audio: {e}")
+    bits = info.bits if info.bits in (16, 24) and not info.is_float else 16
+    output_size = 44 + info.frames * info.channels * bits // 8
+
+    effects = active_effects(job_data.effects)
+    pitch_track, on_pitch = None, None
+    if pitch.autotune_params(effects):
+        # The worker detects pitch only when no earlier request kept it
+        pitch_track = await stored_pitch_track(audio_hash, track)
+        if pitch_track is None:
+            async def on_pitch(serialized: bytes):
+                await keep_pitch_track(serialized, audio_hash, job_data.project_id, track)
+    return job_manager.submit_process(wav, effects, output_size, store_job_output, key=key,
+                                      pitch_track=pitch_track, on_pitch=on_pitch)
+
+async def submit_render_job(job_data: JobCreate):
+    if not job_data.project_id:
+        raise HTTPException(status_code=400, detail="render jobs need project_id")
+    project = await load_project(job_data.project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    tracks, sources = [], []
+    for track in await render_tracks(project, job_data.normalize_lufs):
+        source = await render_source(track)
+        if source:
+            tracks.append({k: v for k, v in track.items() if k not in ("_id", "_audio", "audio_data", "created_at")})
+            sources.append(await source[0](0, source[1]))
+
+    # Open the mix here only to size the output buffer the worker fills
+    by_id = {t["id"]: data for t, data in zip(tracks, sources)}
+
+    async def in_memory(track):
+        data = by_id[track["id"]]
+
+        async def read(start, end):
+            return data[start:end]
+        return read, len(data)
+    mixdown = await SegmentedMixdown.open(project["id"], tracks, in_memory, render_cache)
+    return job_manager.submit_render(project["id"], tracks, sources, mixdown.content_length, mixdown.sample_rate,
+                                     render_cache, store_job_output)
+
+@api_router.post("/jobs", response_model=JobStatus)
+async def create_job(job_data: JobCreate):
+    """Queue a processing or render job on the worker pool"""
+    try:
+        if job_data.kind == "process":
+            job = await submit_process_job(job_data)
+        else:
+            job = await submit_render_job(job_data)
+    except QueueFull:
+        raise HTTPException(
+            status_code=429,
+            detail="Job queue is full, retry later",
+            headers={"Retry-After": "1"},
+        )
+    return job_manager.describe(job)
+
+@api_router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str):
+    """Status, progress and result of a job"""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_manager.describe(job)
+
+@api_router.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Stream the audio produced by a finished job"""
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.result:
+        raise HTTPException(status_code=409, detail=f"Job is {job_manager.describe(job)['status']}")
+    return StreamingResponse(
+        audio_store.iter_range(job.result["audio_ref"]),
+        media_type="audio/wav",
+        headers={"Content-Length": str(job.result["size"])},
+    )
+
+@api_router.websocket("/projects/{project_id}/live")
+async def live_session(websocket: WebSocket, project_id: str):
+    """Stream mixer deltas between clients editing the same project"""
+    await websocket.accept()
+    session = await live_sessions.join(project_id, websocket)
+    if session is None:
+        await websocket.close(code=4404, reason="Project not found")
+        return
+    try:
+        await websocket.send_json({"type": "state", "state": session.state})
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                await websocket.send_json({"type": "error", "detail": "Invalid JSON"})
+                continue
+            if isinstance(message, dict):
+                await live_sessions.handle(session, websocket, message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await live_sessions.leave(session, websocket)
+
+@api_router.get("/cache/stats")
+async def get_cache_stats():
+    """Hit, miss and eviction counters of the processed-audio cache"""
+    return render_cache.stats()
 
 # Root endpoint
 @api_router.get("/")
 async def root():
     return {"message": "DAW API Ready", "version": "1.0.0"}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Request, MongoDB and DSP metrics in the Prometheus text format"""
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -193,6 +1455,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so timings include CORS handling; SERVER_TIMING=1 adds a Server-Timing header
+app.add_middleware(MetricsMiddleware, server_timing=os.environ.get('SERVER_TIMING', '0') == '1')
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -200,6 +1465,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_indexes():
+    await project_store.ensure_indexes()
+    await project_history.ensure_indexes()
+    await db.samples.create_index("id", unique=True)
+    sample_index.build(await db.samples.find({}, {"_id": 0}).to_list(None))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await live_sessions.flush_all()
+    job_manager.shutdown()
     client.close()
\ No newline at end of file
@@ -0,0 +1,300 @@
+"""Incremental project mixdown from segmented stem caches.
+
+Every audible track is cut into fixed-length segments, each keyed by what
+feeds it: the source audio it reads, the effect chain and the output rate.
+Source hashes are taken as the stream reaches each segment, so the response
+starts without reading any audio, and are cached per audio once the whole
+track was hashed. Effect state carries forward, so for a track with effects
+a segment's key covers all source audio up to its end, and its processed
+stem and the chain's state at every segment boundary are cached, letting
+rendering resume at the first dirty segment instead of the start of the
+track. Tracks without effects are read straight from their audio; caching
+them would only duplicate it as float32.
+
+Each mix segment is keyed by its dependency record, the stem keys and pan
+gains of the tracks playing in it, and the last record of every segment is
+kept per project. After an edit only segments whose record changed are
+mixed again: a changed segment is patched from its previous version by
+adding the difference of the tracks that changed, and only summed from
+scratch when that version has been evicted.
+
+Only reading source bytes happens on the event loop. Effect processing,
+mixing, encoding and every cache read and write run in worker threads, so
+a render never stalls other requests.
+"""
+import asyncio
+import json
+import pickle
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from audio_io import WavInfo, float_to_pcm, wav_header
+from audio_store import content_hash
+from dsp import EffectChain, active_effects
+from metrics import timed
+from mixer import OUTPUT_CHANNELS, TrackReader, _probe, audible_tracks, pan_gains
+from render_cache import RenderCache, cache_key
+
+SEGMENT_SECONDS = 4.0
+
+# (track id, stem key, left gain, right gain) of one track in one mix segment
+Entry = Tuple[str, str, float, float]
+
+
+def record_key(record: List[Entry]) -> str:
+    return cache_key(json.dumps(record, separators=(",", ":")), [], 0, "mix-segment")
+
+
+class StemTrack:
+    """One audible track: its segment keys and a resumable render"""
+
+    def __init__(self, track: dict, reader: TrackReader, info: WavInfo, effects: List[dict],
+                 sample_rate: int, segment_frames: int, frames: int):
+        self.id = track["id"]
+        self.audio_id = track.get("audio_ref")
+        self.reader = reader
+        self.info = info
+        self.effects = effects
+        self.sample_rate = sample_rate
+        self.segment_frames = segment_frames
+        self.frames = frames
+        left, right = pan_gains(track.get("pan", 0.0))
+        volume = track.get("volume", 1.0)
+        self.left, self.right = float(volume * left), float(volume * right)
+        self.source_segments = -(-reader.frames // segment_frames)
+        # Tracks with effects play until the end of the mix so reverb and delay tails are kept
+        self.segments = -(-frames // segment_frames) if effects else self.source_segments
+        self.hashes: List[str] = []
+        self.keys: List[str] = []
+        self.chained = ""
+        self.chain: Optional[EffectChain] = None
+        self.position: Optional[int] = None  # next segment the live render produces
+
+    @property
+    def hashes_key(self) -> Optional[str]:
+        if not self.audio_id:
+            return None
+        return cache_key(self.audio_id, [], self.sample_rate, "segment-hashes", self.segment_frames)
+
+    async def load_hashes(self, cache: RenderCache):
+        """Take source hashes from an earlier render of the same audio, deriving every key up front"""
+        cached = await asyncio.to_thread(cache.get, self.hashes_key) if self.hashes_key else None
+        if cached is not None:
+            self.hashes = json.loads(cached)
+            while len(self.keys) < self.segments:
+                self._derive_key()
+
+    @property
+    def keys_known(self) -> bool:
+        return len(self.keys) == self.segments
+
+    async def key(self, cache: RenderCache, k: int) -> str:
+        """Stem key of segment ``k``, hashing the source audio up to it if needed"""
+        while len(self.keys) <= k:
+            if len(self.hashes) < self.source_segments:
+                self.hashes.append(await self._hash_source(len(self.hashes)))
+                if len(self.hashes) == self.source_segments and self.hashes_key:
+                    await asyncio.to_thread(cache.put, self.hashes_key, json.dumps(self.hashes).encode())
+            self._derive_key()
+        return self.keys[k]
+
+    async def _hash_source(self, k: int) -> str:
+        """Hash of the source bytes segment ``k`` reads, with the resampler's extra frame"""
+        first = int(np.floor(k * self.segment_frames * self.reader.ratio))
+        last = min(int(np.ceil((k + 1) * self.segment_frames * self.reader.ratio)) + 1, self.info.frames)
+        offset, frame_size = self.info.data_offset, self.info.frame_size
+        data = await self.reader.read_bytes(offset + first * frame_size, offset + last * frame_size)
+        return await asyncio.to_thread(content_hash, data)
+
+    def _derive_key(self):
+        k = len(self.keys)
+        digest = self.hashes[k] if k < len(self.hashes) else ""
+        if self.effects:
+            # Effect state flows forward, so a segment depends on everything before it
+            self.chained = cache_key(self.chained, [], 0, digest)
+            digest = self.chained
+        self.keys.append(cache_key(digest, self.effects, self.sample_rate, "stem", k, self.length(k)))
+
+    def length(self, k: int) -> int:
+        return min(self.segment_frames, self.frames - k * self.segment_frames)
+
+    def entry(self, k: int) -> Entry:
+        return self.id, self.keys[k], self.left, self.right
+
+    async def stem(self, cache: RenderCache, k: int) -> np.ndarray:
+        """Stem of segment ``k``; processed stems come from the cache or the nearest cached state"""
+        if self.effects:
+            data = await asyncio.to_thread(cache.get, self.keys[k])
+            if data is not None:
+                return np.frombuffer(data, "<f4").reshape(-1, self.info.channels)
+        if self.position != k:
+            await asyncio.to_thread(self._resume, cache, k)
+        while True:
+            block = await self.reader.read(self.length(self.position))
+            if self.chain is not None:
+                block = await asyncio.to_thread(self._process, cache, block)
+            self.position += 1
+            if self.position > k:
+                return block
+
+    def _process(self, cache: RenderCache, block: np.ndarray) -> np.ndarray:
+        """Run the effect chain over the next segment, caching its stem and the chain's state after it"""
+        block = self.chain.process(block)
+        cache.put(self.keys[self.position], block.astype("<f4").tobytes())
+        cache.put(_state_key(self.keys[self.position]), pickle.dumps(self.chain))
+        return block
+
+    def _resume(self, cache: RenderCache, k: int):
+        """Position the reader and effect chain at the latest segment at or before ``k`` with known state"""
+        start, state = k, None
+        if self.effects:
+            while start > 0:
+                state = cache.get(_state_key(self.keys[start - 1]))
+                if state is not None:
+                    break
+                start -= 1
+        self.chain = pickle.loads(state) if state else (
+            EffectChain(self.effects, self.sample_rate, self.info.channels) if self.effects else None
+        )
+        self.reader.seek(start * self.segment_frames)
+        self.position = start
+
+
+def _state_key(stem_key: str) -> str:
+    return cache_key(stem_key, [], 0, "stem-state")
+
+
+class SegmentedMixdown:
+    """Renders a project to a stereo 16-bit WAV stream, reusing unchanged segments"""
+
+    def __init__(self, project_id: str, tracks: List[StemTrack], sample_rate: int, frames: int,
+                 segment_frames: int, cache: RenderCache, skipped: Optional[List[str]] = None):
+        self.project_id = project_id
+        self.tracks = tracks
+        self.sample_rate = sample_rate
+        self.frames = frames
+        self.segment_frames = segment_frames
+        self.segments = -(-frames // segment_frames)
+        self.cache = cache
+        self.skipped = skipped or []
+        self.by_id = {track.id: track for track in tracks}
+        self.plan_key = cache_key(project_id, [], sample_rate, "mix-plan", segment_frames)
+
+    @classmethod
+    async def open(cls, project_id: str, tracks: List[dict],
+                   reader_for: Callable, cache: RenderCache, sample_rate: Optional[int] = None):
+        """Open every audible track and read only their headers and any cached source hashes"""
+        playing = audible_tracks(tracks)
+        probes = await asyncio.gather(*(_probe(track, reader_for) for track in playing))
+        ready = [(track, read, info) for track, (read, info) in zip(playing, probes) if info]
+        skipped = [track["id"] for track, (_, info) in zip(playing, probes) if not info]
+        sample_rate = sample_rate or max((info.sample_rate for _, _, info in ready), default=44100)
+        segment_frames = int(SEGMENT_SECONDS * sample_rate)
+
+        readers = [TrackReader(read, info, sample_rate) for _, read, info in ready]
+        frames = max((reader.frames for reader in readers), default=0)
+        stems = [
+            StemTrack(track, reader, info, active_effects(track.get("effects") or []),
+                      sample_rate, segment_frames, frames)
+            for (track, _, info), reader in zip(ready, readers)
+        ]
+        for stem in stems:
+            await stem.load_hashes(cache)
+        return cls(project_id, stems, sample_rate, frames, segment_frames, cache, skipped)
+
+    @property
+    def content_length(self) -> int:
+        return 44 + self.frames * OUTPUT_CHANNELS * 2
+
+    @property
+    def dirty_segments(self) -> Optional[int]:
+        """Segments that must be mixed again; None until every track's audio has been hashed once"""
+        if not all(track.keys_known for track in self.tracks):
+            return None
+        return sum(not self.cache.contains(record_key(self._record(k))) for k in range(self.segments))
+
+    def header(self) -> bytes:
+        return wav_header(self.frames, OUTPUT_CHANNELS, self.sample_rate, 16)
+
+    def _record(self, k: int) -> List[Entry]:
+        return sorted(track.entry(k) for track in self.tracks if k < track.segments)
+
+    async def record(self, k: int) -> List[Entry]:
+        """Dependency record of segment ``k``: stem key and gains of every track playing in it"""
+        for track in self.tracks:
+            if k < track.segments:
+                await track.key(self.cache, k)
+        return self._record(k)
+
+    async def stream(self) -> AsyncIterator[bytes]:
+        """Yield the WAV header followed by PCM for each mix segment"""
+        yield self.header()
+        plan = await asyncio.to_thread(self.cache.get, self.plan_key)
+        previous = [[tuple(entry) for entry in record] for record in json.loads(plan)] if plan else []
+        records = []
+        for k in range(self.segments):
+            record = await self.record(k)
+            records.append(record)
+            frames = min(self.segment_frames, self.frames - k * self.segment_frames)
+            mix = await self._segment(k, record, previous[k] if k < len(previous) else None, frames)
+            yield await asyncio.to_thread(_encode, mix)
+        await asyncio.to_thread(self.cache.put, self.plan_key, json.dumps(records).encode())
+
+    async def _segment(self, k: int, record: List[Entry], previous: Optional[List[Entry]], frames: int) -> np.ndarray:
+        key = record_key(record)
+        data = await asyncio.to_thread(self.cache.get, key)
+        if data is not None:
+            return np.frombuffer(data, "<f4").reshape(-1, OUTPUT_CHANNELS)
+
+        # Each track's stem is read at most once per segment, even when its gains changed
+        stems: Dict[str, np.ndarray] = {}
+        base, terms = None, None
+        if previous is not None:
+            old = await asyncio.to_thread(self.cache.get, record_key(previous))
+            if old is not None and len(old) == frames * OUTPUT_CHANNELS * 4:
+                base = np.frombuffer(old, "<f4").reshape(-1, OUTPUT_CHANNELS)
+                terms = await self._patch(k, set(previous) - set(record), set(record) - set(previous), frames, stems)
+        if terms is None:
+            base = np.zeros((frames, OUTPUT_CHANNELS), np.float32)
+            terms = [(await self._stem(k, entry[0], stems), entry, 1.0) for entry in record]
+        return await asyncio.to_thread(self._mix, key, base, terms)
+
+    def _mix(self, key: str, base: np.ndarray, terms: List[Tuple[np.ndarray, Entry, float]]) -> np.ndarray:
+        """Add every track's contribution to ``base`` and cache the result"""
+        mix = base.copy()
+        with timed("mix"):
+            for block, entry, sign in terms:
+                mix[:, 0] += block[:, 0] * (sign * entry[2])
+                mix[:, 1] += block[:, -1] * (sign * entry[3])
+        self.cache.put(key, mix.astype("<f4").tobytes())
+        return mix
+
+    async def _stem(self, k: int, track_id: str, stems: Dict[str, np.ndarray]) -> np.ndarray:
+        if track_id not in stems:
+            stems[track_id] = await self.by_id[track_id].stem(self.cache, k)
+        return stems[track_id]
+
+    async def _patch(self, k: int, removed, added, frames: int,
+                     stems: Dict[str, np.ndarray]) -> Optional[List[Tuple[np.ndarray, Entry, float]]]:
+        """Terms taking the previous mix to this one: the contributions that went away, negated, and the new ones"""
+        terms = []
+        for entry in removed:
+            track = self.by_id.get(entry[0])
+            if track is not None and k < track.segments and track.keys[k] == entry[1]:
+                # Same audio at new gains: the stem is still at hand
+                block = await self._stem(k, entry[0], stems)
+            else:
+                old = await asyncio.to_thread(self.cache.get, entry[1])
+                if old is None:
+                    return None
+                block = np.frombuffer(old, "<f4").reshape(frames, -1)
+            terms.append((block, entry, -1.0))
+        for entry in added:
+            terms.append((await self._stem(k, entry[0], stems), entry, 1.0))
+        return terms
+
+
+def _encode(mix: np.ndarray) -> bytes:
+    with timed("encode"):
+        return float_to_pcm(mix, 16)
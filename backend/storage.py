@@ -0,0 +1,119 @@
+"""Project persistence.
+
+``ProjectStore`` owns every access to the ``projects`` collection. It creates
+the indexes the API's lookups rely on and keeps a small in-process TTL/LRU
+cache of project metadata (documents without inline audio). Every write goes
+through the store and drops the cached copy of the project it touched; the TTL
+bounds staleness when several server processes share one database.
+"""
+import copy
+import logging
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+METADATA_PROJECTION = {"_id": 0, "tracks.audio_data": 0}
+
+
+class ProjectStore:
+    def __init__(self, db, cache_size: int = 1024, cache_ttl: float = 30.0):
+        self.collection = db.projects
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.cache: "OrderedDict[str, tuple]" = OrderedDict()
+        # Bumped on every invalidation so reads racing a write don't cache stale data
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def ensure_indexes(self):
+        indexes = [
+            ([("id", ASCENDING)], {"unique": True}),
+            ([("tracks.id", ASCENDING)], {}),
+            # Keyset pagination of the project list
+            ([("updated_at", DESCENDING), ("id", DESCENDING)], {}),
+        ]
+        for keys, options in indexes:
+            try:
+                await self.collection.create_index(keys, **options)
+            except OperationFailure:
+                logger.exception("Could not create index %s on projects", keys)
+
+    async def get(self, project_id: str) -> Optional[dict]:
+        """Project metadata without inline audio, served from cache when fresh"""
+        entry = self.cache.get(project_id)
+        if entry is not None and entry[0] > time.monotonic():
+            self.cache.move_to_end(project_id)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+        self.misses += 1
+        generation = self.generation
+        project = await self.collection.find_one({"id": project_id}, METADATA_PROJECTION)
+        if project is not None and generation == self.generation:
+            self.cache[project_id] = (time.monotonic() + self.cache_ttl, copy.deepcopy(project))
+            self.cache.move_to_end(project_id)
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return project
+
+    async def exists(self, project_id: str) -> bool:
+        return await self.get(project_id) is not None
+
+    def invalidate(self, project_id: str):
+        self.generation += 1
+        self.cache.pop(project_id, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self.cache), "hits": self.hits, "misses": self.misses}
+
+    # Uncached reads for queries that need audio or span many projects
+
+    async def find_one(self, query: dict, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one(query, projection)
+
+    def find(self, query: dict, projection: Optional[dict] = None):
+        return self.collection.find(query, projection)
+
+    def aggregate(self, pipeline: List[dict]):
+        return self.collection.aggregate(pipeline)
+
+    # Writes; each one invalidates the project it touches
+
+    async def insert(self, project: dict):
+        self.invalidate(project["id"])
+        return await self.collection.insert_one(project)
+
+    async def update_one(self, query: dict, update: dict, **kwargs):
+        try:
+            return await self.collection.update_one(query, update, **kwargs)
+        finally:
+            self.invalidate(query["id"])
+
+    async def find_one_and_update(self, query: dict, update: dict, **kwargs):
+        try:
+            return await self.collection.find_one_and_update(query, update, **kwargs)
+        finally:
+            self.invalidate(query["id"])
+
+    async def replace_one(self, project_id: str, project: dict):
+        try:
+            return await self.collection.replace_one({"id": project_id}, project)
+        finally:
+            self.invalidate(project_id)
+
+    async def bulk_write(self, project_id: str, operations: list, **kwargs):
+        try:
+            return await self.collection.bulk_write(operations, **kwargs)
+        finally:
+            self.invalidate(project_id)
+
+    async def delete(self, project_id: str):
+        try:
+            return await self.collection.delete_one({"id": project_id})
+        finally:
+            self.invalidate(project_id)
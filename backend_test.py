@@ -85,11 +85,12 @@ class DAWAPITester:
             
             if response.status_code == 200:
                 data = response.json()
-                if isinstance(data, list) and len(data) > 0:
-                    # Check if our test project is in the list
-                    project_found = any(p.get("id") == self.test_project_id for p in data)
+                items = data.get("items") if isinstance(data, dict) else None
+                if isinstance(items, list) and len(items) > 0:
+                    # Check if our test project is in the first page
+                    project_found = any(p.get("id") == self.test_project_id for p in items)
                     if project_found:
-                        self.log(f"✅ Get all projects test PASSED - Found {len(data)} projects")
+                        self.log(f"✅ Get all projects test PASSED - Found {len(items)} projects")
                         return True
                     else:
                         self.log(f"❌ Get all projects test FAILED - Test project not found in list")
@@ -156,7 +157,8 @@ class DAWAPITester:
                 data = response.json()
                 if (data.get("name") == "Lead Vocal" and 
                     data.get("duration") == 180.5 and 
-                    data.get("audio_data") == sample_audio):
+                    data.get("audio_ref") and
+                    data.get("audio_size") == len(base64.b64decode(sample_audio))):
                     self.test_track_id = data.get("id")
                     self.log(f"✅ Add audio track test PASSED - Track ID: {self.test_track_id}")
                     return True
@@ -170,6 +172,31 @@ class DAWAPITester:
             self.log(f"❌ Add audio track test FAILED - Error: {str(e)}")
             return False
     
+    def test_stream_track_audio(self):
+        """Test 5b: Stream track audio with and without a Range header"""
+        self.log("Testing track audio streaming...")
+        try:
+            if not self.test_project_id or not self.test_track_id:
+                self.log("❌ Track audio streaming test FAILED - Missing project or track ID")
+                return False
+            
+            url = f"{self.base_url}/projects/{self.test_project_id}/tracks/{self.test_track_id}/audio"
+            full = self.session.get(url)
+            partial = self.session.get(url, headers={"Range": "bytes=0-5"})
+            
+            if (full.status_code == 200 and
+                full.content == b"sample_audio_data_for_testing" and
+                partial.status_code == 206 and
+                partial.content == b"sample"):
+                self.log("✅ Track audio streaming test PASSED")
+                return True
+            else:
+                self.log(f"❌ Track audio streaming test FAILED - Status: {full.status_code}/{partial.status_code}")
+                return False
+        except Exception as e:
+            self.log(f"❌ Track audio streaming test FAILED - Error: {str(e)}")
+            return False
+    
     def test_update_track_properties(self):
         """Test 6: Update track properties (volume, mute, solo)"""
         self.log("Testing update track properties...")
@@ -293,6 +320,7 @@ class DAWAPITester:
             ("Get All Projects", self.test_get_all_projects),
             ("Get Project by ID", self.test_get_project_by_id),
             ("Add Audio Track", self.test_add_audio_track),
+            ("Stream Track Audio", self.test_stream_track_audio),
             ("Update Track Properties", self.test_update_track_properties),
             ("Delete Track", self.test_delete_track),
             ("Delete Project", self.test_delete_project),
@@ -0,0 +1,133 @@
+"""Shared fixtures: backend modules importable, and the app on an in-memory MongoDB."""
+import base64
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+sys.path.insert(0, str(BACKEND))
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "daw_tests")
+os.environ.setdefault("RENDER_CACHE_DIR", tempfile.mkdtemp(prefix="daw-tests-"))
+
+
+def sine_wav(seconds: float = 1.0, frequency: float = 440.0, level: float = 0.3,
+             sample_rate: int = 44100, channels: int = 2) -> bytes:
+    from audio_io import encode_wav
+
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    tone = (level * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+    return encode_wav(np.repeat(tone[:, None], channels, axis=1), sample_rate)
+
+
+def wav_payload(wav: bytes) -> str:
+    return "data:audio/wav;base64," + base64.b64encode(wav).decode("ascii")
+
+
+def _resolve_array_filters(update: dict, document: dict, array_filters: list) -> dict:
+    """``update`` with every ``$[identifier]`` replaced by the indexes its filter matches in ``document``"""
+    from mongomock import WriteError
+    from mongomock.filtering import filter_applies
+
+    conditions = {}
+    for array_filter in array_filters:
+        for key, condition in array_filter.items():
+            identifier, _, field = key.partition(".")
+            conditions.setdefault(identifier, {})[field] = condition
+    used = set()
+
+    def expand(value, parts):
+        if not parts:
+            return [[]]
+        head, rest = parts[0], parts[1:]
+        if not (head.startswith("$[") and head.endswith("]")):
+            child = value.get(head) if isinstance(value, dict) else None
+            return [[head, *tail] for tail in expand(child, rest)]
+        identifier = head[2:-1]
+        if identifier not in conditions:
+            raise WriteError(f"No array filter found for identifier '{identifier}'")
+        used.add(identifier)
+        return [[str(index), *tail]
+                for index, item in enumerate(value if isinstance(value, list) else [])
+                if isinstance(item, dict) and filter_applies(conditions[identifier], item)
+                for tail in expand(item, rest)]
+
+    resolved = {
+        operator: {".".join(path): value
+                   for key, value in fields.items() for path in expand(document, key.split("."))}
+        for operator, fields in update.items()
+    }
+    unused = set(conditions) - used
+    if unused:
+        raise WriteError(f"The array filter for identifier '{unused.pop()}' was not used in the update")
+    return {operator: fields for operator, fields in resolved.items() if fields}
+
+
+@pytest.fixture
+def memory_db(monkeypatch):
+    """An in-memory database, taught the array filters the app's track updates use"""
+    from mongomock.collection import BulkOperationBuilder, BulkWriteOperation, Collection
+    from mongomock_motor import AsyncMongoMockClient
+
+    update = Collection._update
+
+    def _update(self, spec, document, upsert=False, manipulate=False, multi=False, check_keys=False,
+                hint=None, session=None, collation=None, let=None, array_filters=None, **kwargs):
+        if not array_filters:
+            return update(self, spec, document, upsert=upsert, multi=multi, hint=hint, session=session,
+                          collation=collation, let=let, **kwargs)
+        matched = modified = 0
+        for existing in list(self._iter_documents(spec)):
+            resolved = _resolve_array_filters(document, existing, array_filters)
+            matched += 1
+            if resolved:
+                modified += update(self, {"_id": existing["_id"]}, resolved)["nModified"]
+            if not multi:
+                break
+        return {"connectionId": self.database.client._id, "err": None, "n": matched, "nModified": modified,
+                "ok": 1, "upserted": None, "updatedExisting": matched > 0}
+
+    def add_update(self, selector, doc, multi=False, upsert=False, collation=None, array_filters=None, hint=None):
+        BulkWriteOperation(self, selector, is_upsert=upsert).register_update_op(
+            doc, multi, hint=hint, array_filters=array_filters)
+
+    monkeypatch.setattr(Collection, "_update", _update)
+    monkeypatch.setattr(BulkOperationBuilder, "add_update", add_update)
+    return AsyncMongoMockClient()["daw_tests"]
+
+
+@pytest.fixture
+def app(memory_db, tmp_path):
+    """The server module with every store pointed at a fresh in-memory database"""
+    import server
+    from audio_store import AudioStore
+    from history import ProjectHistory
+    from render_cache import RenderCache
+    from storage import ProjectStore
+
+    saved = {name: getattr(server, name) for name in ("db", "audio_store", "project_store", "project_history",
+                                                      "render_cache")}
+    server.db = memory_db
+    server.audio_store = AudioStore(memory_db)
+    server.project_store = ProjectStore(memory_db)
+    server.project_history = ProjectHistory(memory_db, server.audio_store)
+    server.render_cache = RenderCache(tmp_path / "render_cache", 64 * 1024 * 1024, 256 * 1024 * 1024)
+    server.live_sessions.projects = server.project_store
+    server.live_sessions.sessions.clear()
+    yield server
+    for name, value in saved.items():
+        setattr(server, name, value)
+    server.live_sessions.projects = server.project_store
+
+
+@pytest.fixture
+def client(app):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app.app) as test_client:
+        yield test_client
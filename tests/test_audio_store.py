@@ -0,0 +1,59 @@
+import asyncio
+import base64
+import os
+
+from audio_store import AudioStore, content_hash
+from tests.conftest import sine_wav, wav_payload
+
+
+def test_ranges_read_only_overlapping_chunks_and_identical_audio_is_stored_once(memory_db):
+    async def run():
+        store = AudioStore(memory_db, chunk_size=1000)
+        data = os.urandom(4500)
+        ref = await store.put(data)
+        assert ref == content_hash(data) and await store.size(ref) == 4500
+        assert await store.read(ref) == data
+        for start, end in ((0, 1), (999, 1001), (1500, 4200), (4000, 9999)):
+            assert await store.read(ref, start, end) == data[start:end]
+        assert [len(part) async for part in store.iter_range(ref, 999, 2001)] == [1, 1000, 1]
+
+        async def pieces():
+            for offset in range(0, len(data), 700):
+                yield data[offset:offset + 700]
+        assert await store.put_stream(pieces()) == ref
+        # A blob sharing its first chunks adds only the chunks that differ
+        assert await store.put(data[:2000] + b"x") != ref
+        assert await memory_db.audio_blobs.count_documents({}) == 2
+        assert await memory_db.audio_chunks.count_documents({}) == 6
+    asyncio.run(run())
+
+
+def test_track_audio_is_served_with_range_support(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    audio = os.urandom(3000)
+    track = client.post(f"/api/projects/{project['id']}/tracks", json={
+        "name": "Loop", "duration": 1.0, "audio_data": "data:audio/mpeg;base64," + base64.b64encode(audio).decode(),
+    }).json()
+    assert track["audio_ref"] == content_hash(audio) and track.get("audio_data") is None
+    url = f"/api/projects/{project['id']}/tracks/{track['id']}/audio"
+
+    full = client.get(url)
+    assert full.status_code == 200 and full.content == audio
+    assert full.headers["content-type"] == "audio/mpeg" and full.headers["accept-ranges"] == "bytes"
+    partial = client.get(url, headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206 and partial.content == audio[100:200]
+    assert partial.headers["content-range"] == "bytes 100-199/3000"
+    assert client.get(url, headers={"Range": "bytes=-10"}).content == audio[-10:]
+    assert client.get(url, headers={"Range": "bytes=2990-"}).content == audio[2990:]
+    unsatisfiable = client.get(url, headers={"Range": "bytes=5000-"})
+    assert unsatisfiable.status_code == 416 and unsatisfiable.headers["content-range"] == "bytes */3000"
+
+
+def test_legacy_inline_audio_is_still_served(client, app):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    wav = sine_wav(0.1)
+    legacy = {"id": "old", "name": "Old", "duration": 0.1, "audio_data": wav_payload(wav)}
+    # Tracks stored before the chunk store kept their audio in the project document
+    asyncio.run(app.project_store.update_one({"id": project["id"]}, {"$push": {"tracks": legacy}}))
+    response = client.get(f"/api/projects/{project['id']}/tracks/old/audio", headers={"Range": "bytes=0-43"})
+    assert response.status_code == 206 and response.content == wav[:44]
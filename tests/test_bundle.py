@@ -0,0 +1,130 @@
+import asyncio
+import io
+import json
+import tarfile
+
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from audio_store import AudioStore
+from bundle import BundleError, BundleReader, BundleWriter, import_blobs
+from tests.conftest import sine_wav, wav_payload
+
+
+def bytes_reader(data: bytes):
+    stream = io.BytesIO(data)
+
+    async def read(size):
+        return stream.read(size)
+    return BundleReader(read)
+
+
+def exported_project(client):
+    project = client.post("/api/projects", json={"name": "Song", "tempo": 90}).json()
+    base = f"/api/projects/{project['id']}"
+    for name, frequency in (("Lead", 440), ("Bass", 110)):
+        client.post(f"{base}/tracks", json={
+            "name": name, "duration": 1.0, "audio_data": wav_payload(sine_wav(0.5, frequency=frequency)),
+        })
+    response = client.get(f"{base}/export")
+    assert response.status_code == 200
+    assert int(response.headers["Content-Length"]) == len(response.content)
+    return client.get(base).json(), response.content
+
+
+def test_export_is_a_tar_of_the_manifest_and_blobs(client):
+    project, bundle = exported_project(client)
+    with tarfile.open(fileobj=io.BytesIO(bundle)) as archive:
+        names = archive.getnames()
+        manifest = json.load(archive.extractfile("project.json"))
+        assert names[0] == "project.json"
+        refs = {track[field] for track in project["tracks"] for field in ("audio_ref", "peaks_ref") if track[field]}
+        assert set(names[1:]) == {f"audio/{ref}" for ref in refs}
+        for ref, size in manifest["blobs"].items():
+            assert archive.getmember(f"audio/{ref}").size == size
+    assert manifest["project"]["name"] == "Song"
+
+
+def test_import_creates_a_copy_and_deduplicates_audio(client):
+    project, bundle = exported_project(client)
+    response = client.post("/api/projects/import", files={"file": ("song.tar", bundle, "application/x-tar")})
+    assert response.status_code == 200
+    result = response.json()
+    assert result["blobs_stored"] == 0 and result["blobs_deduplicated"] == len(json.load(
+        tarfile.open(fileobj=io.BytesIO(bundle)).extractfile("project.json"))["blobs"])
+    copy = result["project"]
+    assert copy["id"] != project["id"] and copy["tempo"] == 90
+    original_audio = client.get(f"/api/projects/{project['id']}/tracks/{project['tracks'][0]['id']}/audio")
+    copied_audio = client.get(f"/api/projects/{copy['id']}/tracks/{copy['tracks'][0]['id']}/audio")
+    assert copied_audio.content == original_audio.content
+    assert client.get(f"/api/projects/{copy['id']}/history").json()["items"][0]["version"] == 1
+
+
+def test_blobs_round_trip_into_an_empty_store():
+    async def run():
+        source = AudioStore(AsyncMongoMockClient()["source"], chunk_size=1000)
+        target = AudioStore(AsyncMongoMockClient()["target"], chunk_size=700)
+        audio = sine_wav(0.3)
+        ref = await source.put(audio)
+        project = {"id": "p", "name": "Song", "tracks": [
+            {"id": "t", "audio_ref": ref, "peaks_ref": "missing"},
+        ]}
+        writer = await BundleWriter.open(project, source)
+        bundle = b"".join([part async for part in writer.stream()])
+        assert len(bundle) == writer.content_length
+
+        reader = bytes_reader(bundle)
+        manifest = await reader.read_manifest()
+        # References to blobs that are gone are dropped on export
+        assert manifest["project"]["tracks"][0]["peaks_ref"] is None
+        assert await import_blobs(reader, target) == {ref: True}
+        assert await target.read(ref) == audio
+        # Blobs already stored are skipped, not read
+        assert await import_blobs(bytes_reader(bundle[bundle.index(b"audio/"):]), target) == {ref: False}
+    asyncio.run(run())
+
+
+def test_corrupt_bundles_are_rejected(client):
+    _, bundle = exported_project(client)
+
+    def post(data):
+        return client.post("/api/projects/import", files={"file": ("song.tar", data, "application/x-tar")})
+    assert post(b"not a tar file" * 100).status_code == 400
+    assert post(bundle[:len(bundle) // 2]).status_code == 400
+    # Cut at an entry boundary, before the end-of-archive blocks
+    assert post(bundle[:-1024]).status_code == 400
+
+    # A blob whose bytes do not hash to its name
+    tampered = bytearray(bundle)
+    with tarfile.open(fileobj=io.BytesIO(bundle)) as archive:
+        member = archive.getmember(archive.getnames()[1])
+    tampered[member.offset_data] ^= 0xFF
+
+    async def run():
+        store = AudioStore(AsyncMongoMockClient()["empty"])
+        reader = bytes_reader(bytes(tampered))
+        await reader.read_manifest()
+        with pytest.raises(BundleError):
+            await import_blobs(reader, store)
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("manifest", [
+    {"format": "daw-project", "version": "2", "project": {}},
+    {"format": "daw-project", "version": None, "project": {}},
+    {"format": "daw-project", "version": 99, "project": {}},
+    ["not", "a", "manifest"],
+])
+def test_unsupported_manifests_are_rejected(client, manifest):
+    from bundle import FORMAT
+
+    if isinstance(manifest, dict):
+        manifest["format"] = FORMAT
+    data = json.dumps(manifest).encode()
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        info = tarfile.TarInfo("project.json")
+        info.size = len(data)
+        archive.addfile(info, io.BytesIO(data))
+    response = client.post("/api/projects/import", files={"file": ("song.tar", buffer.getvalue(), "application/x-tar")})
+    assert response.status_code == 400
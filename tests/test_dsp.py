@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from dsp import EFFECTS, check_effects, process_signal
+from tests.conftest import sine_wav, wav_payload
+
+CHAIN = [
+    {"type": "EQ", "parameters": [{"name": "Low", "value": 6}, {"name": "High", "value": -3}]},
+    {"type": "Compressor", "parameters": {"Threshold": -20, "Ratio": 4}},
+    {"type": "Delay", "parameters": {"Time": 120, "Feedback": 40, "Mix": 30}},
+    {"type": "Reverb", "parameters": {"Mix": 25}},
+    {"type": "Distortion", "parameters": {"Drive": 20}},
+]
+
+
+def test_block_size_does_not_change_the_output():
+    rng = np.random.default_rng(0)
+    samples = (0.3 * rng.standard_normal((20000, 2))).astype(np.float32)
+    whole = process_signal(samples, 44100, CHAIN, block_size=len(samples))
+    blocked = process_signal(samples, 44100, CHAIN, block_size=1000)
+    assert whole.shape == samples.shape and np.allclose(whole, blocked, atol=1e-5)
+    assert not np.allclose(whole, samples)
+
+
+def test_disabled_and_unknown_effects_pass_audio_through():
+    samples = np.ones((100, 2), np.float32)
+    effects = [{"type": "Reverb", "enabled": False, "parameters": {"Mix": 50}}, {"type": "Chorus"}]
+    assert process_signal(samples, 44100, effects) is samples
+
+
+@pytest.mark.parametrize("parameters", [
+    {"Mix": "abc"},
+    {"Mix": None},
+    {"Mix": "nan"},
+    [{"name": "Mix", "value": "abc"}],
+])
+def test_malformed_parameters_are_rejected(parameters):
+    with pytest.raises(ValueError):
+        check_effects([{"type": "Reverb", "parameters": parameters}])
+
+
+def test_malformed_parameters_are_a_validation_error(client):
+    effects = [{"type": "Reverb", "parameters": {"Mix": "abc"}}]
+    response = client.post("/api/audio/process", json={"audio_data": wav_payload(sine_wav(0.2)), "effects": effects})
+    assert response.status_code == 422
+    assert client.post("/api/jobs", json={"kind": "process", "audio_data": wav_payload(sine_wav(0.2)),
+                                          "effects": effects}).status_code == 422
+
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    track = client.post(f"/api/projects/{project['id']}/tracks", json={
+        "name": "Lead", "duration": 1.0, "audio_data": wav_payload(sine_wav(0.2)),
+    }).json()
+    url = f"/api/projects/{project['id']}/tracks/{track['id']}"
+    assert client.put(url, json={"effects": effects}).status_code == 422
+    assert client.get(f"/api/projects/{project['id']}").json()["tracks"][0]["effects"] == []
+
+
+def test_process_applies_every_effect_type(client):
+    effects = [{"type": name, "parameters": {}} for name in EFFECTS]
+    response = client.post("/api/audio/process", json={"audio_data": wav_payload(sine_wav(0.2)), "effects": effects})
+    assert response.status_code == 200
+    assert [e["type"] for e in response.json()["effects_applied"]] == list(EFFECTS)
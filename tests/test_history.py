@@ -0,0 +1,205 @@
+import asyncio
+import copy
+import random
+
+from tests.conftest import sine_wav, wav_payload
+from history import ProjectHistory, apply_patch, diff
+
+
+def random_edit(rng: random.Random, project: dict, step: int) -> dict:
+    project = copy.deepcopy(project)
+    roll = rng.random()
+    if roll < 0.25:
+        project["tracks"].append({"id": f"t{step}", "volume": 1.0, "effects": [], "name": f"Track {step}"})
+    elif roll < 0.4 and project["tracks"]:
+        project["tracks"].pop(rng.randrange(len(project["tracks"])))
+    elif roll < 0.5 and len(project["tracks"]) > 1:
+        rng.shuffle(project["tracks"])
+    elif roll < 0.8 and project["tracks"]:
+        track = rng.choice(project["tracks"])
+        track["volume"] = round(rng.random(), 3)
+        track["effects"].append({"type": "Reverb", "parameters": {"Mix": rng.random()}})
+    else:
+        project["tempo"] += 1
+        project["a/b~c"] = step
+    return project
+
+
+def test_diff_apply_round_trip():
+    rng = random.Random(7)
+    project = {"id": "p", "name": "Song", "tempo": 120, "tracks": []}
+    for step in range(300):
+        edited = random_edit(rng, project, step)
+        assert apply_patch(project, diff(project, edited)) == edited
+        project = edited
+
+
+def test_diff_of_equal_documents_is_empty():
+    document = {"tracks": [{"id": "a", "effects": [{"type": "EQ"}]}], "tempo": 120}
+    assert diff(document, copy.deepcopy(document)) == []
+    # A bool is not the same value as the int it compares equal to
+    assert diff({"solo": 1}, {"solo": True}) == [{"op": "replace", "path": "/solo", "value": True}]
+
+
+def test_versions_rebuild_across_checkpoints(memory_db):
+    class Store:
+        def __init__(self):
+            self.blobs = {}
+
+        async def put(self, data):
+            self.blobs[str(len(self.blobs))] = data
+            return str(len(self.blobs) - 1)
+
+        async def read(self, ref):
+            return self.blobs[ref]
+
+    async def run():
+        history = ProjectHistory(memory_db, Store(), checkpoint_interval=5)
+        rng = random.Random(3)
+        project = {"id": "p", "name": "Song", "tempo": 120, "tracks": []}
+        recorded = []
+        for step in range(23):
+            project = random_edit(rng, project, step)
+            version = await history.record(project, f"Edit {step}")
+            if version:
+                recorded.append((version, copy.deepcopy(project)))
+        # Rebuild from the collection rather than the in-memory head
+        history.heads.clear()
+        for version, expected in recorded:
+            assert await history.state("p", version) == expected
+        kinds = {entry["version"]: entry["kind"] for entry in await history.versions("p", 100)}
+        assert kinds[1] == "checkpoint" and kinds[5] == "checkpoint" and kinds[6] == "delta"
+    asyncio.run(run())
+
+
+def test_record_changes_matches_full_record(memory_db):
+    async def run():
+        history = ProjectHistory(memory_db, None)
+        project = {"id": "p", "name": "Song", "tempo": 120, "tracks": [
+            {"id": "a", "volume": 1.0, "effects": []},
+            {"id": "b", "volume": 1.0, "effects": []},
+        ]}
+        await history.record(project, "Create")
+
+        async def unused_load():
+            raise AssertionError("the project should not be read while its head is cached")
+
+        await history.record_changes("p", "Volume", unused_load, fields={"tempo": 96},
+                                     tracks={"b": {"volume": 0.5, "effects": [{"type": "EQ"}]}})
+        await history.record_changes("p", "Delete", unused_load, removed=["a"],
+                                     added=[{"id": "c", "volume": 0.8, "effects": []}])
+        assert await history.record_changes("p", "No-op", unused_load, fields={"tempo": 96}) is None
+
+        expected = {"id": "p", "name": "Song", "tempo": 96, "tracks": [
+            {"id": "b", "volume": 0.5, "effects": [{"type": "EQ"}]},
+            {"id": "c", "volume": 0.8, "effects": []},
+        ]}
+        history.heads.clear()
+        assert await history.state("p", 3) == expected
+
+        async def load():
+            return {**expected, "name": "Song 2"}
+
+        # Without a cached head the written project is read and diffed
+        assert await history.record_changes("p", "Rename", load, fields={"name": "Song 2"}) == 4
+        assert (await history.state("p", 4))["name"] == "Song 2"
+    asyncio.run(run())
+
+
+def test_edits_are_recorded_and_revertable(client):
+    project = client.post("/api/projects", json={"name": "Song", "tempo": 100}).json()
+    base = f"/api/projects/{project['id']}"
+    track = client.post(f"{base}/tracks", json={
+        "name": "Lead", "duration": 1.0, "audio_data": wav_payload(sine_wav(0.5)),
+    }).json()
+    client.put(f"{base}/tracks/{track['id']}", json={"volume": 0.25, "muted": True})
+    client.put(base, json={"name": "Song (mix 2)"})
+
+    history = client.get(f"{base}/history").json()["items"]
+    assert [entry["version"] for entry in history] == [4, 3, 2, 1]
+    assert history[1]["summary"] == "Update track Lead"
+
+    before_mix = client.get(f"{base}/history/2").json()
+    assert before_mix["tracks"][0]["volume"] == 1.0
+    assert before_mix["name"] == "Song"
+
+    reverted = client.post(f"{base}/history/2/revert").json()
+    assert reverted["tracks"][0]["volume"] == 1.0
+    assert reverted["name"] == "Song"
+    current = client.get(base).json()
+    assert current["tracks"][0]["muted"] is False
+    assert client.get(f"{base}/history").json()["items"][0]["summary"] == "Revert to version 2"
+
+
+def test_history_of_unknown_version_is_404(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    assert client.get(f"/api/projects/{project['id']}/history/99").status_code == 404
+    assert client.post(f"/api/projects/{project['id']}/history/99/revert").status_code == 404
+    assert client.get("/api/projects/missing/history").status_code == 404
+
+
+def test_concurrent_edits_leave_history_matching_the_project(client, app, monkeypatch):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    track = client.post(f"/api/projects/{project['id']}/tracks", json={
+        "name": "Lead", "duration": 1.0, "audio_data": wav_payload(sine_wav(0.2)),
+    }).json()
+    write = app.project_store.find_one_and_update
+    delays = [0.05, 0.0]
+
+    async def slow_write(*args, **kwargs):
+        result = await write(*args, **kwargs)
+        # The first edit is stored first but would be recorded last without the lock
+        await asyncio.sleep(delays.pop(0))
+        return result
+    monkeypatch.setattr(app.project_store, "find_one_and_update", slow_write)
+
+    async def edits():
+        await asyncio.gather(
+            app.update_track(project["id"], track["id"], app.TrackUpdate(volume=0.1)),
+            app.update_track(project["id"], track["id"], app.TrackUpdate(volume=0.9)),
+        )
+    asyncio.run(edits())
+    stored = client.get(f"/api/projects/{project['id']}").json()["tracks"][0]["volume"]
+    latest = client.get(f"/api/projects/{project['id']}/history").json()["items"][0]["version"]
+    versioned = client.get(f"/api/projects/{project['id']}/history/{latest}").json()["tracks"][0]["volume"]
+    assert stored == versioned == 0.9
+
+
+def test_revert_keeps_derived_fields_of_unchanged_audio(client):
+    project = client.post("/api/projects", json={"name": "Song", "key": "A"}).json()
+    base = f"/api/projects/{project['id']}"
+    track = client.post(f"{base}/tracks", json={
+        "name": "Lead", "duration": 1.0, "audio_data": wav_payload(sine_wav(0.5, frequency=450)),
+    }).json()
+    client.put(f"{base}/tracks/{track['id']}", json={"volume": 0.5})
+    # Detecting pitch stores a pitch track outside of any recorded edit
+    client.post("/api/audio/process", json={"project_id": project["id"], "track_id": track["id"],
+                                            "effects": [{"type": "Auto-Tune", "parameters": {"Correction": 100}}]})
+    pitch_ref = client.get(base).json()["tracks"][0]["pitch_ref"]
+    assert pitch_ref
+
+    reverted = client.post(f"{base}/history/2/revert").json()["tracks"][0]
+    assert reverted["volume"] == 1.0
+    assert reverted["pitch_ref"] == pitch_ref and reverted["peaks_ref"] == track["peaks_ref"]
+    assert reverted["loudness"] == track["loudness"]
+
+
+def test_legacy_inline_audio_is_versioned_by_reference(memory_db):
+    from audio_store import AudioStore
+
+    async def run():
+        store = AudioStore(memory_db)
+        history = ProjectHistory(memory_db, store)
+        wav = sine_wav(0.1)
+        project = {"id": "p", "name": "Song", "tracks": [
+            {"id": "a", "name": "Old", "audio_data": wav_payload(wav), "peaks_ref": "derived"},
+        ]}
+        await history.record(project, "Create")
+        track = (await history.state("p", 1))["tracks"][0]
+        assert "audio_data" not in track and "peaks_ref" not in track
+        assert track["content_type"] == "audio/wav" and track["audio_size"] == len(wav)
+        assert await store.read(track["audio_ref"]) == wav
+        # The same audio once moved to the chunk store is no change at all
+        migrated = {**project, "tracks": [{k: v for k, v in track.items()}]}
+        assert await history.record(migrated, "Migrate") is None
+    asyncio.run(run())
@@ -0,0 +1,174 @@
+import base64
+import time
+
+import pytest
+
+from tests.conftest import sine_wav, wav_payload
+
+AUTOTUNE = [{"type": "Auto-Tune", "parameters": {"Correction": 100, "Speed": 100}}]
+
+
+@pytest.fixture
+def jobs(app, monkeypatch):
+    from jobs import JobManager
+
+    manager = JobManager(max_workers=1, max_queue=2)
+    monkeypatch.setattr(app, "job_manager", manager)
+    yield manager
+    manager.shutdown()
+
+
+def wait(client, job_id, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f"/api/jobs/{job_id}").json()
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def add_track(client, project_id, seconds=0.5):
+    return client.post(f"/api/projects/{project_id}/tracks", json={
+        "name": "Vocal", "duration": 1.0, "audio_data": wav_payload(sine_wav(seconds, frequency=450)),
+    }).json()
+
+
+def test_process_jobs_keep_and_reuse_pitch_tracks(client, jobs, monkeypatch):
+    project = client.post("/api/projects", json={"name": "Song", "key": "A"}).json()
+    track = add_track(client, project["id"])
+    request = {"kind": "process", "project_id": project["id"], "track_id": track["id"], "effects": AUTOTUNE}
+
+    given = []
+    submit = jobs.submit_process
+
+    def spying_submit(*args, **kwargs):
+        given.append(kwargs.get("pitch_track"))
+        return submit(*args, **kwargs)
+    monkeypatch.setattr(jobs, "submit_process", spying_submit)
+
+    first = wait(client, client.post("/api/jobs", json=request).json()["id"])
+    assert first["status"] == "done"
+    pitch_ref = client.get(f"/api/projects/{project['id']}").json()["tracks"][0]["pitch_ref"]
+    assert pitch_ref
+
+    second = wait(client, client.post("/api/jobs", json=request).json()["id"])
+    assert second["status"] == "done"
+    assert given[0] is None and given[1] is not None
+    assert client.get(f"/api/jobs/{second['id']}/result").content == client.get(
+        f"/api/jobs/{first['id']}/result").content
+
+
+def test_process_job_matches_synchronous_processing(client, jobs):
+    audio = wav_payload(sine_wav(0.5))
+    effects = [{"type": "Delay", "parameters": {"Time": 50}}, {"type": "Reverb", "parameters": {"Mix": 30}}]
+    job = wait(client, client.post("/api/jobs", json={"kind": "process", "audio_data": audio,
+                                                      "effects": effects}).json()["id"])
+    assert job["status"] == "done" and job["progress"] == 1.0
+    processed = client.post("/api/audio/process", json={"audio_data": audio, "effects": effects}).json()
+    assert client.get(f"/api/jobs/{job['id']}/result").content == base64.b64decode(processed["processed_audio"])
+
+
+def test_render_job_matches_synchronous_render(client, jobs):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    track = add_track(client, project["id"], seconds=1.0)
+    client.put(f"/api/projects/{project['id']}/tracks/{track['id']}", json={
+        "pan": 0.5, "effects": [{"type": "Reverb", "parameters": {"Mix": 40}}],
+    })
+    job = wait(client, client.post("/api/jobs", json={"kind": "render", "project_id": project["id"]}).json()["id"])
+    assert job["status"] == "done"
+    rendered = client.post(f"/api/projects/{project['id']}/render")
+    assert client.get(f"/api/jobs/{job['id']}/result").content == rendered.content
+    # The worker's segments were adopted, so nothing is mixed again
+    assert rendered.headers["X-Dirty-Segments"] == "0"
+
+
+def test_failed_submission_releases_its_slot_and_memory(client, jobs, monkeypatch):
+    from multiprocessing import shared_memory
+
+    created = []
+    real = shared_memory.SharedMemory
+
+    def recording(*args, **kwargs):
+        block = real(*args, **kwargs)
+        created.append(block.name)
+        return block
+    monkeypatch.setattr(shared_memory, "SharedMemory", recording)
+
+    def broken():
+        raise RuntimeError("pool is broken")
+    monkeypatch.setattr(jobs, "_executor", broken)
+
+    request = {"kind": "process", "audio_data": wav_payload(sine_wav(0.1)), "effects": []}
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            client.post("/api/jobs", json=request)
+    assert sorted(jobs.free_slots) == [0, 1] and not jobs.jobs
+    assert len(created) == 6
+    for name in created:
+        with pytest.raises(FileNotFoundError):
+            real(name=name)
+
+
+def test_full_queue_is_429(client, jobs, monkeypatch):
+    monkeypatch.setattr(jobs, "free_slots", [])
+    response = client.post("/api/jobs", json={"kind": "process", "audio_data": wav_payload(sine_wav(0.1))})
+    assert response.status_code == 429 and response.headers["Retry-After"] == "1"
+
+
+def test_workers_report_progress_through_their_slot():
+    from multiprocessing import shared_memory
+
+    import jobs
+
+    class Recorder(dict):
+        def __setitem__(self, slot, fraction):
+            self.setdefault("seen", []).append((slot, fraction))
+
+    progress = Recorder()
+    jobs._init_worker(progress)
+    wav = sine_wav(1.0)
+    source = shared_memory.SharedMemory(create=True, size=len(wav))
+    target = shared_memory.SharedMemory(create=True, size=len(wav))
+    try:
+        source.buf[:len(wav)] = wav
+        size, detected = jobs._process_worker(3, source.name, len(wav), target.name,
+                                              [{"type": "Reverb", "parameters": {"Mix": 30}}])
+        assert size == len(wav) and detected is None
+    finally:
+        jobs._release([source, target])
+        jobs._init_worker(None)
+    fractions = [fraction for slot, fraction in progress["seen"] if slot == 3]
+    assert len(fractions) == len(progress["seen"]) > 2
+    assert fractions[0] == 0.0 and fractions[-1] == 1.0 and fractions == sorted(fractions)
+
+
+def test_queued_and_running_jobs_are_described(jobs):
+    from jobs import Job
+
+    job = Job("process", slot=0)
+    jobs.progress[0] = -1.0
+    assert (jobs.describe(job)["status"], jobs.describe(job)["progress"]) == ("queued", 0.0)
+    jobs.progress[0] = 0.25
+    assert (jobs.describe(job)["status"], jobs.describe(job)["progress"]) == ("running", 0.25)
+
+
+def test_failed_jobs_report_their_error(client, app, jobs, monkeypatch):
+    async def store_job_output(output):
+        raise RuntimeError("store is down")
+    monkeypatch.setattr(app, "store_job_output", store_job_output)
+
+    job = wait(client, client.post("/api/jobs", json={"kind": "process",
+                                                      "audio_data": wav_payload(sine_wav(0.1))}).json()["id"])
+    assert job["status"] == "failed" and job["error"] == "store is down"
+    assert client.get(f"/api/jobs/{job['id']}/result").status_code == 409
+    # The slot went back to the pool
+    assert sorted(jobs.free_slots) == [0, 1]
+
+
+def test_unknown_jobs_and_bad_requests(client, jobs):
+    assert client.get("/api/jobs/missing").status_code == 404
+    assert client.get("/api/jobs/missing/result").status_code == 404
+    assert client.post("/api/jobs", json={"kind": "process"}).status_code == 400
+    assert client.post("/api/jobs", json={"kind": "render"}).status_code == 400
+    assert client.post("/api/jobs", json={"kind": "render", "project_id": "missing"}).status_code == 404
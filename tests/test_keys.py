@@ -0,0 +1,26 @@
+def test_project_keys_are_normalized_on_create_and_update(client):
+    project = client.post("/api/projects", json={"name": "Song", "key": "Bb minor"}).json()
+    assert project["key"] == "A#m"
+    base = f"/api/projects/{project['id']}"
+    assert client.put(base, json={"key": "f#"}).json()["key"] == "F#"
+    assert client.put(base, json={"key": ""}).json()["key"] is None
+
+
+def test_invalid_keys_are_rejected(client):
+    assert client.post("/api/projects", json={"name": "Song", "key": "H#"}).status_code == 422
+    project = client.post("/api/projects", json={"name": "Song", "key": "C"}).json()
+    base = f"/api/projects/{project['id']}"
+    assert client.put(base, json={"key": "H#"}).status_code == 422
+    assert client.put(base, json={"key": 5}).status_code == 422
+    assert client.get(base).json()["key"] == "C"
+
+
+def test_live_key_deltas_are_normalized(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    with client.websocket_connect(f"/api/projects/{project['id']}/live") as socket:
+        socket.receive_json()
+        socket.send_json({"type": "project", "field": "key", "value": "H#", "seq": 1})
+        assert socket.receive_json()["type"] == "error"
+        socket.send_json({"type": "project", "field": "key", "value": "Bb minor", "seq": 2})
+        assert socket.receive_json() == {"type": "ack", "seq": 2}
+    assert client.get(f"/api/projects/{project['id']}").json()["key"] == "A#m"
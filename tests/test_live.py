@@ -0,0 +1,198 @@
+import asyncio
+import copy
+
+import bson
+import pytest
+
+from tests.conftest import sine_wav, wav_payload
+from live import DeltaError, LiveSessions
+
+
+class FakeProjects:
+    """Just enough of ProjectStore for a session, encoding every update as MongoDB would"""
+
+    def __init__(self, project: dict):
+        self.project = project
+        self.updates = []
+
+    async def get(self, project_id):
+        return copy.deepcopy(self.project) if self.project and self.project["id"] == project_id else None
+
+    async def update_one(self, query, update, array_filters=None):
+        bson.encode(update)
+        # MongoDB rejects identifiers without a filter, and filters no path uses
+        identifiers = {part[2:-1] for path in update["$set"] for part in path.split(".") if part.startswith("$[")}
+        assert identifiers == {next(iter(f)).split(".")[0] for f in array_filters or []}
+        self.updates.append((update["$set"], array_filters))
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def send_json(self, message):
+        self.sent.append(message)
+
+
+def project():
+    return {"id": "p", "name": "Song", "tempo": 120, "key": "C", "tracks": [
+        {"id": "a", "name": "Lead", "volume": 1.0, "effects": [
+            {"id": "e1", "type": "Reverb", "parameters": {"Mix": 0.25}},
+            {"id": "e2", "type": "Custom", "parameters": {"Amount": 1.0}},
+            {"id": "e3", "type": "EQ", "parameters": [{"name": "Low", "value": 0.0}]},
+        ]},
+    ]}
+
+
+def sessions(projects, **kwargs):
+    import server
+
+    return LiveSessions(projects, track_model=server.TrackUpdate, project_model=server.ProjectUpdate,
+                        flush_interval=60, effect_parameters={"Reverb": ["Mix", "Room Size"], "EQ": ["Low"]},
+                        **kwargs)
+
+
+def test_effect_param_deltas_are_validated():
+    async def run():
+        live = sessions(FakeProjects(project()))
+        session = await live.join("p", FakeSocket())
+        live.apply(session, {"type": "effect_param", "track_id": "a", "effect_id": "e1",
+                             "param": "Room Size", "value": "0.8"})
+        live.apply(session, {"type": "effect_param", "track_id": "a", "effect_id": "e3", "param": "Low", "value": 2})
+        assert session.tracks["a"]["effects"][0]["parameters"] == {"Mix": 0.25, "Room Size": 0.8}
+        assert session.tracks["a"]["effects"][2]["parameters"] == [{"name": "Low", "value": 2.0}]
+        bad = [
+            {"effect_id": "e1", "param": None, "value": 1},
+            {"effect_id": "e1", "param": "Volume", "value": 1},
+            {"effect_id": "e1", "param": "Mix", "value": "nan"},
+            {"effect_id": "e2", "param": "Other", "value": 1},
+            {"effect_id": "e3", "param": "High", "value": 1},
+        ]
+        for delta in bad:
+            with pytest.raises(DeltaError):
+                live.apply(session, {"type": "effect_param", "track_id": "a", **delta})
+        # Unknown effect types keep the parameters they already have
+        live.apply(session, {"type": "effect_param", "track_id": "a", "effect_id": "e2", "param": "Amount", "value": 3})
+        assert session.tracks["a"]["effects"][1]["parameters"] == {"Amount": 3.0}
+    asyncio.run(run())
+
+
+def test_flush_coalesces_and_reports_written_fields():
+    async def run():
+        flushed = []
+
+        async def on_flush(project_id, fields, tracks):
+            flushed.append((project_id, fields, tracks))
+
+        projects = FakeProjects(project())
+        live = sessions(projects, on_flush=on_flush)
+        session = await live.join("p", FakeSocket())
+        for volume in (0.5, 0.6, 0.7):
+            live.apply(session, {"type": "track", "track_id": "a", "field": "volume", "value": volume})
+        live.apply(session, {"type": "project", "field": "name", "value": "Song 2"})
+        await live.flush(session)
+        fields, array_filters = projects.updates[0]
+        assert len(projects.updates) == 1
+        assert fields["tracks.$[t0].volume"] == 0.7 and fields["name"] == "Song 2"
+        assert array_filters == [{"t0.id": "a"}]
+        assert flushed[0][2] == {"a": {"volume": 0.7}}
+        assert not session.dirty
+        await live.flush(session)
+        assert len(projects.updates) == 1
+    asyncio.run(run())
+
+
+def test_unencodable_fields_are_dropped_not_retried():
+    async def run():
+        projects = FakeProjects(project())
+        live = sessions(projects)
+        session = await live.join("p", FakeSocket())
+        live.apply(session, {"type": "track", "track_id": "a", "field": "volume", "value": 0.5})
+        # Only a bug could get such a value into the state; it must not wedge the session
+        session.tracks["a"]["effects"][0]["parameters"][None] = 1.0
+        session.dirty_tracks["a"].add("effects")
+        await live.flush(session)
+        assert not session.dirty
+        assert "tracks.$[t0].volume" in projects.updates[-1][0]
+        assert "tracks.$[t0].effects" not in projects.updates[-1][0]
+        assert projects.updates[-1][1] == [{"t0.id": "a"}]
+        live.apply(session, {"type": "project", "field": "name", "value": "Song 2"})
+        await live.flush(session)
+        assert projects.updates[-1][1] is None and projects.updates[-1][0]["name"] == "Song 2"
+    asyncio.run(run())
+
+
+def test_refresh_merges_rest_writes_and_keeps_unflushed_edits():
+    async def run():
+        projects = FakeProjects(project())
+        live = sessions(projects)
+        socket = FakeSocket()
+        session = await live.join("p", socket)
+        live.apply(session, {"type": "track", "track_id": "a", "field": "volume", "value": 0.5})
+
+        projects.project["tracks"][0]["name"] = "Lead Vocal"
+        projects.project["tracks"].append({"id": "b", "name": "Bass", "volume": 1.0, "effects": []})
+        await live.refresh("p")
+        assert socket.sent[-1]["type"] == "state"
+        assert session.tracks["a"]["name"] == "Lead Vocal" and session.tracks["a"]["volume"] == 0.5
+        live.apply(session, {"type": "track", "track_id": "b", "field": "muted", "value": True})
+
+        projects.project["tracks"] = projects.project["tracks"][:1]
+        await live.refresh("p")
+        assert set(session.dirty_tracks) == {"a"}
+
+        projects.project = None
+        await live.refresh("p")
+        assert socket.sent[-1] == {"type": "deleted"} and "p" not in live.sessions
+    asyncio.run(run())
+
+
+def test_leave_flushes_before_the_session_is_dropped():
+    async def run():
+        projects = FakeProjects(project())
+        live = sessions(projects)
+        observed = []
+        update_one = projects.update_one
+
+        async def recording_update(*args, **kwargs):
+            observed.append("p" in live.sessions)
+            await update_one(*args, **kwargs)
+
+        projects.update_one = recording_update
+        socket = FakeSocket()
+        session = await live.join("p", socket)
+        live.apply(session, {"type": "track", "track_id": "a", "field": "volume", "value": 0.5})
+        await live.leave(session, socket)
+        assert observed == [True]
+        assert "p" not in live.sessions
+    asyncio.run(run())
+
+
+def test_session_sees_tracks_added_over_rest(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    with client.websocket_connect(f"/api/projects/{project['id']}/live") as socket:
+        assert socket.receive_json()["state"]["tracks"] == []
+        track = client.post(f"/api/projects/{project['id']}/tracks", json={
+            "name": "Lead", "duration": 1.0, "audio_data": wav_payload(sine_wav(0.2)),
+        }).json()
+        assert [t["id"] for t in socket.receive_json()["state"]["tracks"]] == [track["id"]]
+        socket.send_json({"type": "project", "field": "name", "value": "Song 2", "seq": 1})
+        assert socket.receive_json() == {"type": "ack", "seq": 1}
+    assert client.get(f"/api/projects/{project['id']}").json()["name"] == "Song 2"
+
+
+def test_live_tempo_changes_conform_tracks(client, app, monkeypatch):
+    conformed = []
+
+    async def conform_tracks(project):
+        conformed.append(project["tempo"])
+        return False
+    monkeypatch.setattr(app, "conform_tracks", conform_tracks)
+
+    project = client.post("/api/projects", json={"name": "Song", "tempo": 100}).json()
+    with client.websocket_connect(f"/api/projects/{project['id']}/live") as socket:
+        socket.receive_json()
+        socket.send_json({"type": "project", "field": "tempo", "value": 128, "seq": 1})
+        assert socket.receive_json() == {"type": "ack", "seq": 1}
+    assert conformed == [128]
+    assert client.get(f"/api/projects/{project['id']}").json()["tempo"] == 128
@@ -0,0 +1,36 @@
+import argparse
+import asyncio
+
+from benchmarks import load_test
+
+
+def test_small_run_reports_every_endpoint(app, monkeypatch):
+    monkeypatch.setattr(app, "client", app.client)
+    args = argparse.Namespace(projects=3, tracks=2, audio_seconds=0.1, sample_rate=8000,
+                              requests=60, concurrency=4, seed=1)
+    results, wall = asyncio.run(load_test.main_async(args))
+    assert wall > 0
+    assert set(load_test.WORKLOAD) | {"add_track"} >= set(results) >= {"create_project", "add_track"}
+    assert results["add_track"]["count"] == 6
+    for name, result in results.items():
+        assert result["errors"] == 0, name
+        assert result["p50_ms"] <= result["p95_ms"] <= result["p99_ms"]
+        assert result["throughput_rps"] > 0 and result["mean_response_bytes"] > 0
+
+
+def test_regressions_are_reported_against_the_baseline():
+    base = {"count": 10, "errors": 0, "p50_ms": 1.0, "p95_ms": 2.0, "p99_ms": 3.0,
+            "throughput_rps": 100.0, "mean_response_bytes": 1000.0}
+    baseline = {"get_project": base, "list_projects": base}
+    results = {
+        "get_project": {**base, "p95_ms": 3.5},
+        "list_projects": {**base, "mean_response_bytes": 1600.0, "errors": 1},
+    }
+    assert load_test.compare(results, baseline, tolerance=0.5, slack_ms=1.0) == [
+        "list_projects: mean response 1600 B > 1500 B",
+        "list_projects: 1 errors, baseline had 0",
+    ]
+    results["get_project"]["p95_ms"] = 4.5
+    assert load_test.compare(results, baseline, 0.5, 1.0)[0] == "get_project: p95 4.50 ms > 4.00 ms"
+    # Endpoints missing from either side are not compared
+    assert load_test.compare({}, baseline, 0.5, 1.0) == []
@@ -0,0 +1,117 @@
+import numpy as np
+import pytest
+
+import loudness
+from audio_io import decode_wav
+from tests.conftest import sine_wav, wav_payload
+
+
+def reference_steps(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Per-step power from the recursive K-weighting filters, one sample at a time"""
+    weighted = []
+    for channel in samples.T.astype(np.float64):
+        shelf, highpass = loudness._k_weighting(sample_rate)
+        weighted.append(highpass.process(shelf.process(channel[:, None]))[:, 0])
+    weighted = np.stack(weighted, axis=1)
+    step = int(round(loudness.STEP_SECONDS * sample_rate))
+    whole = len(weighted) // step * step
+    return (weighted[:whole] ** 2).reshape(-1, step, samples.shape[1]).mean(axis=1).sum(axis=1)
+
+
+def test_full_scale_sine_reads_as_bs1770_expects():
+    samples, sample_rate = decode_wav(sine_wav(5.0, frequency=1000, level=0.1, sample_rate=48000))
+    measured = loudness.analyze(samples, sample_rate)
+    assert measured["duration"] == 5.0
+    assert measured["peak_db"] == pytest.approx(-20.0, abs=0.01)
+    assert measured["rms_db"] == pytest.approx(-23.01, abs=0.01)
+    # A 1 kHz tone in both channels reads its level in LUFS
+    assert measured["integrated_lufs"] == pytest.approx(-20.0, abs=0.1)
+    assert measured["short_term_max_lufs"] == pytest.approx(measured["integrated_lufs"], abs=0.05)
+    assert measured["loudness_range"] == pytest.approx(0.0, abs=0.05)
+
+
+@pytest.mark.parametrize("sample_rate", [44100, 48000])
+def test_fft_filtering_matches_the_recursive_filters(monkeypatch, sample_rate):
+    rng = np.random.default_rng(3)
+    samples = (0.1 * rng.standard_normal((int(4.3 * sample_rate), 2))).astype(np.float32)
+    samples[sample_rate:2 * sample_rate] *= 4
+    steps = reference_steps(samples, sample_rate)
+    expected = loudness.integrated(loudness._windows(steps, loudness.MOMENTARY_STEPS))
+    expected_range = loudness.loudness_range(loudness._windows(steps, loudness.SHORT_TERM_STEPS))
+    # Several blocks, so the overlap-add tails are carried across block edges
+    monkeypatch.setattr(loudness, "BLOCK_STEPS", 7)
+    measured = loudness.analyze(samples, sample_rate)
+    assert measured["integrated_lufs"] == pytest.approx(expected, abs=0.01)
+    assert measured["loudness_range"] == pytest.approx(expected_range, abs=0.01)
+
+
+def test_silence_and_short_audio():
+    silent = loudness.analyze(np.zeros((48000, 2), np.float32), 48000)
+    assert silent["peak_db"] is None and silent["integrated_lufs"] is None
+    short = loudness.analyze(np.full((4800, 1), 0.5, np.float32), 48000)
+    assert short["duration"] == 0.1 and short["integrated_lufs"] is None and short["peak_db"] is not None
+    assert loudness.analyze(np.zeros((0, 2), np.float32), 48000)["duration"] == 0.0
+
+
+def test_normalize_gain_stops_at_full_scale():
+    assert loudness.normalize_gain({"integrated_lufs": -20.0, "peak_db": -12.0}, -14.0) == pytest.approx(10 ** (6 / 20))
+    assert loudness.normalize_gain({"integrated_lufs": -20.0, "peak_db": -3.0}, -14.0) == pytest.approx(
+        10 ** (3 / 20))
+    assert loudness.normalize_gain({"integrated_lufs": None, "peak_db": None}, -14.0) == 1.0
+
+
+def add_track(client, project_id, level, duration=9.0):
+    return client.post(f"/api/projects/{project_id}/tracks", json={
+        "name": f"Tone {level}", "duration": duration, "audio_data": wav_payload(sine_wav(2.0, 1000, level)),
+    }).json()
+
+
+def test_tracks_are_measured_at_ingest(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    track = add_track(client, project["id"], 0.1)
+    # The client-reported duration is replaced by the measured one
+    assert track["duration"] == 2.0
+    assert track["loudness"]["integrated_lufs"] == pytest.approx(-20.0, abs=0.1)
+
+    report = client.get(f"/api/projects/{project['id']}/loudness", params={"target_lufs": -23}).json()
+    assert report["target_lufs"] == -23
+    entry = report["tracks"][0]
+    assert entry["track_id"] == track["id"] and entry["loudness"] == track["loudness"]
+    assert entry["normalize_gain_db"] == pytest.approx(-3.0, abs=0.1)
+    assert client.get("/api/projects/missing/loudness").status_code == 404
+
+
+def test_tracks_stored_before_analysis_are_measured_once(client, app, monkeypatch):
+    import asyncio
+
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    track = add_track(client, project["id"], 0.1)
+    versions = client.get(f"/api/projects/{project['id']}/history").json()["items"]
+    asyncio.run(app.project_store.update_one(
+        {"id": project["id"]}, {"$set": {"tracks.$[t].loudness": None}}, array_filters=[{"t.id": track["id"]}],
+    ))
+    calls = []
+    analyze = loudness.analyze
+    monkeypatch.setattr(loudness, "analyze", lambda *args: calls.append(1) or analyze(*args))
+
+    for _ in range(2):
+        entry = client.get(f"/api/projects/{project['id']}/loudness").json()["tracks"][0]
+        assert entry["loudness"] == track["loudness"]
+    assert len(calls) == 1
+    assert client.get(f"/api/projects/{project['id']}").json()["tracks"][0]["loudness"] == track["loudness"]
+    # Loudness is derived, so filling it in is not a new version
+    assert client.get(f"/api/projects/{project['id']}/history").json()["items"] == versions
+
+
+def test_normalized_renders_level_tracks(client):
+    renders = []
+    for level in (0.05, 0.2):
+        project = client.post("/api/projects", json={"name": "Song"}).json()
+        add_track(client, project["id"], level)
+        plain = client.post(f"/api/projects/{project['id']}/render")
+        normalized = client.post(f"/api/projects/{project['id']}/render", params={"normalize_lufs": -20})
+        assert plain.status_code == normalized.status_code == 200
+        renders.append([decode_wav(r.content)[0] for r in (plain, normalized)])
+    rms = [[float(np.sqrt(np.mean(audio ** 2))) for audio in pair] for pair in renders]
+    assert rms[1][0] / rms[0][0] == pytest.approx(4.0, rel=0.01)
+    assert rms[1][1] / rms[0][1] == pytest.approx(1.0, rel=0.01)
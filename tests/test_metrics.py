@@ -0,0 +1,34 @@
+from types import SimpleNamespace
+
+import metrics
+
+
+def count(histogram, *labels):
+    series = histogram.series.get(labels)
+    return sum(series[0]) if series else 0
+
+
+def test_command_sizes_are_sampled(monkeypatch):
+    encoded = []
+    encode = metrics.bson.encode
+
+    def counting_encode(document):
+        encoded.append(document)
+        return encode(document)
+    monkeypatch.setattr(metrics.bson, "encode", counting_encode)
+
+    listener = metrics.MongoCommandListener(size_sample_every=10)
+    name = "sampledTestCommand"
+    for request_id in range(100):
+        command = SimpleNamespace(request_id=request_id, command_name=name, command={"find": "projects"})
+        reply = SimpleNamespace(request_id=request_id, command_name=name, reply={"ok": 1}, duration_micros=250)
+        listener.started(command)
+        listener.succeeded(reply)
+
+    assert count(metrics.mongo_duration, name, "success") == 100
+    assert count(metrics.mongo_command_bytes, name) == count(metrics.mongo_reply_bytes, name) == 10
+    assert len(encoded) == 20
+
+    listener = metrics.MongoCommandListener(size_sample_every=0)
+    listener.started(SimpleNamespace(request_id=0, command_name=name, command={"find": "projects"}))
+    assert len(encoded) == 20
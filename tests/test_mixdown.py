@@ -0,0 +1,61 @@
+import numpy as np
+
+from audio_io import decode_wav
+from mixer import audible_tracks, pan_gains
+from tests.conftest import sine_wav, wav_payload
+
+
+def test_mute_and_solo_pick_the_audible_tracks():
+    tracks = [{"id": "a"}, {"id": "b", "muted": True}, {"id": "c"}]
+    assert [t["id"] for t in audible_tracks(tracks)] == ["a", "c"]
+    tracks[2]["solo"] = True
+    assert [t["id"] for t in audible_tracks(tracks)] == ["c"]
+    # Mute wins over solo
+    tracks[2]["muted"] = True
+    assert audible_tracks(tracks) == []
+
+
+def test_pan_law_keeps_constant_power():
+    for pan in (-1.0, -0.3, 0.0, 0.5, 1.0):
+        left, right = pan_gains(pan)
+        assert abs(left ** 2 + right ** 2 - 1.0) < 1e-9
+    assert np.allclose(pan_gains(-1.0), (1.0, 0.0), atol=1e-12)
+    assert np.allclose(pan_gains(2.0), pan_gains(1.0))
+
+
+def render(client, project_id):
+    response = client.post(f"/api/projects/{project_id}/render")
+    assert response.status_code == 200 and response.headers["content-type"] == "audio/wav"
+    assert int(response.headers["Content-Length"]) == len(response.content)
+    samples, _ = decode_wav(response.content)
+    return samples
+
+
+def test_render_honors_volume_pan_mute_and_solo(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    base = f"/api/projects/{project['id']}"
+    tone, bass = (client.post(f"{base}/tracks", json={
+        "name": name, "duration": 1.0, "audio_data": wav_payload(sine_wav(seconds, frequency=frequency)),
+    }).json() for name, frequency, seconds in (("Tone", 440, 1.0), ("Bass", 110, 0.5)))
+    source, _ = decode_wav(sine_wav(1.0, frequency=440))
+
+    client.put(f"{base}/tracks/{bass['id']}", json={"muted": True})
+    client.put(f"{base}/tracks/{tone['id']}", json={"volume": 0.5, "pan": -1.0})
+    mixed = render(client, project["id"])
+    assert mixed.shape == (44100, 2)
+    assert np.abs(mixed[:, 0] - 0.5 * source[:, 0]).max() < 1e-3
+    assert np.abs(mixed[:, 1]).max() < 1e-3
+
+    # Soloing the shorter track plays only it, and the mix ends with it
+    client.put(f"{base}/tracks/{bass['id']}", json={"muted": False, "solo": True})
+    soloed = render(client, project["id"])
+    bass_source, _ = decode_wav(sine_wav(0.5, frequency=110))
+    left, right = pan_gains(0.0)
+    assert soloed.shape == (22050, 2)
+    assert np.abs(soloed[:, 0] - left * bass_source[:, 0]).max() < 1e-3
+
+
+def test_render_of_a_project_without_audio_is_an_empty_wav(client):
+    project = client.post("/api/projects", json={"name": "Empty"}).json()
+    assert render(client, project["id"]).shape == (0, 2)
+    assert client.post("/api/projects/missing/render").status_code == 404
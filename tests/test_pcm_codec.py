@@ -0,0 +1,76 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import pcm_codec
+from audio_io import encode_wav
+
+
+def wav(bits: int, frames: int = 3 * pcm_codec.BLOCK_FRAMES + 1234, channels: int = 2, seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    t = np.arange(frames) / 44100
+    tone = 0.5 * np.sin(2 * np.pi * 220 * t)[:, None] + 0.05 * rng.standard_normal((frames, channels))
+    # Full-scale extremes exercise the widest residuals
+    tone[:4] = [[1.0], [-1.0], [1.0], [-1.0]]
+    return encode_wav(np.clip(tone, -1, 1).astype(np.float32), 44100, bits)
+
+
+@pytest.mark.parametrize("bits,channels", [(16, 1), (16, 2), (24, 2)])
+def test_whole_file_round_trip_is_lossless(bits, channels):
+    original = wav(bits, channels=channels)
+    encoded = pcm_codec.encode_wav_file(original)
+    assert pcm_codec.is_encoded(encoded) and len(encoded) < len(original)
+    assert pcm_codec.decode_wav_file(encoded) == original
+
+
+def test_silence_and_empty_audio():
+    silent = encode_wav(np.zeros((5000, 2), np.float32), 48000)
+    assert pcm_codec.decode_wav_file(pcm_codec.encode_wav_file(silent)) == silent
+    empty = encode_wav(np.zeros((0, 2), np.float32), 48000)
+    assert pcm_codec.decode_wav_file(pcm_codec.encode_wav_file(empty)) == empty
+
+
+def test_unsupported_audio_is_not_encoded():
+    assert pcm_codec.encode_wav_file(b"not audio") is None
+    assert pcm_codec.encode_wav_file(encode_wav(np.zeros((10, 1), np.float32), 44100, 32)) is None
+
+
+def test_byte_ranges_match_the_wav_file():
+    original = wav(24, seed=1)
+    encoded = pcm_codec.encode_wav_file(original)
+    header = pcm_codec.parse_header(encoded)
+    fetches = []
+
+    async def fetch(start, end):
+        fetches.append((start, end))
+        return encoded[start:end]
+
+    async def run():
+        reader = await pcm_codec.EncodedReader.open(fetch, len(encoded))
+        assert reader.size == len(original)
+        rng = np.random.default_rng(2)
+        for _ in range(50):
+            start = int(rng.integers(0, len(original)))
+            end = int(rng.integers(start, len(original) + 100))
+            assert await reader.read(start, end) == original[start:end]
+        # Sequential windows straddle block edges
+        assert b"".join([part async for part in reader.iter_range(0, reader.size)]) == original
+
+        # A range inside one block fetches just that block's payload
+        reader = await pcm_codec.EncodedReader.open(fetch, len(encoded))
+        fetches.clear()
+        first = 44 + (pcm_codec.BLOCK_FRAMES + 10) * header.frame_size
+        await reader.read(first, first + 600)
+        assert fetches == [(header.payload_offset + int(header.offsets[1]),
+                            header.payload_offset + int(header.offsets[2]))]
+    asyncio.run(run())
+
+
+def test_truncated_blob_is_rejected():
+    encoded = pcm_codec.encode_wav_file(wav(16))
+
+    async def fetch(start, end):
+        return encoded[start:end]
+    with pytest.raises(ValueError):
+        asyncio.run(pcm_codec.EncodedReader.open(fetch, 20))
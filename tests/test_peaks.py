@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+
+import peaks
+from tests.conftest import sine_wav, wav_payload
+
+
+def test_pyramid_round_trip_and_query():
+    t = np.arange(44100) / 44100
+    samples = np.stack([0.5 * np.sin(2 * np.pi * 3 * t)] * 2, axis=1).astype(np.float32)
+    pyramid = peaks.deserialize(peaks.serialize(peaks.build_pyramid(samples, 44100)))
+    assert pyramid.frames == 44100 and len(pyramid.levels[-1]) == 1
+    result = peaks.query(pyramid, 0.0, 1.0, 100)
+    assert len(result["min"]) == len(result["max"]) == 100
+    assert max(result["max"]) == 0.5039 and min(result["min"]) == -0.5039
+
+
+def test_pyramid_cache_is_bounded_lru():
+    pyramid = peaks.build_pyramid(np.zeros((256 * 100, 1), np.float32), 44100)
+    cache = peaks.PyramidCache(pyramid.nbytes * 2)
+    for ref in "abc":
+        cache.put(ref, pyramid)
+    assert cache.get("a") is None and cache.get("b") is pyramid and cache.get("c") is pyramid
+    assert cache.bytes == 2 * pyramid.nbytes
+
+
+def test_peaks_are_read_once_per_pyramid(client, app, monkeypatch):
+    monkeypatch.setattr(app, "peak_cache", peaks.PyramidCache(1024 * 1024))
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    track = client.post(f"/api/projects/{project['id']}/tracks", json={
+        "name": "Lead", "duration": 1.0, "audio_data": wav_payload(sine_wav(2.0)),
+    }).json()
+    reads = []
+    read = app.audio_store.read
+
+    async def counting_read(ref, *args):
+        reads.append(ref)
+        return await read(ref, *args)
+    monkeypatch.setattr(app.audio_store, "read", counting_read)
+
+    url = f"/api/projects/{project['id']}/tracks/{track['id']}/peaks"
+    first = client.get(url, params={"pixels": 50}).json()
+    zoomed = client.get(url, params={"start": 0.5, "end": 1.0, "pixels": 50}).json()
+    assert reads == [track["peaks_ref"]]
+    assert len(first["max"]) == 50 and zoomed["start"] == 0.5
+    assert client.get(url, params={"start": 5.0}).status_code == 400
+
+
+def test_empty_ranges_are_rejected(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    track = client.post(f"/api/projects/{project['id']}/tracks", json={
+        "name": "Lead", "duration": 1.0, "audio_data": wav_payload(sine_wav(2.0)),
+    }).json()
+    url = f"/api/projects/{project['id']}/tracks/{track['id']}/peaks"
+    assert client.get(url, params={"start": 1.0, "end": 1.0}).status_code == 400
+    assert client.get(url, params={"start": 1.5, "end": 0.5}).status_code == 400
+    pyramid = peaks.build_pyramid(np.zeros((1000, 1), np.float32), 1000)
+    with pytest.raises(ValueError):
+        peaks.query(pyramid, 0.5, 0.5, 10)
@@ -0,0 +1,49 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from tests.conftest import sine_wav, wav_payload
+
+AUTOTUNE = [{"type": "Auto-Tune", "parameters": {"Correction": 100, "Speed": 50}}]
+
+
+def add_track(client, project_id):
+    return client.post(f"/api/projects/{project_id}/tracks", json={
+        "name": "Vocal", "duration": 1.0, "audio_data": wav_payload(sine_wav(0.5, frequency=450)),
+    }).json()
+
+
+def test_pitch_track_is_stored_on_first_autotune(client):
+    project = client.post("/api/projects", json={"name": "Song", "key": "A"}).json()
+    track = add_track(client, project["id"])
+    request = {"project_id": project["id"], "track_id": track["id"], "effects": AUTOTUNE}
+    assert client.post("/api/audio/process", json=request).status_code == 200
+    assert client.get(f"/api/projects/{project['id']}").json()["tracks"][0]["pitch_ref"]
+
+
+def test_pitch_track_of_replaced_audio_is_not_stored(client, app):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    track = add_track(client, project["id"])
+    # Detected from audio the track no longer has, e.g. before a tempo change re-stretched it
+    stale = {**track, "audio_ref": "replaced-since"}
+    asyncio.run(app.load_pitch_track(sine_wav(0.5), "hash", project["id"], stale))
+    assert client.get(f"/api/projects/{project['id']}").json()["tracks"][0]["pitch_ref"] is None
+
+
+@pytest.mark.parametrize("seconds", [0.3, 0.77, 1.51])
+@pytest.mark.parametrize("frequency", [157.0, 214.0, 450.0, 786.0, 843.0, 900.0])
+def test_shift_pitch_keeps_marks_inside_the_audio(frequency, seconds):
+    import pitch
+    from audio_io import decode_wav
+
+    samples, sample_rate = decode_wav(sine_wav(seconds, frequency=frequency))
+    track = pitch.detect_pitch(samples, sample_rate)
+    shifted = pitch.shift_pitch(samples, track, pitch.correction_curve(track, 100, 100, "A"))
+    assert shifted.shape == samples.shape and np.all(np.isfinite(shifted))
+
+
+def test_full_speed_autotune_processes(client):
+    request = {"audio_data": wav_payload(sine_wav(3.0, frequency=450)), "key": "A",
+               "effects": [{"type": "Auto-Tune", "parameters": {"Correction": 100, "Speed": 100}}]}
+    assert client.post("/api/audio/process", json=request).status_code == 200
@@ -0,0 +1,37 @@
+from tests.conftest import sine_wav, wav_payload
+
+
+def test_project_list_pages_newest_first_without_gaps(client):
+    created = [client.post("/api/projects", json={"name": f"Song {i}"}).json()["id"] for i in range(7)]
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/api/projects", params=params).json()
+        assert len(page["items"]) <= 3
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == created[::-1]
+
+
+def test_summaries_leave_out_tracks_unless_asked(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    for seconds in (0.5, 1.5):
+        client.post(f"/api/projects/{project['id']}/tracks", json={
+            "name": "Take", "duration": 9.0, "audio_data": wav_payload(sine_wav(seconds)),
+        })
+    summary = client.get("/api/projects").json()["items"][0]
+    assert summary["track_count"] == 2 and summary["total_duration"] == 1.5
+    assert summary["tracks"] is None
+
+    detailed = client.get("/api/projects", params={"fields": "tracks"}).json()["items"][0]
+    assert len(detailed["tracks"]) == 2
+    assert all(track.get("audio_data") is None and track["audio_ref"] for track in detailed["tracks"])
+
+
+def test_bad_list_parameters_are_rejected(client):
+    assert client.get("/api/projects", params={"fields": "audio_data"}).status_code == 400
+    assert client.get("/api/projects", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/projects", params={"limit": 0}).status_code == 422
+    assert client.get("/api/projects", params={"limit": 500}).status_code == 422
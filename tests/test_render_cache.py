@@ -0,0 +1,63 @@
+import os
+
+from render_cache import RenderCache, cache_key
+from tests.conftest import sine_wav, wav_payload
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = RenderCache(tmp_path, max_memory_bytes=250, max_disk_bytes=10_000)
+    for key in "abc":
+        cache.put(key, key.encode() * 100)
+    # Only two fit in memory; the oldest spilled to disk only
+    assert list(cache.memory) == ["b", "c"]
+    assert cache.get("b") == b"b" * 100
+    cache.put("d", b"d" * 100)
+    assert list(cache.memory) == ["b", "d"]
+    assert cache.get("a") == b"a" * 100
+    stats = cache.stats()
+    assert stats["memory_hits"] == 1 and stats["disk_hits"] == 1
+    assert stats["memory_bytes"] <= 250 and stats["disk_entries"] == 4
+    assert cache.get("missing") is None and cache.stats()["misses"] == 1
+
+
+def test_disk_tier_is_bounded_and_reloaded_in_recency_order(tmp_path):
+    cache = RenderCache(tmp_path, max_memory_bytes=0, max_disk_bytes=300)
+    for key in "abc":
+        cache.put(key, key.encode() * 100)
+        os.utime(tmp_path / key, (len(cache.disk), len(cache.disk)))
+    cache.put("d", b"d" * 100)
+    assert not (tmp_path / "a").exists() and cache.stats()["disk_evictions"] == 1
+    (tmp_path / ".d.partial.tmp").write_bytes(b"partial")
+
+    reopened = RenderCache(tmp_path, max_memory_bytes=0, max_disk_bytes=200)
+    # The oldest entry by mtime goes first, and stray temporaries are removed
+    assert list(reopened.disk) == ["c", "d"] and reopened.disk_bytes == 200
+    assert sorted(os.listdir(tmp_path)) == ["c", "d"]
+
+
+def test_shared_views_leave_indexing_to_the_owner(tmp_path):
+    owner = RenderCache(tmp_path, max_memory_bytes=1000, max_disk_bytes=1000)
+    worker = RenderCache(tmp_path, max_memory_bytes=1000, max_disk_bytes=1000, shared=True)
+    worker.put("k", b"x" * 10)
+    assert not owner.contains("k") and worker.written == [("k", 10)]
+    owner.adopt(worker.written)
+    assert owner.contains("k") and owner.get("k") == b"x" * 10
+
+
+def test_keys_ignore_bypassed_effects_and_parameter_order():
+    reverb = {"type": "Reverb", "parameters": {"Mix": 0.3, "Room Size": 0.5}}
+    reordered = {"type": "Reverb", "parameters": {"Room Size": 0.5, "Mix": 0.3}}
+    bypassed = {"type": "Delay", "enabled": False, "parameters": {"Time": 0.2}}
+    assert cache_key("h", [reverb], 44100) == cache_key("h", [reordered, bypassed], 44100)
+    assert cache_key("h", [reverb], 44100) != cache_key("h", [reverb], 48000)
+    assert cache_key("h", [reverb], 44100) != cache_key("h", [{**reverb, "parameters": {"Mix": 0.4}}], 44100)
+
+
+def test_repeated_processing_is_served_from_the_cache(client):
+    request = {"audio_data": wav_payload(sine_wav(0.5)),
+               "effects": [{"type": "Reverb", "parameters": {"Mix": 0.3}}]}
+    first = client.post("/api/audio/process", json=request).json()
+    second = client.post("/api/audio/process", json=request).json()
+    assert first == second
+    stats = client.get("/api/cache/stats").json()
+    assert stats["writes"] == 1 and stats["memory_hits"] == 1
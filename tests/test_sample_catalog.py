@@ -0,0 +1,92 @@
+import pytest
+
+from sample_catalog import SampleIndex, compatible_keys, normalize_key
+
+LIBRARY = [
+    {"id": "1", "name": "Dusty Kick 01", "category": "Drums", "bpm": None, "key": None,
+     "tags": ["kick", "Dusty"], "duration": 0.4},
+    {"id": "2", "name": "Warm Keys Loop", "category": "Keys", "bpm": 90, "key": "Am",
+     "tags": ["loop", "warm"], "duration": 8.0},
+    {"id": "3", "name": "Bright Keys Loop", "category": "Keys", "bpm": 120, "key": "C",
+     "tags": ["loop", "bright"], "duration": 4.0},
+    {"id": "4", "name": "Bass Groove", "category": "Bass", "bpm": 120, "key": "G",
+     "tags": ["loop"], "duration": 4.0},
+    {"id": "5", "name": "Keystone Pad", "category": "Keys", "bpm": 100, "key": "F#m",
+     "tags": ["pad", "warm"], "duration": 12.0},
+]
+
+
+def ids(result):
+    return [sample["id"] for sample in result[1]]
+
+
+@pytest.fixture(params=["build", "add"])
+def index(request):
+    index = SampleIndex()
+    if request.param == "build":
+        index.build(LIBRARY)
+    else:
+        # One at a time, as samples are created over the API
+        for sample in LIBRARY:
+            index.add(sample)
+    return index
+
+
+def test_keys_are_normalized_and_matched_harmonically():
+    assert normalize_key("Bb minor") == "A#m" and normalize_key(" f# ") == "F#"
+    assert compatible_keys("C") == ["C", "Am", "G", "F"]
+    assert compatible_keys("Am") == ["Am", "C", "Em", "Dm"]
+    with pytest.raises(ValueError):
+        normalize_key("H")
+
+
+def test_tags_are_case_insensitive_and_all_must_match(index):
+    assert ids(index.search(tags=["LOOP"])) == ["2", "3", "4"]
+    assert ids(index.search(tags=["loop", "warm"])) == ["2"]
+    assert ids(index.search(tags=["dusty"])) == ["1"]
+    assert index.search(tags=["loop", "missing"]) == (0, [])
+
+
+def test_ranges_include_their_bounds_and_skip_missing_values(index):
+    assert ids(index.search(bpm_min=100, bpm_max=120)) == ["3", "4", "5"]
+    assert ids(index.search(bpm_max=95)) == ["2"]
+    assert ids(index.search(duration_min=4.0, duration_max=8.0)) == ["2", "3", "4"]
+    assert ids(index.search(tags=["loop"], bpm_min=100, duration_max=4.0)) == ["3", "4"]
+
+
+def test_key_category_and_name_prefix_filters(index):
+    assert ids(index.search(key="a minor")) == ["2"]
+    assert ids(index.search(key="C", compatible=True)) == ["2", "3", "4"]
+    assert ids(index.search(category="Keys", query="key")) == ["2", "3", "5"]
+    assert ids(index.search(query="keys loop")) == ["2", "3"]
+    with pytest.raises(ValueError):
+        index.search(key="not a key")
+
+
+def test_pages_report_the_total(index):
+    assert index.search(limit=2, offset=1) == (5, LIBRARY[1:3])
+    total, page = index.search(tags=["loop"], limit=1, offset=2)
+    assert total == 3 and ids((total, page)) == ["4"]
+    assert index.get("3")["name"] == "Bright Keys Loop" and index.get("missing") is None
+
+
+def test_duplicate_ids_are_indexed_once():
+    index = SampleIndex()
+    index.build(LIBRARY)
+    index.add(LIBRARY[0])
+    assert len(index) == len(LIBRARY) and index.search(tags=["kick"])[0] == 1
+
+
+def test_search_endpoint(client, app, monkeypatch):
+    monkeypatch.setattr(app, "sample_index", SampleIndex())
+    for sample in LIBRARY:
+        fields = {k: v for k, v in sample.items() if k != "id" and v is not None}
+        assert client.post("/api/samples", json=fields).status_code == 200
+    page = client.get("/api/samples/search", params={"tags": "loop, warm", "key": "C", "compatible": True}).json()
+    assert page["total"] == 1 and page["items"][0]["name"] == "Warm Keys Loop"
+    found = client.get("/api/samples/search", params={"bpm_min": 110, "limit": 1}).json()
+    assert found["total"] == 2 and len(found["items"]) == 1
+    assert client.get(f"/api/samples/{found['items'][0]['id']}").json()["bpm"] == 120
+    assert client.get("/api/samples/missing").status_code == 404
+    assert client.get("/api/samples/search", params={"key": "H#"}).status_code == 400
+    assert client.post("/api/samples", json={"name": "Bad", "duration": 1, "key": "nope"}).status_code == 400
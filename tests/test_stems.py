@@ -0,0 +1,129 @@
+import asyncio
+
+import numpy as np
+
+from audio_io import encode_wav
+from mixer import HEADER_PROBE
+from render_cache import RenderCache
+from stems import SegmentedMixdown
+from tests.conftest import sine_wav, wav_payload
+
+SAMPLE_RATE = 8000
+REVERB = [{"id": "r", "type": "Reverb", "parameters": {"Mix": 0.5}}]
+
+
+def noise(seconds: float, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (0.2 * rng.standard_normal((int(seconds * SAMPLE_RATE), 2))).astype(np.float32)
+
+
+class Sources:
+    """Track audio by id, counting the bytes each mixdown reads"""
+
+    def __init__(self, audio: dict):
+        self.wavs = {track_id: encode_wav(samples, SAMPLE_RATE, 16) for track_id, samples in audio.items()}
+        self.bytes_read = 0
+
+    async def reader_for(self, track):
+        wav = self.wavs[track["id"]]
+
+        async def read(start, end):
+            self.bytes_read += min(end, len(wav)) - start
+            return wav[start:end]
+        return read, len(wav)
+
+
+def render(tracks, sources, cache, project_id="p"):
+    async def run():
+        mixdown = await SegmentedMixdown.open(project_id, tracks, sources.reader_for, cache)
+        dirty = mixdown.dirty_segments
+        return mixdown, dirty, b"".join([chunk async for chunk in mixdown.stream()])
+    return asyncio.run(run())
+
+
+def test_edits_re_render_only_dirty_segments(tmp_path):
+    cache = RenderCache(tmp_path / "cache", 64 * 1024 * 1024, 256 * 1024 * 1024)
+    sources = Sources({"fx": noise(10, 1), "dry": noise(9, 2)})
+    tracks = [
+        {"id": "fx", "audio_ref": "fx-audio", "effects": REVERB, "pan": -0.5},
+        {"id": "dry", "audio_ref": "dry-audio", "volume": 0.8},
+    ]
+    mixdown, dirty, first = render(tracks, sources, cache)
+    # Source audio is only hashed once it is streamed
+    assert dirty is None and mixdown.segments == 3
+
+    mixdown, dirty, again = render(tracks, sources, cache)
+    assert dirty == 0 and again == first
+
+    tracks[1] = {**tracks[1], "volume": 0.4}
+    mixdown, dirty, patched = render(tracks, sources, cache)
+    assert dirty == 3
+    scratch = RenderCache(tmp_path / "scratch", 64 * 1024 * 1024, 256 * 1024 * 1024)
+    _, _, expected = render(tracks, sources, scratch)
+    expected_pcm = np.frombuffer(expected[44:], "<i2").astype(int)
+    assert np.abs(np.frombuffer(patched[44:], "<i2").astype(int) - expected_pcm).max() <= 1
+
+    # Only processed stems are cached; dry tracks are read from their audio
+    fx, dry = mixdown.by_id["fx"], mixdown.by_id["dry"]
+    assert cache.contains(fx.keys[0]) and not cache.contains(dry.keys[0])
+
+
+def test_changed_audio_dirties_only_its_segments(tmp_path):
+    cache = RenderCache(tmp_path / "cache", 64 * 1024 * 1024, 256 * 1024 * 1024)
+    original, edited = noise(10, 3), noise(10, 3)
+    edited[9 * SAMPLE_RATE:] *= 0.5
+    tracks = [{"id": "t", "audio_ref": "a1"}]
+    render(tracks, Sources({"t": original}), cache)
+    render(tracks, Sources({"t": original}), cache)
+    writes = cache.counters["writes"]
+    _, dirty, _ = render([{"id": "t", "audio_ref": "a2"}], Sources({"t": edited}), cache)
+    assert dirty is None
+    # The new audio's segment hashes, the last mix segment and the plan
+    assert cache.counters["writes"] - writes == 3
+    _, dirty, _ = render([{"id": "t", "audio_ref": "a2"}], Sources({"t": edited}), cache)
+    assert dirty == 0
+
+
+def test_open_reads_only_headers(tmp_path):
+    cache = RenderCache(tmp_path / "cache", 64 * 1024 * 1024, 256 * 1024 * 1024)
+    sources = Sources({"a": noise(10, 4), "b": noise(10, 5)})
+    tracks = [{"id": "a", "audio_ref": "a", "effects": REVERB}, {"id": "b", "audio_ref": "b"}]
+    asyncio.run(SegmentedMixdown.open("p", tracks, sources.reader_for, cache))
+    assert sources.bytes_read <= 2 * HEADER_PROBE
+
+
+def test_render_endpoint_reports_dirty_segments(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    client.post(f"/api/projects/{project['id']}/tracks", json={
+        "name": "Lead", "duration": 1.0, "audio_data": wav_payload(sine_wav(5.0, sample_rate=SAMPLE_RATE)),
+    })
+    first = client.post(f"/api/projects/{project['id']}/render")
+    assert first.status_code == 200 and "X-Dirty-Segments" not in first.headers
+    second = client.post(f"/api/projects/{project['id']}/render")
+    assert second.headers["X-Segments"] == "2" and second.headers["X-Dirty-Segments"] == "0"
+    assert second.content == first.content
+
+
+def test_processing_and_cache_io_stay_off_the_event_loop(tmp_path, monkeypatch):
+    import dsp
+
+    def on_loop():
+        try:
+            asyncio.get_running_loop()
+            return True
+        except RuntimeError:
+            return False
+
+    calls = []
+    process, put, get = dsp.EffectChain.process, RenderCache.put, RenderCache.get
+    monkeypatch.setattr(dsp.EffectChain, "process", lambda self, block: calls.append(on_loop()) or process(self, block))
+    monkeypatch.setattr(RenderCache, "put", lambda self, *args: calls.append(on_loop()) or put(self, *args))
+    monkeypatch.setattr(RenderCache, "get", lambda self, *args: calls.append(on_loop()) or get(self, *args))
+
+    cache = RenderCache(tmp_path / "cache", 64 * 1024 * 1024, 256 * 1024 * 1024)
+    tracks = [{"id": "fx", "audio_ref": "fx", "effects": REVERB}, {"id": "dry", "audio_ref": "dry"}]
+    sources = Sources({"fx": noise(10, 6), "dry": noise(10, 7)})
+    render(tracks, sources, cache)
+    tracks[1] = {**tracks[1], "volume": 0.5}
+    render(tracks, sources, cache)
+    assert calls and not any(calls)
@@ -0,0 +1,104 @@
+import asyncio
+
+import pytest
+
+from storage import ProjectStore
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_indexes_are_created(memory_db):
+    async def go():
+        store = ProjectStore(memory_db)
+        await store.ensure_indexes()
+        await store.ensure_indexes()
+        return await memory_db.projects.index_information()
+    indexes = run(go())
+    assert indexes["id_1"]["unique"]
+    assert indexes["tracks.id_1"]["key"] == [("tracks.id", 1)]
+    assert indexes["updated_at_-1_id_-1"]["key"] == [("updated_at", -1), ("id", -1)]
+
+
+def test_reads_are_cached_without_inline_audio(memory_db):
+    async def go():
+        store = ProjectStore(memory_db)
+        await store.insert({"id": "p", "name": "Song", "tracks": [{"id": "t", "audio_data": "AAAA"}]})
+        first = await store.get("p")
+        first["name"] = "Changed by the caller"
+        second = await store.get("p")
+        return store, second
+    store, project = run(go())
+    assert project == {"id": "p", "name": "Song", "tracks": [{"id": "t"}]}
+    assert store.stats() == {"entries": 1, "hits": 1, "misses": 1}
+
+
+@pytest.mark.parametrize("write", [
+    lambda store: store.update_one({"id": "p"}, {"$set": {"name": "Song 2"}}),
+    lambda store: store.find_one_and_update({"id": "p"}, {"$set": {"name": "Song 2"}}),
+    lambda store: store.replace_one("p", {"id": "p", "name": "Song 2", "tracks": []}),
+])
+def test_writes_invalidate_the_cached_project(memory_db, write):
+    async def go():
+        store = ProjectStore(memory_db)
+        await store.insert({"id": "p", "name": "Song", "tracks": []})
+        await store.get("p")
+        await write(store)
+        return await store.get("p")
+    assert run(go())["name"] == "Song 2"
+
+
+def test_deleted_projects_are_not_served_from_cache(memory_db):
+    async def go():
+        store = ProjectStore(memory_db)
+        await store.insert({"id": "p", "name": "Song", "tracks": []})
+        await store.get("p")
+        await store.delete("p")
+        return await store.get("p")
+    assert run(go()) is None
+
+
+def test_cache_is_bounded_and_expires(memory_db):
+    async def go():
+        store = ProjectStore(memory_db, cache_size=2, cache_ttl=60)
+        for project_id in "abc":
+            await store.insert({"id": project_id, "tracks": []})
+            await store.get(project_id)
+        cached = list(store.cache)
+        expired = ProjectStore(memory_db, cache_ttl=0)
+        await expired.get("a")
+        await expired.get("a")
+        return cached, expired.stats()
+    cached, expired = run(go())
+    assert cached == ["b", "c"]
+    assert expired["hits"] == 0 and expired["misses"] == 2
+
+
+def test_a_read_racing_a_write_is_not_cached(memory_db):
+    async def go():
+        store = ProjectStore(memory_db)
+        await store.insert({"id": "p", "name": "Song", "tracks": []})
+        find_one = store.collection.find_one
+
+        async def slow_find_one(*args):
+            project = await find_one(*args)
+            # A write lands while the read is in flight
+            await store.update_one({"id": "p"}, {"$set": {"name": "Song 2"}})
+            return project
+        store.collection.find_one = slow_find_one
+        stale = await store.get("p")
+        store.collection.find_one = find_one
+        return stale, await store.get("p")
+    stale, fresh = run(go())
+    assert stale["name"] == "Song" and fresh["name"] == "Song 2"
+
+
+def test_api_writes_are_visible_on_the_next_read(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    base = f"/api/projects/{project['id']}"
+    assert client.get(base).json()["name"] == "Song"
+    client.put(base, json={"name": "Song 2"})
+    assert client.get(base).json()["name"] == "Song 2"
+    client.delete(base)
+    assert client.get(base).status_code == 404
@@ -0,0 +1,74 @@
+import base64
+
+import numpy as np
+import pytest
+
+from audio_io import decode_wav
+from stretch import tempo_ratio, time_stretch
+from tests.conftest import sine_wav, wav_payload
+
+
+def dominant_frequency(samples: np.ndarray, sample_rate: int) -> float:
+    mono = samples.mean(axis=1)
+    spectrum = np.abs(np.fft.rfft(mono * np.hanning(len(mono))))
+    return np.argmax(spectrum) * sample_rate / len(mono)
+
+
+@pytest.mark.parametrize("ratio", [0.5, 0.75, 1.333333, 2.0, 3.0])
+def test_stretch_changes_length_not_pitch(ratio):
+    samples, sample_rate = decode_wav(sine_wav(1.0, frequency=440))
+    stretched = time_stretch(samples, ratio)
+    assert stretched.shape == (int(round(len(samples) * ratio)), 2)
+    assert abs(dominant_frequency(stretched, sample_rate) - 440) < 5
+    # Partials stay coherent, so the level holds in the steady state
+    middle = stretched[len(stretched) // 4:-len(stretched) // 4]
+    assert np.sqrt(np.mean(middle ** 2)) == pytest.approx(0.3 / np.sqrt(2), rel=0.02)
+
+
+def test_unit_ratio_and_bad_input():
+    samples, _ = decode_wav(sine_wav(0.1))
+    copy = time_stretch(samples, 1.0)
+    assert np.array_equal(copy, samples) and copy is not samples
+    assert time_stretch(samples[:0], 2.0).shape == (0, 2)
+    with pytest.raises(ValueError):
+        time_stretch(samples, 0)
+    assert tempo_ratio(120, 90) == 1.333333 and tempo_ratio(90, 90) == 1.0
+    with pytest.raises(ValueError):
+        tempo_ratio(0, 90)
+
+
+def test_stretch_endpoint_caches_per_source_and_ratio(client):
+    request = {"audio_data": wav_payload(sine_wav(0.5)), "source_bpm": 120, "target_bpm": 90}
+    first = client.post("/api/audio/stretch", json=request).json()
+    assert first["ratio"] == 1.333333
+    samples, _ = decode_wav(base64.b64decode(first["stretched_audio"]))
+    assert len(samples) == int(round(22050 * 1.333333))
+    assert client.post("/api/audio/stretch", json=request).json() == first
+    stats = client.get("/api/cache/stats").json()
+    assert stats["writes"] == 1 and stats["memory_hits"] == 1
+    assert client.post("/api/audio/stretch", json={"audio_data": request["audio_data"]}).status_code == 400
+
+
+def test_samples_follow_the_project_tempo(client, app, monkeypatch):
+    from sample_catalog import SampleIndex
+
+    monkeypatch.setattr(app, "sample_index", SampleIndex())
+    sample = client.post("/api/samples", json={
+        "name": "Loop", "duration": 1.0, "bpm": 120, "audio_data": wav_payload(sine_wav(1.0)),
+    }).json()
+    project = client.post("/api/projects", json={"name": "Song", "tempo": 90}).json()
+    base = f"/api/projects/{project['id']}"
+    track = client.post(f"{base}/tracks/sample", json={"sample_id": sample["id"]}).json()
+    assert track["stretch_ratio"] == 1.333333 and track["duration"] == pytest.approx(1.333333, abs=1e-3)
+    kept = client.post(f"{base}/tracks/sample", json={"sample_id": sample["id"], "conform_tempo": False}).json()
+    assert kept["duration"] == 1.0 and not kept.get("source_ref")
+
+    # A tempo change re-stretches conformed tracks from their source
+    client.put(base, json={"tempo": 60})
+    tracks = {t["id"]: t for t in client.get(base).json()["tracks"]}
+    assert tracks[track["id"]]["stretch_ratio"] == 2.0
+    assert tracks[track["id"]]["duration"] == pytest.approx(2.0, abs=1e-3)
+    assert tracks[track["id"]]["audio_ref"] != track["audio_ref"]
+    assert tracks[kept["id"]]["audio_ref"] == kept["audio_ref"]
+    audio = client.get(f"{base}/tracks/{track['id']}/audio").content
+    assert len(decode_wav(audio)[0]) == 88200
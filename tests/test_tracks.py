@@ -0,0 +1,62 @@
+from tests.conftest import sine_wav, wav_payload
+
+
+def add_tracks(client, base, *names):
+    return [client.post(f"{base}/tracks", json={
+        "name": name, "duration": 1.0, "audio_data": wav_payload(sine_wav(0.2)),
+    }).json() for name in names]
+
+
+def test_batch_update_applies_every_change_in_one_version(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    base = f"/api/projects/{project['id']}"
+    lead, bass, drums = add_tracks(client, base, "Lead", "Bass", "Drums")
+
+    response = client.patch(f"{base}/tracks", json=[
+        {"id": lead["id"], "volume": 0.5, "pan": -0.25},
+        {"id": bass["id"], "muted": True},
+        {"id": lead["id"], "solo": True},
+    ])
+    assert response.status_code == 200
+    # One entry per named track, without inline audio
+    returned = response.json()
+    assert [t["id"] for t in returned] == [lead["id"], bass["id"]]
+    assert returned[0]["volume"] == 0.5 and returned[0]["pan"] == -0.25 and returned[0]["solo"] is True
+
+    stored = {t["id"]: t for t in client.get(base).json()["tracks"]}
+    assert stored[lead["id"]]["volume"] == 0.5 and stored[lead["id"]]["solo"] is True
+    assert stored[bass["id"]]["muted"] is True and stored[bass["id"]]["volume"] == 1.0
+    assert stored[drums["id"]] == {**drums, "created_at": stored[drums["id"]]["created_at"]}
+
+    history = client.get(f"{base}/history").json()["items"]
+    assert history[0]["summary"] == "Update 3 tracks"
+    assert client.get(f"{base}/history/{history[0]['version']}").json()["tracks"][1]["muted"] is True
+
+
+def test_batch_update_naming_a_missing_track_changes_nothing(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    base = f"/api/projects/{project['id']}"
+    lead, = add_tracks(client, base, "Lead")
+
+    response = client.patch(f"{base}/tracks", json=[
+        {"id": lead["id"], "volume": 0.1},
+        {"id": "missing", "muted": True},
+    ])
+    assert response.status_code == 404
+    assert "missing" in response.json()["detail"]
+    assert client.get(base).json()["tracks"][0]["volume"] == 1.0
+    assert len(client.get(f"{base}/history").json()["items"]) == 2
+
+    assert client.patch(f"{base}/tracks", json=[{"id": lead["id"], "volume": 0.1}]).status_code == 200
+    assert client.get(base).json()["tracks"][0]["volume"] == 0.1
+    assert client.patch("/api/projects/missing/tracks", json=[{"id": lead["id"]}]).status_code == 404
+    assert client.patch(f"{base}/tracks", json=[]).status_code == 400
+
+
+def test_single_track_update_returns_only_that_track(client):
+    project = client.post("/api/projects", json={"name": "Song"}).json()
+    base = f"/api/projects/{project['id']}"
+    lead, bass = add_tracks(client, base, "Lead", "Bass")
+    response = client.put(f"{base}/tracks/{bass['id']}", json={"pan": 0.75})
+    assert response.status_code == 200 and response.json()["id"] == bass["id"] and response.json()["pan"] == 0.75
+    assert client.put(f"{base}/tracks/missing", json={"pan": 0.75}).status_code == 404